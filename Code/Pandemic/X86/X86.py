@@ -306,16 +306,28 @@ class X86DecodedInstruction(object):
 		control flow it exhibits (passes control to the next instruction, returns,
 		conditional jump, etc).  For a complete listing of flow types, see the 
 		:mod:`ASMFlow` module."""
-		mnem = self.instr.mnem
 		op0 = self.instr.GetOp(0)
-		next_addr = self.ea + self.length
 		if op0 != None and isinstance(op0,JccTarget):
+			return self.CreateFlowFrom(self.instr.mnem,op0._taken.value,op0._nottaken.value)
+		return self.CreateFlowFrom(self.instr.mnem,None,None)
+
+	def CreateFlowFrom(self,mnem,taken,nottaken):
+		"""The logic behind :meth:`CreateFlow`, given the mnemonic and, if the 
+		first operand is a :class:`JccTarget`, its two destinations.
+		
+		:param `.MnemElt` mnem:
+		:param integer taken: the branch target, or ``None``
+		:param integer nottaken: the fall-through address, or ``None``
+		:rtype: :class:`.FlowType`
+		"""
+		next_addr = self.ea + self.length
+		if taken != None:
 			if mnem == Call:
-				return FlowCallDirect(op0._taken.value,next_addr)
+				return FlowCallDirect(taken,next_addr)
 			if mnem == Jmp:
-				return FlowJmpUnconditional(op0._taken.value,next_addr)
+				return FlowJmpUnconditional(taken,next_addr)
 			if mnem in [Jo,Jno,Jb,Jae,Jz,Jnz,Jbe,Ja,Js,Jns,Jp,Jnp,Jl,Jge,Jle,Jg,Loopnz,Loopz,Loop,Jcxz,Jecxz]:
-				return FlowJmpConditional(op0._taken.value,op0._nottaken.value)
+				return FlowJmpConditional(taken,nottaken)
 			else:
 				print "CreateFlow:  JccTarget with invalid mnenonic %s" % MnemToString[mnem]
 				raise ValueError
@@ -324,12 +336,36 @@ class X86DecodedInstruction(object):
 		elif mnem in [Ret,Retf,Iretd,Iretw]: return FlowReturn()
 		else: return FlowOrdinary(next_addr)
 
+	@property
+	def mnem(self):
+		"""The instruction's mnemonic.
+		
+		:rtype: :class:`~.MnemElt`
+		"""
+		return self.instr.mnem
+
 	def __init__(self,ea,instr,length,flow=None):
 		self.ea = ea
 		self.instr = instr
 		self.length = length
 		self.flow = flow if flow != None else self.CreateFlow()
 
+class X86DecodedData(object):
+	"""A marker for a byte that did not decode to an instruction, produced by
+	linear sweeps that are asked to report such bytes rather than skip them.
+	
+	:ivar integer ea: the byte's address
+	:ivar integer byte: the byte itself
+	:ivar integer length: always ``1``
+	:ivar `.FlowType` flow: always passes control to the next byte
+	"""
+	def __init__(self,ea,byte):
+		self.ea = ea
+		self.byte = byte
+		self.length = 1
+		self.instr = None
+		self.flow = FlowOrdinary(ea+1)
+
 #if __name__=="__main__":
 #	i = Instruction([],Add,Gb(Al),Gb(Cl))
 #	print "%s" % i
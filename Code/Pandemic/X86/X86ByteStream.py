@@ -1,9 +1,19 @@
 """Byte stream interface.  To support any form of input, derive a class from 
-:class:`StreamObj` and override :meth:`GetByteInternal`.
+:class:`StreamObj` and override :meth:`~StreamObj.GetByteAt`.  Classes that 
+instead override :meth:`~StreamObj.GetByteInternal`, reading the byte at the 
+current position (for example, through IDA's ``get_byte``), continue to work: 
+every read is then routed through their override.
 """
 
+import bisect, mmap, struct, threading
+from collections import OrderedDict
 from X86 import InvalidInstruction
 
+#: Unpacks a little-endian word.
+unpack_word = struct.Struct("<H").unpack_from
+#: Unpacks a little-endian dword.
+unpack_dword = struct.Struct("<I").unpack_from
+
 class StreamObj(object):
 	"""Class for acquiring bytes from a source."""	
 	def __init__(self,bytes):
@@ -11,18 +21,41 @@ class StreamObj(object):
 		self.Init()
 	
 	def Init(self):
-		"""Initializes position variables."""
+		"""Initializes position variables, and notes whether a derived class 
+		overrides :meth:`GetByteInternal`."""
 		self.pos = 0
 		self.origpos = 0
+		self.internal = type(self).GetByteInternal.im_func is not StreamObj.GetByteInternal.im_func
+
+	def GetByteAt(self,ea):
+		"""Return the byte at address *ea*, without regard to the current 
+		position.  This function shall be the only one needed to override in 
+		derived classes, when changing the source from which bytes are read.  
+		If a derived class overrides :meth:`GetByteInternal` instead, the byte 
+		is read by moving the position to *ea* and calling it; such streams 
+		therefore must not be shared between threads.
+		
+		:param integer ea:
+		:rtype: 8-bit integer
+		:raises: :exc:`IndexError` if *ea* lies outside of the stream.
+		"""
+		if self.internal:
+			pos = self.pos
+			self.pos = ea
+			try:
+				return self.GetByteInternal()
+			finally:
+				self.pos = pos
+		return self.bytes[ea]
 
 	def GetByteInternal(self):
-		"""Consume a byte from the stream and return it.  This function shall be
-		the only one needed to override in derived classes, when changing the 
-		source from which a byte is consumed.
+		"""Return the byte at the current position, via :meth:`GetByteAt`.  
+		Derived classes written before :meth:`GetByteAt` existed override this
+		method instead.
 		
 		:rtype: 8-bit integer
 		"""
-		return self.bytes[self.pos]
+		return self.GetByteAt(self.pos)
 	
 	def Byte(self):
 		"""Check to ensure that we have not consumed more than 16 bytes (for that
@@ -76,4 +109,445 @@ class StreamObj(object):
 		:param integer ea:
 		"""
 		self.pos,self.origpos = ea,ea
+
+	def Window(self,n):
+		"""Return up to *n* bytes beginning at the current position, without 
+		consuming them; see :meth:`WindowAt`.
+		
+		:param integer n:
+		:rtype: integer list
+		"""
+		return self.WindowAt(self.pos,n)
+
+	def WindowAt(self,ea,n):
+		"""Return up to *n* bytes beginning at address *ea*.  Fewer than *n* 
+		bytes are returned if the stream ends first.  Neither the position nor 
+		any other variable of the stream is modified, so several threads may 
+		read through one stream at once.  Derived classes with faster access to
+		their bytes may override this method.
+		
+		:param integer ea:
+		:param integer n:
+		:rtype: integer list
+		"""
+		w = []
+		try:
+			for i in xrange(ea,ea+n):
+				w.append(self.GetByteAt(i))
+		except IndexError:
+			pass
+		return w
+
+class RebasedStreamObj(StreamObj):
+	"""A :class:`StreamObj` whose first byte lies at address *base*, rather 
+	than at ``0``.
+	
+	:ivar integer base: the address of ``bytes[0]``
+	"""
+	def __init__(self,bytes,base):
+		self.base = base
+		StreamObj.__init__(self,bytes)
+	
+	def GetByteAt(self,ea):
+		"""Return the byte at address *ea*.
+		
+		:param integer ea:
+		:rtype: 8-bit integer
+		"""
+		i = ea - self.base
+		if i < 0: raise IndexError()
+		return self.bytes[i]
+
+class WritableStreamObj(StreamObj):
+	"""A :class:`StreamObj` whose bytes, which must be held in a list, may be 
+	overwritten through :meth:`Write`.  Objects that hold information derived 
+	from the bytes (such as :class:`~.X86DecodeCache.X86AddressCache`) register
+	through :meth:`AddListener` to be told about each write.
+	
+	:ivar listeners: the objects to notify of writes
+	:ivar integer writes: the number of writes so far, by which readers that 
+		hold copies of the bytes (such as 
+		:meth:`~.X86Decoder.X86Decoder.DecodeRange`) notice that they are stale
+	"""
+	def __init__(self,bytes):
+		StreamObj.__init__(self,bytes)
+		self.listeners = []
+		self.writes = 0
+	
+	def AddListener(self,listener):
+		"""Register *listener*, whose ``Invalidate(start,end)`` method shall be
+		called after every write, with the written range of addresses.
+		
+		:param listener:
+		"""
+		self.listeners.append(listener)
+	
+	def Write(self,ea,bytes):
+		"""Overwrite the bytes beginning at address *ea* with *bytes*, and notify
+		the listeners.  The stream's position is unaffected.
+		
+		:param integer ea:
+		:param bytes: the new bytes
+		:type bytes: integer list
+		:raises: :exc:`IndexError` if the write would extend past the stream.
+		"""
+		if ea < 0 or ea+len(bytes) > len(self.bytes): raise IndexError()
+		self.bytes[ea:ea+len(bytes)] = bytes
+		self.writes = self.writes + 1
+		for l in self.listeners: l.Invalidate(ea,ea+len(bytes))
+
+class BufferStreamObj(StreamObj):
+	"""A :class:`StreamObj` whose bytes are held in any object that supports 
+	the buffer protocol, such as a string, a :class:`bytearray`, a 
+	:class:`buffer`, or a :class:`memoryview`, rather than in a list.  The 
+	object is not copied.  :meth:`Word` and :meth:`Dword` read their bytes at 
+	once through :mod:`struct`, checking the 16-byte limit once per read rather
+	than once per byte, and :meth:`WindowAt` slices the object rather than 
+	reading it a byte at a time.  As in :class:`RebasedStreamObj`, the first 
+	byte lies at address *base*.
+	
+	:ivar bytes: the object holding the bytes
+	:ivar integer base: the address of ``bytes[0]``
+	"""
+	def __init__(self,bytes,base=0):
+		self.base = base
+		StreamObj.__init__(self,bytes)
+		# Only a bytearray yields integers when indexed.
+		self.ordinal = not isinstance(bytes,bytearray)
+	
+	def GetByteAt(self,ea):
+		"""Return the byte at address *ea*.
 		
+		:param integer ea:
+		:rtype: 8-bit integer
+		:raises: :exc:`IndexError` if *ea* lies outside of the stream.
+		"""
+		i = ea - self.base
+		if i < 0: raise IndexError()
+		b = self.bytes[i]
+		return ord(b) if self.ordinal else b
+	
+	def Byte(self):
+		"""As :meth:`StreamObj.Byte`, without the indirection through 
+		:meth:`GetByteInternal`.
+		
+		:rtype: 8-bit integer
+		"""
+		pos = self.pos
+		if pos-self.origpos >= 16:
+			raise InvalidInstruction()
+		b = self.GetByteAt(pos)
+		self.pos = pos + 1
+		return b
+	
+	def Read(self,n,unpack):
+		"""Consume *n* bytes from the stream and return them as unpacked by 
+		*unpack*, after checking the 16-byte limit and the end of the stream 
+		once.
+		
+		:param integer n:
+		:param unpack: a :func:`struct.unpack_from`-like function reading *n* 
+			bytes
+		:rtype: integer
+		:raises: :exc:`.InvalidInstruction` if the read would consume more than
+			16 bytes since the last call to :meth:`SetPos`, or :exc:`IndexError` 
+			if the stream ends first.
+		"""
+		pos = self.pos
+		if pos-self.origpos > 16-n:
+			raise InvalidInstruction()
+		i = pos - self.base
+		if i < 0 or i+n > len(self.bytes):
+			raise IndexError()
+		self.pos = pos + n
+		return unpack(self.bytes,i)[0]
+	
+	def Word(self):
+		"""Consume a word from the stream and return it, via :meth:`Read`.
+		
+		:rtype: 16-bit integer
+		"""
+		return self.Read(2,unpack_word)
+	
+	def Dword(self):
+		"""Consume a dword from the stream and return it, via :meth:`Read`.
+		
+		:rtype: 32-bit integer
+		"""
+		return self.Read(4,unpack_dword)
+	
+	def WindowAt(self,ea,n):
+		"""Return up to *n* bytes beginning at address *ea*, by slicing the 
+		underlying object.
+		
+		:param integer ea:
+		:param integer n:
+		:rtype: integer list
+		"""
+		i = ea - self.base
+		if i < 0: return []
+		return list(bytearray(self.bytes[i:i+n]))
+
+class MmapStreamObj(BufferStreamObj):
+	"""A :class:`BufferStreamObj` reading from a read-only memory mapping of 
+	the file *path*, so that images and memory dumps are decoded in place, 
+	without being read into memory first.  The operating system reads each 
+	page upon its first access, so opening even a very large file costs 
+	little.  The file's first mapped byte lies at address *base*, so that 
+	:meth:`~StreamObj.SetPos` accepts virtual addresses.
+	
+	:param string path: the file to map
+	:param integer base: the address of the first mapped byte
+	:param integer offset: the offset within the file of the first mapped byte,
+		which must be a multiple of :data:`mmap.ALLOCATIONGRANULARITY`
+	:param integer length: the number of bytes to map, or ``0`` to map the 
+		rest of the file
+	:raises: :exc:`ValueError` if the file is empty.
+	"""
+	def __init__(self,path,base=0,offset=0,length=0):
+		with open(path,"rb") as f:
+			m = mmap.mmap(f.fileno(),length,access=mmap.ACCESS_READ,offset=offset)
+		BufferStreamObj.__init__(self,m,base)
+	
+	def Close(self):
+		"""Unmap the file.  The stream must not be read afterwards."""
+		self.bytes.close()
+
+class SegmentedStreamObj(StreamObj):
+	"""A :class:`StreamObj` made of several regions, each a 
+	:class:`BufferStreamObj` holding the bytes at some range of addresses, 
+	such as the sections of an image.  Addresses outside of every region are 
+	read as though the stream had ended there, so decoding them fails cleanly
+	with :data:`~.DECODE_END_OF_STREAM` (or :exc:`IndexError`).  The region 
+	holding an address is found by bisection, and the most recently used 
+	region is remembered, since consecutive reads almost always fall within 
+	the same one.  Reads may span regions that abut one another.
+	
+	:param regions: ``(base, bytes)`` pairs, where *bytes* is anything 
+		accepted by :class:`BufferStreamObj`, or a list (which is copied into
+		a :class:`bytearray`)
+	:ivar starts: the base address of each region, in ascending order
+	:ivar regions: the :class:`BufferStreamObj` for each region, in the same 
+		order
+	"""
+	def __init__(self,regions=()):
+		StreamObj.__init__(self,None)
+		self.starts,self.ends,self.regions = [],[],[]
+		self.current = (0,0,None)
+		for base,bytes in regions: self.AddRegion(base,bytes)
+	
+	def AddRegion(self,base,bytes):
+		"""Add a region holding *bytes* at the address *base*.
+		
+		:param integer base:
+		:param bytes: see the class description
+		:raises: :exc:`ValueError` if the region overlaps an existing one.
+		"""
+		if isinstance(bytes,list): bytes = bytearray(bytes)
+		end = base + len(bytes)
+		i = bisect.bisect_right(self.starts,base)
+		if i > 0 and self.ends[i-1] > base or i < len(self.starts) and self.starts[i] < end:
+			raise ValueError("region 0x%x-0x%x overlaps another" % (base,end))
+		self.starts.insert(i,base)
+		self.ends.insert(i,end)
+		self.regions.insert(i,BufferStreamObj(bytes,base))
+		self.current = (0,0,None)
+	
+	def Region(self,ea):
+		"""Return the region holding the address *ea*, or ``None``.
+		
+		:param integer ea:
+		:rtype: (integer, integer, :class:`BufferStreamObj`)
+		:returns: The region's first address, the address after its last, and 
+			its stream.
+		"""
+		# The cache is one tuple, replaced whole, so that concurrent readers see
+		# either the old region or the new one.
+		current = self.current
+		if current[0] <= ea < current[1]: return current
+		i = bisect.bisect_right(self.starts,ea) - 1
+		if i < 0 or ea >= self.ends[i]: return None
+		self.current = current = (self.starts[i],self.ends[i],self.regions[i])
+		return current
+	
+	def GetByteAt(self,ea):
+		"""Return the byte at address *ea*.
+		
+		:param integer ea:
+		:rtype: 8-bit integer
+		:raises: :exc:`IndexError` if *ea* lies outside of every region.
+		"""
+		r = self.Region(ea)
+		if r is None: raise IndexError()
+		return r[2].GetByteAt(ea)
+	
+	def Read(self,n,unpack):
+		"""As :meth:`BufferStreamObj.Read`, reading from the region that holds 
+		the current position.  A read that spans regions is assembled from 
+		:meth:`WindowAt`.
+		"""
+		pos = self.pos
+		if pos-self.origpos > 16-n:
+			raise InvalidInstruction()
+		r = self.Region(pos)
+		if r is None: raise IndexError()
+		start,end,region = r
+		if pos+n <= end:
+			x = unpack(region.bytes,pos-start)[0]
+		else:
+			w = self.WindowAt(pos,n)
+			if len(w) < n: raise IndexError()
+			x = unpack(str(bytearray(w)))[0]
+		self.pos = pos + n
+		return x
+	
+	def Word(self):
+		"""Consume a word from the stream and return it, via :meth:`Read`.
+		
+		:rtype: 16-bit integer
+		"""
+		return self.Read(2,unpack_word)
+	
+	def Dword(self):
+		"""Consume a dword from the stream and return it, via :meth:`Read`.
+		
+		:rtype: 32-bit integer
+		"""
+		return self.Read(4,unpack_dword)
+	
+	def WindowAt(self,ea,n):
+		"""Return up to *n* bytes beginning at address *ea*, continuing into the
+		following regions while they abut.
+		
+		:param integer ea:
+		:param integer n:
+		:rtype: integer list
+		"""
+		w = []
+		while len(w) < n:
+			r = self.Region(ea)
+			if r is None: break
+			part = r[2].WindowAt(ea,n-len(w))
+			w.extend(part)
+			ea = ea + len(part)
+		return w
+
+class BlockCachedStreamObj(StreamObj):
+	"""A :class:`StreamObj` for slow byte sources, such as a debugger or IDA,
+	which reads aligned blocks of *blocksize* bytes through the callback 
+	*read*, rather than single bytes, and keeps the *size* most recently used 
+	blocks.  A linear sweep therefore calls *read* once per block rather than 
+	once per byte.  If *readahead* is nonzero, a miss on the block that 
+	follows the previous miss is taken to be part of a sequential scan, and 
+	the next *readahead* blocks are fetched by the same call.
+	
+	``read(ea, n)`` must return up to *n* bytes beginning at *ea*, as a list 
+	of integers or as anything accepted by :class:`BufferStreamObj`.  Fewer 
+	bytes are returned where the source ends or cannot be read; the missing 
+	bytes are read as though the stream had ended there.
+	
+	:ivar read: the callback
+	:ivar integer blocksize: the size of each block
+	:ivar integer size: the maximum number of blocks kept; it may be changed 
+		at any time, taking effect upon the next miss
+	:ivar integer readahead: the number of blocks read ahead
+	:ivar integer hits: the number of block lookups satisfied by the cache
+	:ivar integer misses: the number of block lookups that called *read*
+	:ivar integer ahead: the number of blocks read ahead
+	:ivar blocks: an :class:`~collections.OrderedDict` mapping block numbers 
+		to :class:`bytearray` objects, least recently used first
+	:ivar lock: the :class:`threading.Lock` that serializes access to 
+		:attr:`blocks`
+	"""
+	def __init__(self,read,blocksize=4096,size=256,readahead=0):
+		StreamObj.__init__(self,None)
+		self.read = read
+		self.blocksize = blocksize
+		self.size = size
+		self.readahead = readahead
+		self.blocks = OrderedDict()
+		self.lock = threading.Lock()
+		self.Clear()
+	
+	def Clear(self):
+		"""Discard every block and reset the counters."""
+		with self.lock:
+			self.blocks.clear()
+			self.hits = 0
+			self.misses = 0
+			self.ahead = 0
+			self.lastmiss = None
+	
+	def Invalidate(self,start,end):
+		"""Discard the blocks holding any of the addresses from *start* to *end*
+		(exclusive), after the source's bytes there have changed.
+		
+		:param integer start:
+		:param integer end:
+		"""
+		with self.lock:
+			for k in xrange(start // self.blocksize,(end-1) // self.blocksize + 1):
+				self.blocks.pop(k,None)
+	
+	def Block(self,k):
+		"""Return the bytes of block number *k*, reading it (and the blocks 
+		read ahead of it) upon a miss.
+		
+		:param integer k:
+		:rtype: :class:`bytearray`
+		"""
+		with self.lock:
+			blocks = self.blocks
+			b = blocks.pop(k,None)
+			if b is not None:
+				self.hits = self.hits + 1
+				blocks[k] = b
+				return b
+			self.misses = self.misses + 1
+			n = 1
+			if self.readahead and self.lastmiss == k-1: n = n + self.readahead
+			self.lastmiss = k+n-1
+			
+			bs = self.blocksize
+			data = self.read(k*bs,n*bs)
+			if not isinstance(data,bytearray): data = bytearray(data)
+			for j in xrange(n):
+				while len(blocks) >= self.size and blocks:
+					blocks.popitem(False)
+				if self.size > 0:
+					blocks[k+j] = data[j*bs:(j+1)*bs]
+				if j: self.ahead = self.ahead + 1
+				# A short block ends the data read.
+				if len(data) < (j+1)*bs: break
+			return data[:bs]
+	
+	def GetByteAt(self,ea):
+		"""Return the byte at address *ea*.
+		
+		:param integer ea:
+		:rtype: 8-bit integer
+		:raises: :exc:`IndexError` if *ea* cannot be read.
+		"""
+		if ea < 0: raise IndexError()
+		k,i = divmod(ea,self.blocksize)
+		return self.Block(k)[i]
+	
+	def WindowAt(self,ea,n):
+		"""Return up to *n* bytes beginning at address *ea*, from one block or 
+		two.
+		
+		:param integer ea:
+		:param integer n:
+		:rtype: integer list
+		"""
+		w = []
+		if ea < 0: return w
+		bs = self.blocksize
+		while len(w) < n:
+			k,i = divmod(ea,bs)
+			b = self.Block(k)
+			part = b[i:i+n-len(w)]
+			w.extend(part)
+			if len(b) < bs or not part: break
+			ea = ea + len(part)
+		return w
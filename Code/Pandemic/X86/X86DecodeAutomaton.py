@@ -0,0 +1,205 @@
+"""This module compiles :data:`.X86DecodeTable.decoding_table` into a flat
+decode automaton.  The nested :class:`~.X86DECDL` objects remain the source of
+truth; at import time, we walk them once for every combination of the decoder
+state that they inspect (the ``PFX_`` prefix state bits defined in 
+:mod:`.X86DecodeTable`, and the ModRM :attr:`~.MOD`, :attr:`~.GGG`, and 
+:attr:`~.RM` fields), and record the outcome in one flat list.  Afterwards,
+selecting the mnemonic and abstract operand types for a stem is a single
+indexed lookup, rather than a chain of
+:meth:`decode` method calls through :class:`~.Group`, :class:`~.RMGroup`,
+:class:`~.SSE`, and the :class:`~.Predicated` classes.
+
+For each stem, the automaton stores a 4-tuple ``(base, pmask, mmask, stride)``.
+*pmask* and *mmask* select the prefix state bits and ModRM key bits upon which
+the stem's entry actually depends, so the entry for the stem occupies
+``(pmask+1)*stride`` consecutive elements of the leaf list beginning at *base*.
+The leaf at index ``base + (pfx & pmask)*stride + (mk & mmask)`` is either
+``None`` (the instruction is undefined), or a 3-tuple
+``(mnem, oplist, sse)``, where *sse* indicates that the entry passed through an
+:class:`~.SSE` entry and therefore consumed the Group #1 prefixes.
+"""
+
+from X86DecodeTable import *
+from Pandemic.Util.Visitor import Visitor
+
+#: ModRM key bit:  :attr:`~.MOD` is ``3``, i.e., the ModRM specifies a register.
+MK_MOD3 = 0x40
+#: ModRM key bits:  the :attr:`~.GGG` field.
+MK_GGG  = 0x38
+#: ModRM key bits:  the :attr:`~.RM` field.
+MK_RM   = 0x07
+
+#: Group #1 prefixes, indexed by the 2-bit codes that :func:`scan_prefixes` 
+#: records for them.
+group1_of_code = [None,REP,REPNE,LOCK]
+
+#: Classification of every byte value for :func:`scan_prefixes`.
+#: Non-prefix bytes map to ``None``.  Prefix bytes map to a 4-tuple 
+#: ``(setbits, clearbits, g1code, seg)``:  the prefix state bits to set and 
+#: clear, the code of the Group #1 prefix (an index into 
+#: :data:`group1_of_code`, or ``0``), and the segment (or ``None``).
+prefix_classes = [None]*256
+prefix_classes[0xF0] = (PFX_LOCK,0,3,None)
+prefix_classes[0xF2] = (PFX_REPNE|PFX_REPNE_LAST,0,2,None)
+prefix_classes[0xF3] = (PFX_REP,PFX_REPNE_LAST,1,None)
+prefix_classes[0x2E] = (0,0,0,CS)
+prefix_classes[0x36] = (0,0,0,SS)
+prefix_classes[0x3E] = (0,0,0,DS)
+prefix_classes[0x26] = (0,0,0,ES)
+prefix_classes[0x64] = (0,0,0,FS)
+prefix_classes[0x65] = (0,0,0,GS)
+prefix_classes[0x66] = (PFX_OPSIZE,0,0,None)
+prefix_classes[0x67] = (PFX_ADDRSIZE,0,0,None)
+
+def scan_prefixes(w,i,n):
+	"""Consume the prefixes in the list of bytes *w*, from index *i* up to (but
+	not including) index *n*, classifying each byte through 
+	:data:`prefix_classes`.  The prefixes are accumulated into the prefix state
+	bitmask, and the Group #1 prefixes into an integer holding the 
+	:data:`group1_of_code` code of each, two bits apiece, in the order in which
+	they were consumed.
+	
+	:param w: the bytes
+	:type w: integer list
+	:param integer i: the index of the first byte
+	:param integer n: the index at which to stop
+	:rtype: (integer, integer, :class:`~.SegElt`, integer)
+	:returns: The prefix state bits, the Group #1 prefixes, the segment prefix
+		(or ``None``), and the index of the first byte that is not a prefix; or
+		``None`` if every byte before *n* is a prefix.
+	"""
+	pfx,g1seq,segpfx = 0,0,None
+	while i < n:
+		c = prefix_classes[w[i]]
+		if c is None: return (pfx,g1seq,segpfx,i)
+		setbits,clearbits,g1code,seg = c
+		pfx = (pfx | setbits) & ~clearbits
+		if g1code:          g1seq = g1seq << 2 | g1code
+		if seg is not None: segpfx = seg
+		i = i + 1
+	return None
+
+def modrm_key(modrm):
+	"""Compute the ModRM key bits from a :class:`~.ModRM16` or
+	:class:`~.ModRM32` object.
+
+	:param `.ModRM16` modrm:
+	:rtype: integer
+	"""
+	return (MK_MOD3 if modrm.MOD == 3 else 0) | modrm.GGG << 3 | modrm.RM
+
+def modrm_key_byte(b):
+	"""Compute the ModRM key bits from a raw ModRM byte.
+
+	:param integer b:
+	:rtype: integer
+	"""
+	return (MK_MOD3 if b >= 0xC0 else 0) | b & 0x3F
+
+class X86DECDLMasks(Visitor):
+	"""This :class:`~.Visitor` computes which prefix state bits and ModRM key
+	bits an :class:`~.X86DECDL` entry inspects.  Each :meth:`visit` returns a
+	pair ``(pmask, mmask)``."""
+	def visit_Direct(self,d):       return (0,0)
+	def visit_InvalidEntry(self,i): return (0,0)
+	def visit_Fatal(self,f):        return (0,0)
+
+	def Union(self,entries,pmask,mmask):
+		"""Combine the masks of all *entries* with *pmask* and *mmask*.
+
+		:param entries: the children of some :class:`~.X86DECDL` entry
+		:type entries: :class:`~.X86DECDL` list
+		:rtype: (integer, integer)
+		"""
+		for e in entries:
+			p,m = self.visit(e)
+			pmask,mmask = pmask | p, mmask | m
+		return (pmask,mmask)
+
+	def visit_Group(self,g):        return self.Union(g.group,0,MK_GGG)
+	def visit_RMGroup(self,g):      return self.Union(g.group,0,MK_RM)
+	def visit_PredOpSize(self,p):   return self.Union([p.overridden,p.regular],PFX_OPSIZE,0)
+	def visit_PredAddrSize(self,p): return self.Union([p.overridden,p.regular],PFX_ADDRSIZE,0)
+	def visit_PredMOD(self,p):      return self.Union([p.overridden,p.regular],0,MK_MOD3)
+	def visit_SSE(self,s):
+		return self.Union([s.no,s.rep,s.size,s.repne],SSE_PFX_MASK,0)
+
+class X86DECDLResolver(Visitor):
+	"""This :class:`~.Visitor` selects the leaf for an :class:`~.X86DECDL`
+	entry, given fixed prefix state bits and ModRM key bits.  It mirrors the
+	:meth:`decode` methods in :mod:`.X86DecodeTable`, but reads the decoder
+	state from its *pfx* and *mk* members instead of from a decoder.
+
+	:ivar integer pfx: prefix state bits
+	:ivar integer mk: ModRM key bits
+	:ivar bool sse: whether an :class:`~.SSE` entry has been traversed
+	"""
+	def Resolve(self,entry,pfx,mk):
+		"""Return the leaf selected by *entry* for prefix state *pfx* and ModRM
+		key *mk*.
+
+		:param `.X86DECDL` entry:
+		:param integer pfx:
+		:param integer mk:
+		:rtype: (:class:`~.MnemElt`, :class:`~.AOTElt` list, bool) or ``None``
+		"""
+		self.pfx,self.mk,self.sse = pfx,mk,False
+		return self.visit(entry)
+
+	def visit_Direct(self,d):       return (d.mnem,d.opl,self.sse)
+	def visit_InvalidEntry(self,i): return None
+
+	# Fatal entries sit at the prefix and escape bytes, which are always 
+	# consumed before the stem; no stem can ever select them.
+	def visit_Fatal(self,f):        return None
+
+	def visit_Group(self,g):   return self.visit(g.group[(self.mk & MK_GGG) >> 3])
+	def visit_RMGroup(self,g): return self.visit(g.group[self.mk & MK_RM])
+
+	def visit_PredOpSize(self,p):
+		return self.visit(p.overridden if self.pfx & PFX_OPSIZE else p.regular)
+
+	def visit_PredAddrSize(self,p):
+		return self.visit(p.overridden if self.pfx & PFX_ADDRSIZE else p.regular)
+
+	def visit_PredMOD(self,p):
+		return self.visit(p.regular if self.mk & MK_MOD3 else p.overridden)
+
+	def visit_SSE(self,s):
+		self.sse = True
+		return self.visit(s.table[self.pfx & SSE_PFX_MASK])
+
+class X86DecodeAutomaton(object):
+	"""The flat decode automaton compiled from a decoding table.
+
+	:ivar stems: one ``(base, pmask, mmask, stride)`` tuple per stem
+	:ivar leaves: the leaves for every stem, laid out consecutively
+	"""
+	def __init__(self,table):
+		masks,resolver = X86DECDLMasks(),X86DECDLResolver()
+		self.stems,self.leaves = [],[]
+		for entry in table:
+			pmask,mmask = masks.visit(entry)
+			base,stride = len(self.leaves),mmask+1
+			for pfx in xrange(pmask+1):
+				for mk in xrange(stride):
+					# Combinations with bits outside the masks are never indexed.
+					if pfx & ~pmask or mk & ~mmask:
+						self.leaves.append(None)
+					else:
+						self.leaves.append(resolver.Resolve(entry,pfx,mk))
+			self.stems.append((base,pmask,mmask,stride))
+
+	def Lookup(self,stem,pfx,mk=0):
+		"""Return the leaf for *stem*, prefix state *pfx*, and ModRM key *mk*.
+
+		:param integer stem:
+		:param integer pfx:
+		:param integer mk:
+		:rtype: (:class:`~.MnemElt`, :class:`~.AOTElt` list, bool) or ``None``
+		"""
+		base,pmask,mmask,stride = self.stems[stem]
+		return self.leaves[base + (pfx & pmask)*stride + (mk & mmask)]
+
+#: The automaton compiled from :data:`.X86DecodeTable.decoding_table`.
+decode_automaton = X86DecodeAutomaton(decoding_table)
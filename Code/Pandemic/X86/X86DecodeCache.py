@@ -0,0 +1,296 @@
+"""This module provides three caches for the decoder.  The first, 
+:class:`X86DecodeCache`, is a bounded cache of decoded
+:class:`~.Instruction` objects keyed on the bytes that encode them.  Real code
+repeats the same byte sequences constantly (prologues, stack frame accesses,
+thunks), and an instruction's bytes determine the instruction completely,
+except for the destinations of its :class:`~.JccTarget` operands.  Those are
+rebased to the new address by :func:`rebase_instruction` upon a hit.
+
+To use the cache, pass it to the :class:`~.X86Decoder.X86Decoder` constructor.
+It is consulted when an :class:`~.X86Decoder.X86LazyDecodedInstruction` builds
+its :attr:`instr`.  The :class:`~.Instruction` objects returned upon hits are
+shared between decodings, and must not be modified.
+
+The second, :class:`X86AddressCache`, maps addresses to decoded instructions,
+so that repeated passes over the same code do not decode it again.  Writes 
+through a :class:`~.WritableStreamObj` invalidate the affected entries.
+
+The third, :class:`X86PlanCache`, holds an :class:`X86DecodePlan` for each 
+combination of prefixes, stem, ModRM, and SIB.  Once those bytes are known, 
+everything else about the instruction is fixed (its operand types, registers, 
+segment, and which of the following bytes are displacements and immediates),
+so a plan builds the :class:`~.Instruction` by reading only those values.  
+This skips the AOTDL visitors, :meth:`~.ModRM32.Decode`, and 
+:meth:`~.ModRM32.Interpret`, and hits far more often than the first cache, as 
+the displacements and immediates need not match.
+
+An :class:`X86DecodeCache` (and hence an :class:`X86PlanCache`) may be shared
+between threads; its operations are serialized by a lock.  An
+:class:`X86AddressCache` may be read by several threads at once, but must not
+be written to concurrently.
+"""
+
+import threading
+from collections import OrderedDict
+from X86 import *
+from X86DecodeAutomaton import PFX_ADDRSIZE
+from X86OperandLayout import operand_layouts, OL_JCC
+from X86ModRM import sign_extend_8_16, sign_extend_8_32, modrm_length
+
+#: Plan step:  the operand is fixed, and the template is used as is.
+PLAN_FIXED = 0
+#: Plan step:  an :class:`~.Immediate`, read from the instruction's bytes.
+PLAN_IMM   = 1
+#: Plan step:  a :class:`~.MemExpr` whose displacement is read from the 
+#: instruction's bytes.
+PLAN_MEM   = 2
+#: Plan step:  a :class:`~.JccTarget`, computed from a branch displacement.
+PLAN_JCC   = 3
+#: Plan step:  a :class:`~.FarTarget`, read from the instruction's bytes.
+PLAN_FAR   = 4
+
+def rebase_instruction(instr,taken,nottaken):
+	"""Return a copy of *instr* whose :class:`~.JccTarget` operands have been
+	replaced by one with the given destinations.  The other operands are
+	shared with *instr*.
+
+	:param `.Instruction` instr:
+	:param integer taken: the new branch target
+	:param integer nottaken: the new fall-through address
+	:rtype: :class:`~.Instruction`
+	"""
+	ops = filter(lambda o: o is not None,[instr.op1,instr.op2,instr.op3])
+	ops = map(lambda o: JccTarget(taken,nottaken) if isinstance(o,JccTarget) else o,ops)
+	return Instruction(instr.prefixes,instr.mnem,*ops)
+
+def little_endian(bytes,i,n):
+	"""Return the integer stored little-endian in *bytes* from index *i* to 
+	*i+n* (exclusive).
+	
+	:param bytes:
+	:type bytes: integer list
+	:param integer i:
+	:param integer n:
+	:rtype: integer
+	"""
+	x = 0
+	for b in reversed(bytes[i:i+n]): x = x << 8 | b
+	return x
+
+class X86DecodePlan(object):
+	"""The recipe for building any instruction that shares its prefixes, stem, 
+	ModRM, and SIB with the instruction *d*, whose :class:`~.Instruction`,
+	*instr*, has already been built.  Each of *instr*'s operands becomes one 
+	step, which locates the operand's value within the instruction's bytes 
+	using the layouts in :mod:`.X86OperandLayout`, and keeps the operand as a 
+	template for the rest of its fields.
+	
+	The number of prefix bytes may vary between instructions with the same 
+	prefix state, so the offsets are counted from the end of the SIB (or 
+	whatever precedes the displacement and immediates).  The steps are checked
+	by building *d* again; if the result differs from 
+	*instr* (because some operand cannot be described by a step), the plan is
+	not :attr:`valid`.
+	
+	:ivar prefixes: the instruction's prefixes, as a tuple, so that the 
+		template is not shared with the instructions built from it
+	:ivar `.MnemElt` mnem: the instruction's mnemonic
+	:ivar steps: ``(kind, template, offset, size)`` for each operand, where 
+		*kind* is one of the ``PLAN_`` constants
+	:ivar integer varlen: the number of bytes occupied by the displacement and
+		immediates
+	:ivar integer addrmask: the mask applied to branch targets
+	:ivar bool valid: whether the plan reproduces *instr*
+	"""
+	def __init__(self,instr,d):
+		self.prefixes,self.mnem = tuple(instr.prefixes),instr.mnem
+		addr16 = d.pfx & PFX_ADDRSIZE != 0
+		self.addrmask = 0xFFFF if addr16 else 0xFFFFFFFF
+		
+		# The displacement follows the ModRM and SIB; the immediates follow it.
+		self.varlen = d.length - d.fixedlen
+		disp,imm = 0,0
+		if d.fixedlen > d.stemlen:
+			imm = d.stemlen + modrm_length(d.bytes,d.stemlen,addr16) - d.fixedlen
+		
+		layouts,ops,self.steps = operand_layouts[d.pfx & 3],[instr.op1,instr.op2,instr.op3],[]
+		for o,op in zip(d.leaf[1],ops):
+			modrm,immsize,kind = layouts[o.IntValue()]
+			if modrm:
+				if isinstance(op,MemExpr): step = (PLAN_MEM,op,disp,imm-disp)
+				else:                      step = (PLAN_FIXED,op,0,0)
+			elif kind == OL_JCC:             step = (PLAN_JCC,op,imm,immsize)
+			elif immsize == 0:               step = (PLAN_FIXED,op,0,0)
+			elif isinstance(op,MemExpr):     step = (PLAN_MEM,op,imm,immsize)
+			elif isinstance(op,FarTarget):   step = (PLAN_FAR,op,imm,immsize)
+			else:                            step = (PLAN_IMM,op,imm,immsize)
+			self.steps.append(step)
+			imm = imm + immsize
+		self.valid = len(self.steps) == instr.NumOps() and self.Build(d.ea,d.bytes) == instr
+	
+	def Build(self,ea,bytes):
+		"""Build the :class:`~.Instruction` encoded by *bytes* at *ea*, which 
+		must share this plan's prefixes, stem, ModRM, and SIB.
+		
+		:param integer ea:
+		:param bytes: the instruction's bytes
+		:type bytes: integer list
+		:rtype: :class:`~.Instruction`
+		"""
+		ops,base = [],len(bytes)-self.varlen
+		for kind,op,i,n in self.steps:
+			if kind == PLAN_FIXED:
+				ops.append(op)
+				continue
+			x = little_endian(bytes,base+i,n)
+			if kind == PLAN_IMM:
+				if n == 1 and isinstance(op,Iw): x = sign_extend_8_16(x)
+				if n == 1 and isinstance(op,Id): x = sign_extend_8_32(x)
+				ops.append(op(x))
+			elif kind == PLAN_MEM:
+				if isinstance(op,Mem16):
+					if n == 1: x = sign_extend_8_16(x)
+					ops.append(Mem16(op.Seg,op.size,op.BaseReg,op.IndexReg,x))
+				else:
+					if n == 1: x = sign_extend_8_32(x)
+					ops.append(Mem32(op.Seg,op.size,op.BaseReg,op.IndexReg,op.ScaleFac,x))
+			elif kind == PLAN_JCC:
+				if n == 1: x = sign_extend_8_32(x)
+				nottaken = ea+len(bytes)
+				ops.append(JccTarget((x+nottaken) & self.addrmask,nottaken))
+			else:
+				ops.append(type(op)(x >> (n-2)*8,x & (1 << (n-2)*8)-1))
+		return Instruction(list(self.prefixes),self.mnem,*ops)
+
+class X86DecodeCache(object):
+	"""A least-recently-used cache mapping tuples of instruction bytes to
+	:class:`~.Instruction` objects.
+
+	:ivar integer size: the maximum number of entries; it may be changed at any
+		time, taking effect upon the next :meth:`Insert`
+	:ivar integer hits: the number of successful calls to :meth:`Lookup`
+	:ivar integer misses: the number of unsuccessful calls to :meth:`Lookup`
+	:ivar lock: the :class:`threading.Lock` that serializes the operations
+	"""
+	def __init__(self,size=4096):
+		self.size = size
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def __len__(self):
+		return len(self.entries)
+
+	def Lookup(self,key):
+		"""Return the :class:`~.Instruction` cached for the bytes *key*, or
+		``None``, and count the hit or miss.  A hit makes *key* the most recently
+		used entry.
+
+		:param key: the instruction's bytes
+		:type key: integer tuple
+		:rtype: :class:`~.Instruction`
+		"""
+		with self.lock:
+			instr = self.entries.pop(key,None)
+			if instr is None:
+				self.misses = self.misses + 1
+				return None
+			self.hits = self.hits + 1
+			self.entries[key] = instr
+			return instr
+
+	def Insert(self,key,instr):
+		"""Cache *instr* for the bytes *key*, evicting the least recently used
+		entries if the cache is full.
+
+		:param key: the instruction's bytes
+		:type key: integer tuple
+		:param `.Instruction` instr:
+		"""
+		with self.lock:
+			entries = self.entries
+			entries.pop(key,None)
+			while len(entries) >= self.size and entries:
+				entries.popitem(False)
+			if self.size > 0:
+				entries[key] = instr
+
+	def Clear(self):
+		"""Discard every entry and reset the counters."""
+		with self.lock:
+			self.entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+class X86PlanCache(X86DecodeCache):
+	"""A least-recently-used cache mapping the keys returned by
+	:meth:`~.X86LazyDecodedInstruction.PlanKey` to :class:`X86DecodePlan` 
+	objects.  See :class:`X86DecodeCache` for the operations and counters.
+	"""
+	pass
+
+class X86AddressCache(object):
+	"""A cache mapping addresses to decoded instructions, for clients that 
+	decode the same addresses repeatedly.  If the stream is a 
+	:class:`~.WritableStreamObj`, the cache registers itself with the stream,
+	and every write invalidates the instructions that overlap it, including 
+	those that begin before it.
+
+	:ivar entries: a dictionary mapping addresses to 
+		:class:`~.X86DecodedInstruction` objects
+	:ivar integer hits: the number of successful calls to :meth:`Lookup`
+	:ivar integer misses: the number of unsuccessful calls to :meth:`Lookup`
+	"""
+	def __init__(self,stream):
+		self.entries = {}
+		self.hits = 0
+		self.misses = 0
+		if hasattr(stream,"AddListener"): stream.AddListener(self)
+
+	def __len__(self):
+		return len(self.entries)
+
+	def Lookup(self,ea):
+		"""Return the instruction cached at *ea*, or ``None``, and count the hit
+		or miss.
+
+		:param integer ea:
+		:rtype: :class:`~.X86DecodedInstruction`
+		"""
+		d = self.entries.get(ea)
+		if d is None: self.misses = self.misses + 1
+		else:         self.hits = self.hits + 1
+		return d
+
+	def Insert(self,d):
+		"""Cache the decoded instruction *d* at its address.
+
+		:param `.X86DecodedInstruction` d:
+		"""
+		self.entries[d.ea] = d
+
+	def Invalidate(self,start,end):
+		"""Discard every instruction that has a byte within the addresses from
+		*start* to *end* (exclusive).  No instruction is longer than 16 bytes, so
+		only the 15 addresses before *start* need to be examined beyond the range
+		itself.
+
+		:param integer start:
+		:param integer end:
+		"""
+		entries = self.entries
+		if end-start+15 > len(entries):
+			eas = entries.keys()
+		else:
+			eas = xrange(start-15,end)
+		for ea in eas:
+			d = entries.get(ea)
+			if d is not None and ea < end and ea+d.length > start:
+				del entries[ea]
+
+	def Clear(self):
+		"""Discard every entry and reset the counters."""
+		self.entries.clear()
+		self.hits = 0
+		self.misses = 0
@@ -0,0 +1,287 @@
+"""This module provides :class:`X86DecodeColumns`, a compact container for the
+results of disassembling a large range of code.  A list of
+:class:`~.X86DecodedInstruction` objects costs hundreds of bytes per
+instruction; instead, the instructions are stored column by column in
+:mod:`array` objects (an address column, a length column, a mnemonic column,
+and so on), at a few dozen bytes per instruction.  The encoded bytes are kept
+as well, so :class:`~.X86Decoder.X86LazyDecodedInstruction` objects, and
+through them :class:`~.Instruction` objects, can be built for individual rows
+upon request.
+
+Containers can be sliced and filtered without copying the encoded bytes, and,
+if NumPy is installed, saved to a directory of ``.npy`` files with
+:meth:`X86DecodeColumns.Save`, and loaded (optionally memory-mapped) with
+:func:`load_columns`.  A loaded container's columns are NumPy arrays rather
+than :mod:`array` objects, but it is otherwise used in the same way.
+"""
+
+import os
+from array import array
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from X86 import *
+from X86InternalOperand import AOTElt
+from X86Decoder import scan_window, branch_target, prebuilt_instructions, X86LazyDecodedInstruction
+from X86Decoder import DECODE_OK, DECODE_END_OF_STREAM, INVALID_SKIP, INVALID_STOP
+
+#: Flow kind:  control passes to the next instruction (:class:`~.FlowOrdinary`).
+FLOW_ORDINARY          = 0
+#: Flow kind:  a direct call (:class:`~.FlowCallDirect`).
+FLOW_CALL_DIRECT       = 1
+#: Flow kind:  a direct, unconditional jump (:class:`~.FlowJmpUnconditional`).
+FLOW_JMP_UNCONDITIONAL = 2
+#: Flow kind:  a direct, conditional jump (:class:`~.FlowJmpConditional`).
+FLOW_JMP_CONDITIONAL   = 3
+#: Flow kind:  an indirect call (:class:`~.FlowCallIndirect`).
+FLOW_CALL_INDIRECT     = 4
+#: Flow kind:  an indirect jump (:class:`~.FlowJmpIndirect`).
+FLOW_JMP_INDIRECT      = 5
+#: Flow kind:  a return (:class:`~.FlowReturn`).
+FLOW_RETURN            = 6
+
+#: Operand column value for an instruction with fewer than three operands.
+OPERAND_NONE = 0xFFFF
+
+#: The names and :mod:`array` type codes of the columns, in the order in which
+#: :meth:`X86DecodeColumns.Save` writes them.  The *data* column holds the
+#: encoded bytes, and the *offset* column locates each row's bytes within it.
+column_types = [
+	('ea','L'), ('length','B'), ('offset','L'), ('mnem','H'), ('flow','B'),
+	('target','L'), ('op1','H'), ('op2','H'), ('op3','H') ]
+
+#: The ``FLOW_`` kind of each :class:`~.FlowType` class.
+flow_kinds = {
+	FlowOrdinary:FLOW_ORDINARY, FlowCallDirect:FLOW_CALL_DIRECT,
+	FlowJmpUnconditional:FLOW_JMP_UNCONDITIONAL, 
+	FlowJmpConditional:FLOW_JMP_CONDITIONAL, FlowCallIndirect:FLOW_CALL_INDIRECT,
+	FlowJmpIndirect:FLOW_JMP_INDIRECT, FlowReturn:FLOW_RETURN }
+
+#: The kinds found so far by :func:`flow_kind`, keyed on the 
+#: :meth:`~.EnumElt.IntValue` of the mnemonic and whether there is a target.
+flow_kind_memo = {}
+
+#: The instruction through which :func:`flow_kind` calls
+#: :meth:`~.X86DecodedInstruction.CreateFlowFrom`.
+flow_prototype = X86DecodedInstruction(0,None,0,FlowOrdinary(0))
+
+def flow_kind(mnem,target):
+	"""Classify the control flow of an instruction by calling 
+	:meth:`~.X86DecodedInstruction.CreateFlowFrom`.  The kind depends only upon
+	the mnemonic and upon whether there is a target, so each combination is 
+	classified once, and remembered in :data:`flow_kind_memo`.
+
+	:param `.MnemElt` mnem: the instruction's mnemonic
+	:param integer target: the instruction's branch target, or ``None``
+	:rtype: integer
+	:returns: One of the ``FLOW_`` constants.
+	"""
+	key = (mnem.IntValue(),target is not None)
+	kind = flow_kind_memo.get(key)
+	if kind is None:
+		t = None if target is None else 0
+		kind = flow_kinds[type(flow_prototype.CreateFlowFrom(mnem,t,t))]
+		flow_kind_memo[key] = kind
+	return kind
+
+def take(col,idx):
+	"""Return the elements of the column *col* at the indices *idx*, as a
+	column of the same kind.
+
+	:param col: an :mod:`array` or NumPy array
+	:param idx: the indices
+	:type idx: integer list
+	"""
+	if isinstance(col,array): return array(col.typecode,map(col.__getitem__,idx))
+	return col[idx]
+
+class X86DecodeColumns(object):
+	"""The instructions found by a linear sweep from *start* to *end*
+	(exclusive), using *decoder*'s stream, stored by column.  Each instruction
+	is checked by :func:`~.X86Decoder.scan_window`; no
+	:class:`~.X86DecodedInstruction` objects are created along the way.
+	Undefined instructions are skipped one byte at a time if *invalid* is
+	:data:`~.INVALID_SKIP`, or end the sweep if it is :data:`~.INVALID_STOP`.
+	If *decoder* is ``None``, the container is empty.
+
+	Indexing the container with an integer returns an
+	:class:`~.X86Decoder.X86LazyDecodedInstruction` for that row; indexing it
+	with a slice returns another container.
+
+	:ivar ea: the address of each instruction
+	:ivar length: the length of each instruction
+	:ivar offset: the index of each instruction's first byte within :attr:`data`
+	:ivar mnem: the :meth:`~.EnumElt.IntValue` of each instruction's mnemonic
+	:ivar flow: the ``FLOW_`` kind of each instruction
+	:ivar target: the branch target of each instruction (meaningful only for
+		the kinds :data:`FLOW_CALL_DIRECT`, :data:`FLOW_JMP_UNCONDITIONAL`, and
+		:data:`FLOW_JMP_CONDITIONAL`)
+	:ivar op1: the :meth:`~.EnumElt.IntValue` of each instruction's first
+		abstract operand type, or :data:`OPERAND_NONE`; likewise *op2* and *op3*
+	:ivar data: the encoded bytes of the instructions
+	:ivar `.X86DecodeCache` cache: the cache given to the instructions built by
+		indexing, or ``None``
+	:ivar `.X86PlanCache` plans: the plan cache given to the instructions built
+		by indexing, or ``None``
+	:ivar `.X86CompiledDecoder` compiled: the generated decoder given to the 
+		instructions built by indexing, or ``None``
+	"""
+	def __init__(self,decoder=None,start=0,end=0,invalid=INVALID_SKIP):
+		for name,tc in column_types:
+			setattr(self,name,array(tc))
+		self.data = array('B')
+		self.cache,self.plans,self.compiled = None,None,None
+		if decoder is None: return
+		self.cache,self.plans,self.compiled = decoder.cache,decoder.plans,decoder.compiled
+
+		stream,ea = decoder.Stream,start
+		while ea < end:
+			w = stream.WindowAt(ea,16)
+			status,length,ctx = scan_window(w)
+			if status == DECODE_END_OF_STREAM: break
+			if status != DECODE_OK:
+				if invalid == INVALID_STOP: break
+				ea = ea + 1
+				continue
+			self.Append(ea,w[:length],ctx)
+			ea = ea + length
+
+	def Append(self,ea,bytes,ctx):
+		"""Add a row for the instruction *bytes* at *ea*, which
+		:func:`~.X86Decoder.scan_window` described with *ctx*.
+
+		:param integer ea:
+		:param bytes: the instruction's bytes
+		:type bytes: integer list
+		:param `.X86DecodeContext` ctx:
+		"""
+		mnem,oplist,sse = ctx.leaf
+		target = branch_target(ea,bytes,ctx.pfx,oplist)
+		ops = map(lambda o: o.IntValue(),oplist) + [OPERAND_NONE]*(3-len(oplist))
+		self.ea.append(ea)
+		self.length.append(len(bytes))
+		self.offset.append(len(self.data))
+		self.mnem.append(mnem.IntValue())
+		self.flow.append(flow_kind(mnem,target))
+		self.target.append(0 if target is None else target)
+		self.op1.append(ops[0])
+		self.op2.append(ops[1])
+		self.op3.append(ops[2])
+		self.data.extend(bytes)
+
+	def __len__(self):
+		return len(self.ea)
+
+	def __iter__(self):
+		for i in xrange(len(self)):
+			yield self[i]
+
+	def __getitem__(self,i):
+		if isinstance(i,slice):
+			return self.Rows(lambda col: col[i])
+		if i < 0: i = i + len(self)
+		ea,o,n = int(self.ea[i]),int(self.offset[i]),int(self.length[i])
+		bytes = map(int,self.data[o:o+n])
+		status,length,ctx = scan_window(bytes)
+		instr = None
+		if ctx.pfx == 0 and ctx.segpfx is None:
+			instr = prebuilt_instructions[ctx.stem]
+		return X86LazyDecodedInstruction(ea,bytes,ctx,instr,self.cache,self.plans,self.compiled)
+
+	def Rows(self,fn):
+		"""Return a new container whose row columns are *fn* applied to this
+		container's.  The :attr:`data` column is shared, not copied.
+
+		:param fn: a function from a column to a column
+		:rtype: :class:`X86DecodeColumns`
+		"""
+		c = X86DecodeColumns()
+		for name,tc in column_types:
+			setattr(c,name,fn(getattr(self,name)))
+		c.data,c.cache,c.plans,c.compiled = self.data,self.cache,self.plans,self.compiled
+		return c
+
+	def Select(self,idx):
+		"""Return a new container holding the rows at the indices *idx*, in
+		order.
+
+		:param idx: the row indices
+		:type idx: integer list
+		:rtype: :class:`X86DecodeColumns`
+		"""
+		return self.Rows(lambda col: take(col,idx))
+
+	def Filter(self,mnems):
+		"""Return a new container holding the rows whose mnemonic is one of
+		*mnems*.
+
+		:param mnems: the mnemonics to keep
+		:type mnems: :class:`~.MnemElt` list
+		:rtype: :class:`X86DecodeColumns`
+		"""
+		keep,col = frozenset(map(lambda m: m.IntValue(),mnems)),self.mnem
+		return self.Select(filter(lambda i: col[i] in keep,xrange(len(self))))
+
+	def Mnem(self,i):
+		"""Return the mnemonic of row *i*.
+
+		:param integer i:
+		:rtype: :class:`~.MnemElt`
+		"""
+		return MnemElt(int(self.mnem[i]))
+
+	def Target(self,i):
+		"""Return the branch target of row *i*, or ``None``.
+
+		:param integer i:
+		:rtype: integer
+		"""
+		if self.flow[i] in (FLOW_CALL_DIRECT,FLOW_JMP_UNCONDITIONAL,FLOW_JMP_CONDITIONAL):
+			return int(self.target[i])
+		return None
+
+	def Operands(self,i):
+		"""Return the abstract operand types of row *i*.
+
+		:param integer i:
+		:rtype: :class:`~.AOTElt` list
+		"""
+		ops = [self.op1[i],self.op2[i],self.op3[i]]
+		return map(lambda o: AOTElt(int(o)),filter(lambda o: o != OPERAND_NONE,ops))
+
+	def Save(self,path):
+		"""Write each column to the file ``<name>.npy`` in the directory *path*,
+		creating the directory if necessary.  The rows of a sliced or filtered
+		container are saved with all of the :attr:`data` that they share.
+
+		:param string path:
+		:raises: :exc:`ImportError` if NumPy is not installed.
+		"""
+		if numpy is None:
+			raise ImportError("X86DecodeColumns.Save requires NumPy")
+		if not os.path.isdir(path): os.makedirs(path)
+		for name,tc in column_types+[('data','B')]:
+			col = getattr(self,name)
+			if isinstance(col,array): col = numpy.frombuffer(col,tc)
+			numpy.save(os.path.join(path,name+".npy"),col)
+
+def load_columns(path,mmap=True):
+	"""Load an :class:`X86DecodeColumns` saved by
+	:meth:`X86DecodeColumns.Save`.  If *mmap* is ``True``, the columns are
+	memory-mapped read-only, so that only the rows actually used are read from
+	disk.
+
+	:param string path:
+	:param bool mmap:
+	:rtype: :class:`X86DecodeColumns`
+	:raises: :exc:`ImportError` if NumPy is not installed.
+	"""
+	if numpy is None:
+		raise ImportError("load_columns requires NumPy")
+	c = X86DecodeColumns()
+	for name,tc in column_types+[('data','B')]:
+		setattr(c,name,numpy.load(os.path.join(path,name+".npy"),mmap_mode='r' if mmap else None))
+	return c
@@ -0,0 +1,407 @@
+"""This module generates a specialized decoder module ahead of time, in the
+way that PLY writes its parse tables to ``xpy.py``.  The generator walks the
+leaves of :data:`~.X86DecodeAutomaton.decode_automaton` (and hence
+:data:`~.X86DecodeTable.decoding_table`) and the :data:`.AOTtoAOTDL` entries
+for their operands, under each combination of the OPSIZE and ADDRSIZE
+prefixes, and emits one straight-line Python function for each distinct
+operand list.  The :class:`.SizePrefix` and :class:`.AddrPrefix` elements are
+resolved when the code is generated; the displacements, immediates, and
+register fields are read from the instruction's bytes by inline expressions;
+and the memory operands are built by :func:`mem16` and :func:`mem32`, which
+read the ModRM and SIB bytes directly rather than through :class:`~.ModRM16`
+and :class:`~.ModRM32` objects.  No :class:`~.X86DECDL` objects,
+:meth:`~.Visitor.visit` calls, or :class:`~.GuardedInteger` ModRM fields are
+involved when an instruction is built.
+
+The generated module (by default, ``xdec.py`` in the per-user directory
+returned by :func:`cache_directory`) records the :func:`table_signature` of
+the tables from which it was generated.  :func:`load_compiled` imports it, and
+regenerates it if it is missing or the tables have changed since.  Nothing is
+written within the package, and the generated module is not distributed with
+it.  To use it, pass the :class:`X86CompiledDecoder` returned by
+:func:`load_compiled` to the :class:`~.X86Decoder.X86Decoder` constructor.
+"""
+
+import os, imp, hashlib
+from X86 import *
+from X86DecodeAutomaton import *
+from X86InternalOperandDescriptions import *
+from X86OperandLayout import operand_layouts
+from X86Decoder import group1_list
+from Pandemic.Util.Visitor import Visitor
+
+#: Changing the code emitted by :class:`X86AOTDLCompiler` changes this number,
+#: so that modules generated by earlier versions are regenerated.
+compiler_version = 1
+
+#: The 32-bit registers, indexed by register number.
+r32 = map(R32Elt,xrange(8))
+
+#: The base and index registers specified by the :attr:`~.RM` field of a
+#: ModRM/16, as in :data:`~.X86ModRM.modrm_16`.
+r16pairs = [(Bx,Si),(Bx,Di),(Bp,Si),(Bp,Di),(Si,None),(Di,None),(Bp,None),(Bx,None)]
+
+def mem16(w,i,size,seg):
+	"""Build the :class:`~.Mem16` specified by the ModRM/16 at index *i* of the
+	instruction's bytes *w*, whose :attr:`~.MOD` must not be ``3``.
+
+	:param w: the instruction's bytes
+	:type w: integer list
+	:param integer i: the index of the ModRM
+	:param `.MSElt` size: the memory access size
+	:param `.SegElt` seg: the segment prefix, or ``None``
+	:rtype: :class:`~.Mem16`
+	"""
+	mb = w[i]
+	mod,rm = mb >> 6,mb & 7
+	if mod == 0 and rm == 6:
+		return Mem16(DS if seg is None else seg,size,None,None,w[i+1] | w[i+2] << 8)
+	base,index = r16pairs[rm]
+	if   mod == 0: disp = 0
+	elif mod == 1: disp = (w[i+1] ^ 0x80) - 0x80 & 0xFFFF
+	else:          disp = w[i+1] | w[i+2] << 8
+	if seg is None: seg = SS if rm == 2 or rm == 3 or rm == 6 else DS
+	return Mem16(seg,size,base,index,disp)
+
+def mem32(w,i,size,seg):
+	"""Build the :class:`~.Mem32` specified by the ModRM/32 at index *i* of the
+	instruction's bytes *w*, along with any SIB, whose :attr:`~.MOD` must not
+	be ``3``.
+
+	:param w: the instruction's bytes
+	:type w: integer list
+	:param integer i: the index of the ModRM
+	:param `.MSElt` size: the memory access size
+	:param `.SegElt` seg: the segment prefix, or ``None``
+	:rtype: :class:`~.Mem32`
+	"""
+	mb = w[i]
+	mod,rm,j = mb >> 6,mb & 7,i+1
+	index,scale = None,0
+	if rm == 4:
+		sib = w[j]
+		j = j+1
+		b,x = sib & 7,sib >> 3 & 7
+		if x != 4: index,scale = r32[x],sib >> 6
+		if mod == 0 and b == 5:
+			b,mod = None,2
+	elif mod == 0 and rm == 5:
+		b,mod = None,2
+	else:
+		b = rm
+	if   mod == 0: disp = 0
+	elif mod == 1: disp = (w[j] ^ 0x80) - 0x80 & 0xFFFFFFFF
+	else:          disp = w[j] | w[j+1] << 8 | w[j+2] << 16 | w[j+3] << 24
+	if seg is None: seg = SS if b == 4 or b == 5 else DS
+	return Mem32(seg,size,None if b is None else r32[b],index,scale,disp)
+
+def little_endian_expr(k,n):
+	"""Return a Python expression reading the *n*-byte little-endian integer
+	that begins *k* bytes before the end of the instruction's bytes ``w``,
+	whose length is held in ``n``.
+
+	:param integer k:
+	:param integer n:
+	:rtype: string
+	"""
+	parts = map(lambda j: "w[n-%d]" % (k-j) + ("" if j == 0 else " << %d" % (j*8)),xrange(n))
+	return " | ".join(parts)
+
+def resolve(d,sizepfx,addrpfx):
+	"""Resolve the :class:`.SizePrefix` and :class:`.AddrPrefix` elements of the
+	:class:`~.X86AOTDL` element *d* for fixed operand and address sizes.
+
+	:param `.X86AOTDL` d:
+	:param bool sizepfx:
+	:param bool addrpfx:
+	:rtype: :class:`~.X86AOTDL`
+	"""
+	while isinstance(d,SizePrefix) or isinstance(d,AddrPrefix):
+		if isinstance(d,SizePrefix): d = d.yes if sizepfx else d.no
+		else:                        d = d.yes if addrpfx else d.no
+	return d
+
+def describe(d):
+	"""Return a string describing the :class:`~.X86AOTDL` element *d*
+	completely, for :func:`table_signature`.
+
+	:param `.X86AOTDL` d:
+	:rtype: string
+	"""
+	if d is None: return "None"
+	name = d.__class__.__name__
+	if isinstance(d,SizePrefix) or isinstance(d,AddrPrefix):
+		return "%s(%s,%s)" % (name,describe(d.yes),describe(d.no))
+	if isinstance(d,RegOrMem): return "%s(%r,%r)" % (name,d.reg,d.mem)
+	if isinstance(d,Exact) or isinstance(d,ExactSeg): return "%s(%r)" % (name,d.value)
+
+	# The archetypes of moffs operands are bare MemExpr objects, without a repr.
+	a = d.archetype
+	if type(a) == MemExpr: return "%s(MemExpr(%r,%r))" % (name,a.Seg,a.size)
+	return "%s(%r)" % (name,a)
+
+def table_signature():
+	"""Return a digest of everything from which the decoder module is
+	generated:  the :data:`.AOTtoAOTDL` entries, the operand lists of the
+	automaton's leaves, and :data:`compiler_version`.
+
+	:rtype: string
+	"""
+	h = hashlib.md5("%d\n" % compiler_version)
+	h.update("\n".join(map(describe,AOTtoAOTDL)))
+	for leaf in decode_automaton.leaves:
+		h.update("\n" if leaf is None else "%s\n" % map(lambda o: o.IntValue(),leaf[1]))
+	return h.hexdigest()
+
+class X86AOTDLCompiler(Visitor):
+	"""This :class:`~.Visitor` returns a Python expression that builds the
+	operand described by an :class:`~.X86AOTDL` element, for fixed operand and
+	address sizes.  Within the expression, ``w`` holds the instruction's bytes,
+	``n`` their number, ``i`` the index of the ModRM, ``mb`` the ModRM byte,
+	``ea`` the instruction's address, and ``seg`` the segment prefix (or
+	``None``).  Operands that are fixed are held in module-level constants,
+	which are collected in :attr:`constants`.
+
+	:ivar bool sizepfx: whether the OPSIZE prefix is present
+	:ivar bool addrpfx: whether the ADDRSIZE prefix is present
+	:ivar integer end: the number of bytes between the operand's immediate and
+		the end of the instruction; set before visiting each operand
+	:ivar constants: the ``(name, expression)`` pairs for the module-level
+		constants, in order
+	"""
+	def __init__(self):
+		self.constants = []
+		self.names = {}
+		self.sizepfx,self.addrpfx,self.end = False,False,0
+
+	def Constant(self,expr):
+		"""Return the name of the module-level constant holding the value of the
+		Python expression *expr*, creating it upon first use.
+
+		:param string expr:
+		:rtype: string
+		"""
+		name = self.names.get(expr)
+		if name is None:
+			name = self.names[expr] = "K%d" % len(self.constants)
+			self.constants.append((name,expr))
+		return name
+
+	def Registers(self,r):
+		"""Return the name of the module-level list holding every register of
+		*r*'s family, indexed by register number.
+
+		:param `.Register` r:
+		:rtype: string
+		"""
+		cls = r.__class__.__name__
+		count = 6 if isinstance(r,SegReg) else 8
+		return self.Constant("map(lambda n: %s(n,True),xrange(%d))" % (cls,count))
+
+	def Bytes(self,size,skip=0):
+		"""Return an expression reading the *size*-byte immediate that ends
+		:attr:`end` (plus *skip*) bytes before the end of the instruction.
+
+		:param integer size:
+		:param integer skip:
+		:rtype: string
+		"""
+		return little_endian_expr(self.end+skip+size,size)
+
+	def Memory(self,size):
+		"""Return an expression building the memory operand specified by the
+		ModRM.
+
+		:param `.MSElt` size:
+		:rtype: string
+		"""
+		return "%s(w,i,%r,seg)" % ("mem16" if self.addrpfx else "mem32",size)
+
+	def visit_Exact(self,e):
+		return self.Constant(repr(e.value))
+
+	def visit_ExactSeg(self,e):
+		k = self.Constant(repr(e.value))
+		return "(%s if seg is None else %s(seg))" % (k,k)
+
+	def visit_GPart(self,g):
+		return "%s[mb >> 3 & 7]" % self.Registers(g.archetype)
+
+	def visit_RegOrMem(self,m):
+		if m.mem is None: return "%s[mb & 7]" % self.Registers(m.reg)
+		if m.reg is None: return self.Memory(m.mem)
+		return "(%s[mb & 7] if mb >= 0xC0 else %s)" % (self.Registers(m.reg),self.Memory(m.mem))
+
+	def Jcc(self,disp):
+		"""Return an expression building a :class:`~.JccTarget` from the
+		expression *disp*, the displacement from the end of the instruction.
+
+		:param string disp:
+		:rtype: string
+		"""
+		if self.addrpfx: return "JccTarget((%s)+ea+n & 0xFFFF,ea+n)" % disp
+		return "JccTarget((%s)+ea+n,ea+n)" % disp
+
+	def visit_ImmEnc(self,i):
+		a = i.archetype
+		if isinstance(a,JccTarget):
+			return self.Jcc(self.Bytes(2 if self.addrpfx else 4))
+		if isinstance(a,MemExpr):
+			if self.addrpfx: return "Mem16(DS if seg is None else seg,%r,None,None,%s)" % (a.size,self.Bytes(2))
+			return "Mem32(DS if seg is None else seg,%r,None,None,0,%s)" % (a.size,self.Bytes(4))
+		if isinstance(a,FarTarget):
+			# The offset precedes the 2-byte segment.
+			if self.addrpfx: return "AP16(%s,%s)" % (self.Bytes(2),self.Bytes(2,2))
+			return "AP32(%s,%s)" % (self.Bytes(2),self.Bytes(4,2))
+		if isinstance(a,Ib): return "Ib(%s)" % self.Bytes(1)
+		if isinstance(a,Iw): return "Iw(%s)" % self.Bytes(2)
+		return "Id(%s)" % self.Bytes(4)
+
+	def visit_SignedImm(self,i):
+		a,b = i.archetype,"(w[n-%d] ^ 0x80) - 0x80" % (self.end+1)
+		if isinstance(a,JccTarget): return self.Jcc(b)
+		return "%s(%s)" % (a.__class__.__name__,b)
+
+	def Function(self,name,oplist,pfx):
+		"""Return the source of a function named *name*, which builds the
+		:class:`~.Instruction` for the abstract operand types *oplist* under the
+		prefix state bits *pfx*.  The function takes the prefix list, the
+		mnemonic, the address, the bytes, the index of the ModRM (i.e., the
+		number of bytes occupied by the prefixes and stem), and the segment
+		prefix.
+
+		:param string name:
+		:param oplist: the abstract operand types
+		:type oplist: :class:`~.AOTElt` list
+		:param integer pfx:
+		:rtype: string
+		"""
+		self.sizepfx,self.addrpfx = pfx & PFX_OPSIZE != 0,pfx & PFX_ADDRSIZE != 0
+		layouts = operand_layouts[pfx & (PFX_OPSIZE|PFX_ADDRSIZE)]
+
+		# The immediates follow the ModRM in operand order, so their positions
+		# are counted from the end of the instruction.
+		exprs,self.end = [],0
+		for o in reversed(oplist):
+			d = resolve(AOTtoAOTDL[o.IntValue()],self.sizepfx,self.addrpfx)
+			exprs.append(self.visit(d))
+			self.end = self.end + layouts[o.IntValue()][1]
+		exprs.reverse()
+
+		body = ",".join(["pfx","mnem"] + exprs)
+		lines = ["def %s(pfx,mnem,ea,w,i,seg):" % name]
+		if "w[n" in body or "ea+n" in body: lines.append("\tn = len(w)")
+		if "mb" in body: lines.append("\tmb = w[i]")
+		lines.append("\treturn Instruction(%s)" % body)
+		return "\n".join(lines) + "\n"
+
+def generate_source(tabmodule="xdec"):
+	"""Return the source of the decoder module for the current tables.  The
+	module defines one function per distinct generated body, and the
+	dictionary ``builders``, which maps ``(pfx, aots)`` pairs (the prefix state
+	bits ``pfx & (PFX_OPSIZE|PFX_ADDRSIZE)`` and the tuple of
+	:meth:`~.EnumElt.IntValue` of the abstract operand types) to those
+	functions.
+
+	:param string tabmodule: the module's name, for its header
+	:rtype: string
+	"""
+	compiler,functions,bodies,keys = X86AOTDLCompiler(),[],{},[]
+	shapes = set()
+	for leaf in decode_automaton.leaves:
+		if leaf is not None: shapes.add(tuple(leaf[1]))
+	for oplist in sorted(shapes,key=lambda l: map(lambda o: o.IntValue(),l)):
+		aots = tuple(map(lambda o: o.IntValue(),oplist))
+		for pfx in xrange(4):
+			body = compiler.Function("_",oplist,pfx)
+			name = bodies.get(body)
+			if name is None:
+				name = bodies[body] = "d%d" % len(functions)
+				functions.append(body.replace("def _(","def %s(" % name,1))
+			keys.append("(%d,%r):%s" % (pfx,aots,name))
+
+	out = ["# Pandemic/X86/%s.py" % tabmodule,
+	       "# This file is automatically generated. Do not edit.",
+	       "from Pandemic.X86.X86 import *",
+	       "from Pandemic.X86.X86DecodeCompiler import mem16, mem32",
+	       "",
+	       "_signature = %r" % table_signature(),
+	       ""]
+	out.extend(map(lambda (name,expr): "%s = %s" % (name,expr),compiler.constants))
+	out.append("")
+	out.extend(functions)
+	out.append("builders = {")
+	out.extend(map(lambda k: "\t%s," % k,keys))
+	out.append("}")
+	return "\n".join(out) + "\n"
+
+class X86CompiledDecoder(object):
+	"""The functions of a generated decoder module, arranged for lookup by
+	:mod:`.X86DecodeAutomaton` leaf.
+
+	:ivar module: the generated module
+	:ivar table: for each value of ``pfx & (PFX_OPSIZE|PFX_ADDRSIZE)``, the
+		function for each of the automaton's leaves (or ``None``)
+	"""
+	def __init__(self,module):
+		self.module = module
+		builders = module.builders
+		def select(q,leaf):
+			if leaf is None: return None
+			return builders[(q,tuple(map(lambda o: o.IntValue(),leaf[1])))]
+		self.table = map(lambda q: map(lambda leaf: select(q,leaf),decode_automaton.leaves),xrange(4))
+
+	def Build(self,d):
+		"""Build the :class:`~.Instruction` for the decoded instruction *d*, an
+		:class:`~.X86Decoder.X86LazyDecodedInstruction`.
+
+		:param `.X86LazyDecodedInstruction` d:
+		:rtype: :class:`~.Instruction`
+		"""
+		pfx,w,i = d.pfx,d.bytes,d.stemlen
+		base,pmask,mmask,stride = decode_automaton.stems[d.stem]
+		mk = modrm_key_byte(w[i]) if mmask else 0
+		fn = self.table[pfx & (PFX_OPSIZE|PFX_ADDRSIZE)][base + (pfx & pmask)*stride + (mk & mmask)]
+		mnem,oplist,sse = d.leaf
+		return fn([] if sse else group1_list(d.g1seq),mnem,d.ea,w,i,d.segpfx)
+
+def cache_directory():
+	"""Return the directory to which :func:`load_compiled` writes generated
+	modules by default:  ``$PANDEMIC_CACHE_DIR`` if it is set, and otherwise 
+	``pandemic`` within ``$XDG_CACHE_HOME`` (or ``~/.cache``).
+
+	:rtype: string
+	"""
+	d = os.environ.get("PANDEMIC_CACHE_DIR")
+	if d: return d
+	base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"),".cache")
+	return os.path.join(base,"pandemic")
+
+def load_compiled(tabmodule="xdec",outputdir=None):
+	"""Load the generated decoder module *tabmodule* from *outputdir* (by
+	default, :func:`cache_directory`).  If it does not exist, or its
+	signature does not match :func:`table_signature`, generate it again and
+	write it there, creating the directory if necessary; if it cannot be 
+	written, it is used without being saved.
+
+	:param string tabmodule:
+	:param string outputdir:
+	:rtype: :class:`X86CompiledDecoder`
+	"""
+	if outputdir is None: outputdir = cache_directory()
+	path = os.path.join(outputdir,tabmodule+".py")
+	try:
+		module = imp.load_source("Pandemic.X86."+tabmodule,path)
+		if getattr(module,"_signature",None) == table_signature():
+			return X86CompiledDecoder(module)
+	except (IOError,SyntaxError,ImportError):
+		pass
+	source = generate_source(tabmodule)
+	try:
+		if not os.path.isdir(outputdir): os.makedirs(outputdir)
+		with open(path,"w") as f: f.write(source)
+	except (IOError,OSError):
+		pass
+	module = imp.new_module("Pandemic.X86."+tabmodule)
+	exec compile(source,path,"exec") in module.__dict__
+	return X86CompiledDecoder(module)
@@ -7,6 +7,24 @@ from X86InternalOperand import *
 from X86 import *
 from Pandemic.Util.ExerciseError import ExerciseError
 
+#: Prefix state bit:  the OPSIZE prefix is present.
+PFX_OPSIZE     = 0x01
+#: Prefix state bit:  the ADDRSIZE prefix is present.
+PFX_ADDRSIZE   = 0x02
+#: Prefix state bit:  the REP prefix is present.
+PFX_REP        = 0x04
+#: Prefix state bit:  the REPNE prefix is present.
+PFX_REPNE      = 0x08
+#: Prefix state bit:  REPNE, rather than REP, was the closest of the two to the
+#: instruction stem.
+PFX_REPNE_LAST = 0x10
+#: Prefix state bit:  the LOCK prefix is present.  No decoding table entry 
+#: depends upon it.
+PFX_LOCK       = 0x20
+
+#: The prefix state bits that select among the entries of an :class:`SSE`.
+SSE_PFX_MASK   = PFX_OPSIZE | PFX_REP | PFX_REPNE | PFX_REPNE_LAST
+
 class X86DECDL(object):
 	"""X86 Decoder Description Language (X86DECDL) base class."""
 	pass
@@ -101,55 +119,53 @@ class RMGroup(X86DECDL):
 
 class SSE(X86DECDL):
 	"""Decoder entry for SSE instructions.  It selects one of four decoder 
-	entries depending upon the REP, REPNZ, and OPSIZE prefixes.
+	entries depending upon the REP, REPNZ, and OPSIZE prefixes.  The selection
+	depends only upon the prefix state bits in :data:`SSE_PFX_MASK`, so it is 
+	made once per combination of them, by :meth:`Select`, when the entry is 
+	constructed.
 	
 	:ivar `X86DECDL` no: Entry to use with no prefixes
 	:ivar `X86DECDL` rep: Entry to use with the REP prefix
 	:ivar `X86DECDL` size: Entry to use with the OPSIZE prefix
 	:ivar `X86DECDL` repne: Entry to use with the REPNE prefix
+	:ivar table: The entry selected for each value of ``pfx & SSE_PFX_MASK``
+	:type table: :class:`X86DECDL` list
 	"""
 	def __init__(self,no,rep,size,repne):
 		self.no = no
 		self.rep = rep
 		self.size = size
 		self.repne = repne
+		self.table = map(self.Select,xrange(SSE_PFX_MASK+1))
 	
-		"""Select one of the entries based upon complex decoding logic, and call 
-		its :meth:`decode` method.
+	def Select(self,pfx):
+		"""Select one of the entries for the prefix state bits *pfx*.  If REP or
+		REPNE is present, the one closest to the instruction stem is tried first,
+		then the other; an entry is used only if it is valid.  Failing that, the
+		OPSIZE entry is tried, and then the non-prefixed entry.
 		
-		:param `.X86Decoder.X86Decoder` decoder:
-		:rtype: (:class:`~.MnemElt`, :class:`~.AOTElt` list) 
+		:param integer pfx:
+		:rtype: :class:`X86DECDL`
 		"""
-	def decode(self,decoder):
-		# If REP/REPNE is present, try to use them before the OPSIZE prefix.
-		pfx = decoder.group1pfx
-		if len(pfx) != 0:
-			decoder.group1pfx = []
-			try:
-				# Loop until a prefix is found.
-				while True:
-					# Get the prefix closest to the instruction stem.
-					curpfx = pfx.pop()
-
-					# Was it REP? And is there a valid entry for REP?
-					if curpfx == REP and not isinstance(self.rep,InvalidEntry):
-						# If yes, decode the REP entry.
-						return self.rep.decode(decoder)
+		order = [(PFX_REP,self.rep),(PFX_REPNE,self.repne)]
+		if pfx & PFX_REPNE_LAST: order.reverse()
+		for bit,entry in order:
+			if pfx & bit and not isinstance(entry,InvalidEntry):
+				return entry
+		if pfx & PFX_OPSIZE and not isinstance(self.size,InvalidEntry):
+			return self.size
+		return self.no
 
-					# Was it REPNE? And is there a valid entry for REPNE?
-					if curpfx == REPNE and not isinstance(self.repne,InvalidEntry):
-						# If yes, decode the REPNE entry.
-						return self.repne.decode(decoder)
-
-			except e,Exception:
-				pass
-		# If there were no Group 1 prefixes, or they didn't correspond to a
-		# valid decoder entry, try the OPSIZE prefix.
-		if decoder.sizepfx and not isinstance(self.size,InvalidEntry):
-			return self.size.decode(decoder)
+	def decode(self,decoder):
+		"""Look up the entry selected for *decoder*'s prefix state bits, and call
+		its :meth:`decode` method.  The Group #1 prefixes are consumed by the SSE
+		entry, so *decoder*'s *group1pfx* is cleared.
 		
-		# If none of that worked, decode the non-prefixed entry.
-		return self.no.decode(decoder)
+		:param `.X86Decoder.X86Decoder` decoder:
+		:rtype: (:class:`~.MnemElt`, :class:`~.AOTElt` list) 
+		"""
+		decoder.group1pfx = []
+		return self.table[decoder.pfx & SSE_PFX_MASK].decode(decoder)
 		
 class Predicated(X86DECDL):
 	"""This class of decoder entries selects between two different possibilities,
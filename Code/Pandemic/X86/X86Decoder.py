@@ -8,26 +8,342 @@ a debugger's capabilities to read from memory, etc.
 """
 
 from X86 import *
-from X86ByteStream import StreamObj
-import X86DecodeTable
-from X86ModRM import ModRM16, ModRM32, sign_extend_8_16, sign_extend_8_32, modrm_16
+from X86ByteStream import StreamObj, BufferStreamObj
+from X86DecodeAutomaton import *
+from X86OperandLayout import *
+from X86DecodeCache import rebase_instruction, X86DecodePlan
+from X86ModRM import ModRM16, ModRM32, sign_extend_8_16, sign_extend_8_32, modrm_16, modrm_length
 from X86InternalOperandDescriptions import *
 from Pandemic.Util.Visitor import Visitor
 from Pandemic.Util.ExerciseError import ExerciseError
 	
+#: :meth:`X86Decoder.DecodeRange` skips one byte past invalid instructions.
+INVALID_SKIP = 0
+#: :meth:`X86Decoder.DecodeRange` yields an :class:`~.X86DecodedData` for one
+#: byte at invalid instructions.
+INVALID_DATA = 1
+#: :meth:`X86Decoder.DecodeRange` stops at the first invalid instruction.
+INVALID_STOP = 2
+
+#: The number of bytes that :meth:`X86Decoder.DecodeRange` reads from the 
+#: stream at a time.
+sweep_chunk = 4096
+
+#: Decode status:  the instruction was decoded successfully.
+DECODE_OK            = 0
+#: Decode status:  the opcode is undefined, or the ModRM specifies a register
+#: where only memory is legal (or vice versa).
+DECODE_UNDEFINED     = 1
+#: Decode status:  the ModRM :attr:`~.GGG` field names a nonexistent segment 
+#: register.
+DECODE_BAD_SEGREG    = 2
+#: Decode status:  the instruction would exceed the 16-byte limit.
+DECODE_TOO_LONG      = 3
+#: Decode status:  the stream ended before the instruction did.
+DECODE_END_OF_STREAM = 4
+
+def exact_operand(d):
+	"""If the :class:`~.X86AOTDL` element *d* specifies an operand exactly when
+	no prefixes are present, return that operand; otherwise, return ``None``.
+	
+	:param `.X86AOTDL` d:
+	:rtype: :class:`~.Operand`
+	"""
+	while isinstance(d,SizePrefix) or isinstance(d,AddrPrefix): d = d.no
+	if isinstance(d,Exact) or isinstance(d,ExactSeg): return d.value
+	return None
+
+def prebuild_instruction(stem):
+	"""If, in the absence of prefixes, *stem* always decodes to the same 
+	instruction (i.e., it does not need a ModRM, and its operands are all 
+	:class:`~.Exact` or :class:`~.ExactSeg`), create and return that 
+	:class:`~.Instruction`.  Otherwise, return ``None``.  The instruction is
+	shared between every decoding of *stem*, so, as with the instructions
+	returned by :class:`~.X86DecodeCache`, it must not be modified (e.g., 
+	through :meth:`~.Instruction.AddPrefix`).
+	
+	:param integer stem:
+	:rtype: :class:`~.Instruction`
+	"""
+	base,pmask,mmask,stride = decode_automaton.stems[stem]
+	leaf = decode_automaton.leaves[base]
+	if mmask or leaf is None: return None
+	mnem,oplist,sse = leaf
+	ops = map(lambda o: exact_operand(AOTtoAOTDL[o.IntValue()]),oplist)
+	if any(map(lambda o: o is None,ops)): return None
+	return Instruction([],mnem,*ops)
+
+#: The shared :class:`~.Instruction` for each stem that 
+#: :func:`prebuild_instruction` could build, or ``None``.  These objects are 
+#: shared between every decoding of the stem, and must not be modified.
+prebuilt_instructions = map(prebuild_instruction,xrange(len(decode_automaton.stems)))
+
+def operand_method_name(enc):
+	"""Return the name of the :class:`X86Decoder` method that decodes *enc*.  
+	:class:`.RegOrMem` elements map to :meth:`X86Decoder.visit_RegOrMem`, whose
+	choice of method depends upon the ModRM.
+	
+	:param `.X86AOTDL` enc:
+	:rtype: string
+	"""
+	if isinstance(enc,ImmEnc):
+		op = enc.archetype
+		if isinstance(op,MemExpr):   return "visit_Immediate_MemExpr"
+		if isinstance(op,FarTarget): return "visit_Immediate_FarTarget"
+		return "visit_Immediate_%s" % op.__class__.__name__
+
+	# We have to special-case SegReg, since there are only 6 segment registers.
+	# We unify the logic for all other register types, as there are 8 possible
+	# registers for each other register type.
+	if isinstance(enc,GPart):
+		op = enc.archetype
+		if isinstance(op,SegReg):
+			return "visit_GPart_SegReg"
+
+	if isinstance(enc,SignedImm): 
+		return "visit_SignExtImm_%s" % enc.archetype.__class__.__name__
+
+	return "visit_" + enc.__class__.__name__
+
+def scan_window(w,start=0):
+	"""Check that the bytes in *w* from index *start* onwards begin with a 
+	valid instruction, and find its length, without reading from any stream or
+	raising an exception.  This is the decoder's only implementation of 
+	instruction decoding; everything else builds upon it.  At most 16 bytes 
+	are examined, so *w* may be a window holding just the instruction, or a 
+	larger buffer through which a linear sweep advances *start*.  The prefixes 
+	are interpreted by :func:`~.X86DecodeAutomaton.scan_prefixes`, and the 
+	layouts in :mod:`.X86OperandLayout` determine the bytes that follow the 
+	stem.  This function touches no shared state, so any number of threads may
+	call it at once.
+	
+	:param w: bytes, including the instruction
+	:type w: integer list
+	:param integer start: the index of the instruction's first byte
+	:rtype: (integer, integer, :class:`X86DecodeContext`)
+	:returns: A 3-tuple of a ``DECODE_`` status code; the length of the 
+		instruction (or upon failure, the number of bytes examined); and the 
+		state of the instruction, as far as it was decoded (or ``None`` if the
+		prefixes did not end within *w*).  The lengths in the state are counted 
+		from *start*.
+	"""
+	n = min(len(w),start+16)
+	short = DECODE_TOO_LONG if n-start >= 16 else DECODE_END_OF_STREAM
+	
+	# Prefixes, and the first byte of the stem.
+	r = scan_prefixes(w,start,n)
+	if r is None: return (short,n-start,None)
+	pfx,g1seq,segpfx,i = r
+	ctx = X86DecodeContext(pfx,g1seq,segpfx)
+	b = w[i]
+	i = i + 1
+	
+	# Stem, including the escape bytes.
+	stem = b
+	if b == 0x0F:
+		if i >= n: return (short,n-start,ctx)
+		b = w[i]
+		i = i + 1
+		if b == 0x38 or b == 0x3A:
+			if i >= n: return (short,n-start,ctx)
+			stem = (0x200 if b == 0x38 else 0x300) | w[i]
+			i = i + 1
+		else:
+			stem = 0x100 | b
+	ctx.stem,ctx.stemlen = stem,i-start
+	
+	# Look up the leaf, examining the ModRM byte if the entry depends upon it.
+	base,pmask,mmask,stride = decode_automaton.stems[stem]
+	mb,mk = None,0
+	if mmask:
+		if i >= n: return (short,n-start,ctx)
+		mb = w[i]
+		mk = modrm_key_byte(mb)
+	leaf = decode_automaton.leaves[base + (pfx & pmask)*stride + (mk & mmask)]
+	if leaf is None:
+		return (DECODE_UNDEFINED,(i if mb is None else i+1)-start,ctx)
+	
+	# Check the ModRM against each operand, and total the immediates.
+	layouts,length = operand_layouts[pfx & (PFX_OPSIZE|PFX_ADDRSIZE)],i
+	for o in leaf[1]:
+		modrm,immsize,kind = layouts[o.IntValue()]
+		if modrm:
+			if mb is None:
+				if i >= n: return (short,n-start,ctx)
+				mb = w[i]
+			if kind == OL_REGONLY and mb < 0xC0 or kind == OL_MEMONLY and mb >= 0xC0:
+				return (DECODE_UNDEFINED,i+1-start,ctx)
+			if kind == OL_SEGREG and mb>>3&7 > 5:
+				return (DECODE_BAD_SEGREG,i+1-start,ctx)
+		length = length + immsize
+	fixedlen = i
+	if mb is not None: 
+		addr16 = pfx & PFX_ADDRSIZE != 0
+		length = length + modrm_length(w,i,addr16)
+		fixedlen = i+2 if not addr16 and mb < 0xC0 and mb & 7 == 4 else i+1
+	
+	# Distinguish the 16-byte limit from a truncated stream.
+	if length > n:
+		return (DECODE_TOO_LONG if length-start > 16 else DECODE_END_OF_STREAM,n-start,ctx)
+	ctx.leaf,ctx.fixedlen = leaf,fixedlen-start
+	return (DECODE_OK,length-start,ctx)
+
+def branch_target(ea,bytes,pfx,oplist):
+	"""Return the destination of the branch displacement within the instruction
+	*bytes* at *ea*, or ``None`` if it does not have one.  The immediates follow
+	the ModRM in operand order, so they are located by working backwards from 
+	the end of the instruction.
+	
+	:param integer ea: the instruction's address
+	:param bytes: the instruction's bytes
+	:type bytes: integer list
+	:param integer pfx: the prefix state bits
+	:param oplist: the instruction's abstract operand types
+	:type oplist: :class:`~.AOTElt` list
+	:rtype: integer
+	"""
+	layouts,end = operand_layouts[pfx & (PFX_OPSIZE|PFX_ADDRSIZE)],len(bytes)
+	for o in reversed(oplist):
+		modrm,immsize,kind = layouts[o.IntValue()]
+		if kind == OL_JCC:
+			x = 0
+			for b in reversed(bytes[end-immsize:end]): x = x << 8 | b
+			if immsize == 1: x = sign_extend_8_32(x)
+			x = x + ea + len(bytes)
+			return x & 0xFFFF if pfx & PFX_ADDRSIZE else x & 0xFFFFFFFF
+		end = end - immsize
+	return None
+
+def group1_list(g1seq):
+	"""Return the Group #1 prefixes recorded two bits apiece in *g1seq* by 
+	:func:`~.X86DecodeAutomaton.scan_prefixes`, in the order in which they 
+	were consumed.
+	
+	:param integer g1seq:
+	:rtype: :class:`~.PF1Elt` list
+	"""
+	l = []
+	while g1seq:
+		l.append(group1_of_code[g1seq & 3])
+		g1seq = g1seq >> 2
+	l.reverse()
+	return l
+
+def decode_many(snippets,ea=0,decoder=None,lazy=False):
+	"""A generator decoding the first instruction of each of the byte strings 
+	*snippets*, as though each were located at *ea*.  No stream is built, nor 
+	any decoder beyond the first:  each snippet is checked directly by 
+	:func:`scan_window` (or, if *lazy* is set, passed to *decoder*'s 
+	:meth:`~X86Decoder.DecodeWindow`), so decoding a snippet costs no more 
+	than decoding an instruction within a stream.  Snippets longer than 16 
+	bytes are truncated.
+	
+	:param snippets: the snippets, each a list of integers, a string, or any
+		object from which a :class:`bytearray` can be built (a 
+		:class:`bytearray`, :class:`memoryview`, :class:`buffer`, ...)
+	:param integer ea: the address at which each snippet is decoded
+	:param `.X86Decoder` decoder: the decoder whose caches are used if *lazy*
+		is set, or ``None`` to use none
+	:param bool lazy: whether to yield :class:`X86LazyDecodedInstruction` 
+		objects rather than only their mnemonics
+	:rtype: (integer, integer, :class:`~.MnemElt`) generator
+	:returns: For each snippet, a 3-tuple of a ``DECODE_`` status code, the 
+		length of the instruction (or upon failure, the number of bytes 
+		examined), and its mnemonic (or upon failure, ``None``).  If *lazy* is
+		set, the third element is instead the decoded instruction, as returned
+		by :meth:`~X86Decoder.DecodeAt`.
+	"""
+	if lazy:
+		if decoder is None: decoder = X86Decoder(StreamObj([]))
+		decode = lambda w: decoder.DecodeWindow(ea,w)
+	else:
+		def decode(w):
+			status,length,ctx = scan_window(w)
+			return (status,length,ctx.leaf[0] if status == DECODE_OK else None)
+	for w in snippets:
+		if   isinstance(w,str):  w = map(ord,w[:16])
+		elif isinstance(w,list): w = w[:16]
+		else:                    w = list(bytearray(w[:16]))
+		yield decode(w)
+
+class X86DecodeContext(object):
+	"""The state of one instruction as decoded by :func:`scan_window`, kept 
+	apart from any :class:`X86Decoder` so that decoding does not modify shared
+	objects.
+	
+	:ivar integer pfx: the prefix state bits
+	:ivar integer g1seq: the Group #1 prefixes, encoded as in 
+		:func:`~.X86DecodeAutomaton.scan_prefixes`
+	:ivar `.SegElt` segpfx: the segment prefix, or ``None``
+	:ivar integer stem: the stem, or ``None`` if it was not reached
+	:ivar integer stemlen: the number of bytes occupied by the prefixes and stem
+	:ivar leaf: the :mod:`.X86DecodeAutomaton` leaf, or ``None`` unless the
+		instruction is valid
+	:ivar integer fixedlen: the number of bytes before the displacement and 
+		immediates, i.e. the prefixes, stem, ModRM, and SIB (valid only if the 
+		instruction is valid)
+	"""
+	__slots__ = ('pfx','g1seq','segpfx','stem','stemlen','leaf','fixedlen')
+	def __init__(self,pfx,g1seq,segpfx):
+		self.pfx,self.g1seq,self.segpfx = pfx,g1seq,segpfx
+		self.stem,self.stemlen,self.leaf,self.fixedlen = None,0,None,0
+
 class X86Decoder(Visitor):
 	def Reset(self):
 		"""Reset the variables held in the decoder."""
-		self.group1pfx = []
+		self.pfx     = 0
+		self.g1seq   = 0
+		self._group1pfx = None
 		self.sizepfx = False
 		self.addrpfx = False
 		self.segpfx  = None
 		self._modrm  = None
 		
-	def __init__(self,stream):
+	@property
+	def group1pfx(self):
+		"""The Group #1 prefixes, in the order in which they were consumed.  
+		:func:`~.X86DecodeAutomaton.scan_prefixes` only records them compactly,
+		two bits apiece, so the list is built the first time it is requested 
+		(generally, when an :class:`~.Instruction` is created).
+		
+		:rtype: :class:`~.PF1Elt` list
+		"""
+		if self._group1pfx is None:
+			self._group1pfx = group1_list(self.g1seq)
+		return self._group1pfx
+	@group1pfx.setter
+	def group1pfx(self,val):
+		self._group1pfx = val
+	
+	def Load(self,ctx):
+		"""Set the prefix variables from *ctx*, which may be an 
+		:class:`X86DecodeContext` or an :class:`X86LazyDecodedInstruction`.
+		
+		:param `.X86DecodeContext` ctx:
+		"""
+		self.pfx,self.g1seq,self.segpfx = ctx.pfx,ctx.g1seq,ctx.segpfx
+		self.sizepfx = ctx.pfx & PFX_OPSIZE   != 0
+		self.addrpfx = ctx.pfx & PFX_ADDRSIZE != 0
+		self._group1pfx = None
+		self._modrm = None
+	
+	def __init__(self,stream,cache=None,eacache=None,plans=None,compiled=None):
 		"""Set the stream object (from whence the bytes are consumed) and reset the
-		state."""
+		state.  If an :class:`~.X86DecodeCache` is given as *cache*, the 
+		:class:`~.Instruction` objects for decoded instructions are looked up 
+		there before being built, and added there afterwards.  If an 
+		:class:`~.X86AddressCache` is given as *eacache*, decoded instructions 
+		are looked up there by address before the stream is examined at all.  If
+		an :class:`~.X86PlanCache` is given as *plans*, instructions that share
+		their prefixes, stem, ModRM, and SIB with an earlier one are built from 
+		its :class:`~.X86DecodePlan`.  If an :class:`~.X86CompiledDecoder` is 
+		given as *compiled*, instructions are built by its generated functions
+		rather than by this class's methods."""
 		self.Stream = stream
+		self.cache = cache
+		self.eacache = eacache
+		self.plans = plans
+		self.compiled = compiled
 		self.Reset()
 	
 	def GetSegment(self):
@@ -54,42 +370,6 @@ class X86Decoder(Visitor):
 
 		return DS
 
-	def DecodePrefixes(self):
-		"""Consume all of the prefixes before the instruction stem, and update the
-		class variables accordingly.  When we consume a non-prefix byte, we stop
-		and return it.
-		
-		:rtype: integer
-		"""
-		while True:
-			b = self.Stream.Byte()
-			if   b == 0xF0: self.group1pfx.append(LOCK)
-			elif b == 0xF2: self.group1pfx.append(REPNE)
-			elif b == 0xF3: self.group1pfx.append(REP)
-			elif b == 0x2E: self.segpfx = CS
-			elif b == 0x36: self.segpfx = SS
-			elif b == 0x3E: self.segpfx = DS
-			elif b == 0x26: self.segpfx = ES
-			elif b == 0x64: self.segpfx = FS
-			elif b == 0x65: self.segpfx = GS
-			elif b == 0x66: self.sizepfx = True
-			elif b == 0x67: self.addrpfx = True
-			else:           return b
-		
-	def DecodeStem(self,first_byte):
-		"""Given the first byte of the stem (as read by DecodePrefixes above), examine
-		it and any subsequent escape bytes to determine the stem.
-		
-		:param integer first_byte:
-		:rtype: integer
-		:returns: A stem number from ``0x000-0x3FF``.
-		"""
-		if first_byte != 0x0F: return first_byte
-		second_byte = self.Stream.Byte()
-		if   second_byte == 0x38: return 0x200 | self.Stream.Byte()
-		elif second_byte == 0x3A: return 0x300 | self.Stream.Byte()
-		return 0x100 | second_byte
-
 	@property
 	def ModRM(self):
 		"""As in :class:`~.X86Encoder.X86Encoder`, the use of class properties 
@@ -110,34 +390,229 @@ class X86Decoder(Visitor):
 		
 		:param integer ea: The address from which to decode
 		:rtype: :class:`X86DecodedInstruction`
+		:raises: :exc:`~.InvalidInstruction` if the bytes do not decode to an 
+			instruction, or :exc:`IndexError` if the stream ends first.
 		"""		
-		# Reset the state of the class.
-		self.Reset()
-		
 		# Set the position within the stream.
 		self.Stream.SetPos(ea)
+		return self.DecodeCurrent()
+	
+	def DecodeCurrent(self):
+		"""Decode the instruction that begins at the stream's current position,
+		leaving the stream positioned just past it.  Linear sweeps can therefore
+		call this method repeatedly, without repositioning the stream.  This is a
+		wrapper around :meth:`DecodeCurrentStatus` that raises upon failure.
 		
-		# Consume prefixes and update prefix-related variables; consume stem.
-		stem = self.DecodeStem(self.DecodePrefixes())
+		:rtype: :class:`X86DecodedInstruction`
+		:raises: :exc:`~.InvalidInstruction` if the bytes do not decode to an 
+			instruction, or :exc:`IndexError` if the stream ends first.
+		"""
+		status,length,d = self.DecodeCurrentStatus()
+		if status == DECODE_OK: return d
+		if status == DECODE_END_OF_STREAM: raise IndexError()
+		raise InvalidInstruction()
+	
+	def DecodeStatus(self,ea):
+		"""Like :meth:`Decode`, but report failure through a status code rather 
+		than by raising an exception.
 		
-		# Find the entry for that stem in the decoding table.
-		entry = X86DecodeTable.decoding_table[stem]
+		:param integer ea: The address from which to decode
+		:rtype: (integer, integer, :class:`X86DecodedInstruction`)
+		:returns: See :meth:`DecodeCurrentStatus`.
+		"""
+		self.Stream.SetPos(ea)
+		return self.DecodeCurrentStatus()
+	
+	def DecodeCurrentStatus(self):
+		"""Decode the instruction that begins at the stream's current position,
+		reporting failure through a status code, via :meth:`DecodeAt`.  Upon
+		success, the stream is left positioned just past the instruction, and 
+		the decoder's prefix variables describe it; upon failure, the stream is
+		left at the instruction's beginning.
+		
+		:rtype: (integer, integer, :class:`X86LazyDecodedInstruction`)
+		:returns: See :meth:`DecodeAt`.
+		"""
+		stream = self.Stream
+		ea = stream.Pos()
+		status,length,d = self.DecodeAt(ea)
+		if d is None:
+			self.Reset()
+		else:
+			self.Load(d)
+			stream.SetPos(ea+length)
+		return (status,length,d)
+	
+	def DecodeAt(self,ea):
+		"""Decode the instruction at *ea*, reporting failure through a status 
+		code.  The instruction's bytes are read with 
+		:meth:`~.StreamObj.WindowAt` and checked by :func:`scan_window`, so that
+		no exception is constructed for undefined instructions, bad operands, or
+		the end of the stream.  Neither the decoder's variables nor the stream's
+		position are modified, so several threads may share one decoder and one
+		stream (though not an :class:`~.X86DecodeCache` or 
+		:class:`~.X86AddressCache` that is being written to).
+		
+		The operands are not decoded here.  Instead, the result records the 
+		instruction's bytes and its :class:`X86DecodeContext`, and builds its 
+		:class:`~.Instruction` the first time that it is requested; see 
+		:class:`X86LazyDecodedInstruction`.  If the instruction is found in 
+		:attr:`eacache`, it is returned as is.
 		
-		# Get the mnemonic and abstract operand type, if no exception is thrown.
-		mnem,oplist = entry.decode(self)
+		:param integer ea: The address from which to decode
+		:rtype: (integer, integer, :class:`X86LazyDecodedInstruction`)
+		:returns: A 3-tuple of a ``DECODE_`` status code; the instruction's 
+			length (or upon failure, the number of bytes examined); and the 
+			decoded instruction (or upon failure, ``None``).
+		"""
+		eacache = self.eacache
+		if eacache is not None:
+			d = eacache.Lookup(ea)
+			if d is not None: return (DECODE_OK,d.length,d)
+		status,length,d = self.DecodeWindow(ea,self.Stream.WindowAt(ea,16))
+		if d is not None and eacache is not None: eacache.Insert(d)
+		return (status,length,d)
+	
+	def DecodeWindow(self,ea,w,start=0):
+		"""Decode the instruction at index *start* of the bytes *w*, as though 
+		it were located at *ea*, without reading from the stream or consulting 
+		:attr:`eacache`.  Like :meth:`DecodeAt`, this method modifies neither the
+		decoder nor the stream.
+		
+		:param integer ea: The address of the instruction
+		:param w: bytes, including the instruction
+		:type w: integer list
+		:param integer start: the index of the instruction's first byte
+		:rtype: (integer, integer, :class:`X86LazyDecodedInstruction`)
+		:returns: See :meth:`DecodeAt`.
+		"""
+		status,length,ctx = scan_window(w,start)
+		if status != DECODE_OK: return (status,length,None)
 		
-		# Decode each operand using the visitor methods below.
-		ops = map(lambda o: self.visit(AOTtoAOTDL[o.IntValue()]),oplist)
+		# Without prefixes, fixed-operand instructions need not be built at all.
+		instr = None
+		if ctx.pfx == 0 and ctx.segpfx is None: 
+			instr = prebuilt_instructions[ctx.stem]
 		
-		# Create an Instruction object.
-		instr = Instruction(self.group1pfx,mnem,*ops)
+		return (status,length,X86LazyDecodedInstruction(ea,w[start:start+length],ctx,instr,self.cache,self.plans,self.compiled))
+	
+	def ScanWindow(self,w):
+		"""A wrapper around :func:`scan_window` that also updates the decoder's 
+		prefix variables from the :class:`X86DecodeContext` that it returns.
+		
+		:param w: up to 16 bytes, beginning at the instruction
+		:type w: integer list
+		:rtype: (integer, integer, integer, integer, tuple)
+		:returns: A 5-tuple of a ``DECODE_`` status code; the length of the 
+			instruction (or upon failure, the number of bytes examined); the stem
+			(or ``None``); the number of bytes occupied by the prefixes and stem; 
+			and the :mod:`.X86DecodeAutomaton` leaf (or upon failure, ``None``).
+		"""
+		status,length,ctx = scan_window(w)
+		if ctx is None: return (status,length,None,length,None)
+		self.Load(ctx)
+		stemlen = ctx.stemlen if ctx.stem is not None else length
+		return (status,length,ctx.stem,stemlen,ctx.leaf if status == DECODE_OK else None)
+	
+	def BuildInstruction(self,leaf):
+		"""Build the :class:`~.Instruction` whose prefixes and stem have been 
+		consumed, and which :func:`scan_window` found to select the 
+		:mod:`.X86DecodeAutomaton` *leaf*, by decoding its operands from the 
+		stream.
+		
+		:param leaf: the ``(mnem, oplist, sse)`` leaf
+		:rtype: :class:`~.Instruction`
+		"""
+		# SSE entries consume the Group #1 prefixes.
+		mnem,oplist,sse = leaf
+		if sse: self.group1pfx = []
 		
-		# Look at the stream position to calculate length.
-		final_ea = self.Stream.Pos()
+		# Decode each operand using the functions selected in advance for the 
+		# prefix state, rather than dispatching through visit().
+		decoders,ops = operand_decoders[self.pfx & (PFX_OPSIZE|PFX_ADDRSIZE)],[]
+		for o in oplist:
+			fn,d = decoders[o.IntValue()]
+			ops.append(fn(self,d))
 		
-		# Return the instruction with its address and length.
-		return X86DecodedInstruction(ea,instr,final_ea-ea)
+		# Create an Instruction object.
+		return Instruction(self.group1pfx,mnem,*ops)
 	
+	def DecodeRange(self,start,end,invalid=INVALID_SKIP,resync=None):
+		"""A generator performing a linear sweep from *start* to *end*, yielding
+		an :class:`X86DecodedInstruction` for each instruction that begins within
+		the range.  The bytes are read from the stream :data:`sweep_chunk` at a 
+		time with :meth:`~.StreamObj.WindowAt`, and each instruction is decoded 
+		by :meth:`DecodeWindow` at its offset within the chunk, so neither the 
+		decoder's variables nor the stream's position are touched, and the client
+		may use the decoder while the sweep is suspended.  If the stream counts 
+		its writes (as :class:`~.WritableStreamObj` does), the chunk is read 
+		again after any write, so that the sweep, and :attr:`eacache`, never see
+		stale bytes.  The sweep stops early if an instruction runs past the end 
+		of the stream.
+		
+		:param integer start: The address at which to begin
+		:param integer end: The address at which to stop (exclusive)
+		:param integer invalid: What to do upon an invalid instruction:
+			:data:`INVALID_SKIP` to skip one byte, :data:`INVALID_DATA` to yield an
+			:class:`~.X86DecodedData` for one byte, or :data:`INVALID_STOP` to stop.
+		:param `.X86Resync` resync: If not ``None``, an invalid instruction is 
+			followed by a jump to the address chosen by :meth:`~.X86Resync.Next`,
+			instead of the next byte; with :data:`INVALID_DATA`, an
+			:class:`~.X86DecodedData` is yielded for each byte skipped.
+		:rtype: :class:`X86DecodedInstruction` generator
+		"""
+		stream,eacache = self.Stream,self.eacache
+		ea,base,buf,writes = start,start,[],None
+		while ea < end:
+			# Refill the chunk if the instruction might run past it, or if the 
+			# stream was written to while the sweep was suspended.
+			off = ea - base
+			if off + 16 > len(buf) and (len(buf) == sweep_chunk or off >= len(buf)) or \
+			   getattr(stream,"writes",None) != writes:
+				base,off,buf = ea,0,stream.WindowAt(ea,sweep_chunk)
+				writes = getattr(stream,"writes",None)
+			
+			d = eacache.Lookup(ea) if eacache is not None else None
+			if d is not None: status,length = DECODE_OK,d.length
+			else:
+				status,length,d = self.DecodeWindow(ea,buf,off)
+				if d is not None and eacache is not None: eacache.Insert(d)
+			
+			if status == DECODE_END_OF_STREAM: return
+			if status != DECODE_OK:
+				if invalid == INVALID_STOP: return
+				nxt = ea + 1 if resync is None else resync.Next(self,ea,end)
+				if invalid == INVALID_DATA:
+					for b in stream.WindowAt(ea,nxt-ea):
+						ea = ea + 1
+						yield X86DecodedData(ea-1,b)
+				ea = nxt
+				continue
+			ea = ea + length
+			yield d
+
+	def DecodeLight(self,ea):
+		"""A lighter-weight alternative to :meth:`Decode`, for clients that only
+		need instruction boundaries and mnemonics.  No :class:`~.Operand`, 
+		:class:`~.Instruction`, or :class:`~.X86DecodedInstruction` objects are
+		created; the instruction is checked by :func:`scan_window`, and its 
+		branch target is read by :func:`branch_target`.  Like :meth:`DecodeAt`,
+		this method modifies neither the decoder nor the stream.
+		
+		:param integer ea: The address from which to decode
+		:rtype: (integer, :class:`~.MnemElt`, integer)
+		:returns: A 3-tuple of the instruction's length, its mnemonic, and its 
+			branch target (or ``None`` if it does not have a direct target).
+		:raises: :exc:`~.InvalidInstruction` or :exc:`IndexError` under the same
+			conditions as :meth:`Decode`.
+		"""
+		w = self.Stream.WindowAt(ea,16)
+		status,length,ctx = scan_window(w)
+		if status == DECODE_END_OF_STREAM: raise IndexError()
+		if status != DECODE_OK: raise InvalidInstruction()
+		mnem,oplist,sse = ctx.leaf
+		return (length,mnem,branch_target(ea,w[:length],ctx.pfx,oplist))
+
 	def MakeMethodName(self,enc):
 		"""We override this method from the :class:`~.Visitor.Visitor` class to
 		simplify the design.  We segregate the :class:`.ImmEnc`, 
@@ -147,28 +622,22 @@ class X86Decoder(Visitor):
 		:param `.X86AOTDL` enc:
 		:rtype: string
 		"""
-		if isinstance(enc,ImmEnc):
-			op = enc.archetype
-			if isinstance(op,MemExpr):   return "visit_Immediate_MemExpr"
-			if isinstance(op,FarTarget): return "visit_Immediate_FarTarget"
-			return "visit_Immediate_%s" % op.__class__.__name__
-
-		# We have to special-case SegReg, since there are only 6 segment registers.
-		# We unify the logic for all other register types, as there are 8 possible
-		# registers for each other register type.
-		if isinstance(enc,GPart):
-			op = enc.archetype
-			if isinstance(op,SegReg):
-				return "visit_GPart_SegReg"
-
 		if isinstance(enc,RegOrMem):
 			suffix = "Register" if self.ModRM.MOD == 3 else "MemExpr"
 			return "visit_RegOrMem_%s" % suffix
-		
-		if isinstance(enc,SignedImm): 
-			return "visit_SignExtImm_%s" % enc.archetype.__class__.__name__
+		return operand_method_name(enc)
 
-		return "visit_" + enc.__class__.__name__
+	def visit_RegOrMem(self,m):
+		"""Dispatch *m* to :meth:`visit_RegOrMem_Register` or 
+		:meth:`visit_RegOrMem_MemExpr`, depending upon the ModRM :attr:`.MOD` 
+		field.  :data:`operand_decoders` uses this method, since the choice cannot
+		be made before the ModRM has been consumed.
+		
+		:param `.RegOrMem` m:
+		:rtype: :class:`~.Operand`
+		"""
+		if self.ModRM.MOD == 3: return self.visit_RegOrMem_Register(m)
+		return self.visit_RegOrMem_MemExpr(m)
 
 	def visit_Exact(self,i):      
 		"""For Exact operand types, return *i*'s *value* field directly.
@@ -363,3 +832,159 @@ class X86Decoder(Visitor):
 		:rtype: :class:`.JccTarget`
 		"""
 		return self.oJCommon(sign_extend_8_32(self.Stream.Byte()))
+
+def make_operand_decoders(sizepfx,addrpfx):
+	"""Select, for every abstract operand type, the :class:`X86Decoder` method
+	that decodes it under fixed operand and address sizes.  The 
+	:class:`.SizePrefix` and :class:`.AddrPrefix` elements are resolved here,
+	once, rather than for every decoded operand.
+	
+	:param bool sizepfx:
+	:param bool addrpfx:
+	:rtype: (function, :class:`~.X86AOTDL`) list
+	:returns: For each :class:`~.AOTElt`, the unbound method and the element 
+		to pass it, or ``None``.
+	"""
+	def select(d):
+		if d is None: return None
+		while isinstance(d,SizePrefix) or isinstance(d,AddrPrefix):
+			if isinstance(d,SizePrefix): d = d.yes if sizepfx else d.no
+			else:                        d = d.yes if addrpfx else d.no
+		name = "visit_RegOrMem" if isinstance(d,RegOrMem) else operand_method_name(d)
+		return (getattr(X86Decoder,name).im_func,d)
+	return map(select,AOTtoAOTDL)
+
+#: Operand decoders indexed first by the prefix state bits 
+#: ``pfx & (PFX_OPSIZE|PFX_ADDRSIZE)``, then by :meth:`~.EnumElt.IntValue` of
+#: the :class:`~.AOTElt`.  See :func:`make_operand_decoders`.
+operand_decoders = map(lambda p: make_operand_decoders(bool(p & PFX_OPSIZE),bool(p & PFX_ADDRSIZE)),xrange(4))
+
+class X86LazyDecodedInstruction(X86DecodedInstruction):
+	"""An :class:`~.X86DecodedInstruction` that holds the instruction's bytes 
+	and the state of the decoder after its prefixes and stem, rather than 
+	:class:`~.Operand` objects.  :attr:`mnem` and :attr:`flow` are computed from
+	that state directly; :attr:`instr` is built by a fresh :class:`X86Decoder`
+	the first time it is requested, and kept thereafter.
+	
+	:ivar integer ea: the instruction's address
+	:ivar bytes: the instruction's bytes
+	:vartype bytes: integer list
+	:ivar integer length: the length of the instruction
+	:ivar integer pfx: the prefix state bits
+	:ivar integer g1seq: the Group #1 prefixes, encoded as in 
+		:func:`~.X86DecodeAutomaton.scan_prefixes`
+	:ivar `.SegElt` segpfx: the segment prefix, or ``None``
+	:ivar integer stem: the stem
+	:ivar integer stemlen: the number of bytes occupied by the prefixes and stem
+	:ivar leaf: the :mod:`.X86DecodeAutomaton` leaf for the instruction
+	:ivar integer fixedlen: the number of bytes before the displacement and 
+		immediates
+	:ivar `.X86DecodeCache` cache: the cache to consult for :attr:`instr`, or
+		``None``
+	:ivar `.X86PlanCache` plans: the plans to consult for :attr:`instr`, or
+		``None``
+	:ivar `.X86CompiledDecoder` compiled: the generated decoder that builds 
+		:attr:`instr`, or ``None``
+	"""
+	def __init__(self,ea,bytes,ctx,instr=None,cache=None,plans=None,compiled=None):
+		self.ea      = ea
+		self.bytes   = bytes
+		self.length  = len(bytes)
+		self.pfx     = ctx.pfx
+		self.g1seq   = ctx.g1seq
+		self.segpfx  = ctx.segpfx
+		self.stem    = ctx.stem
+		self.stemlen = ctx.stemlen
+		self.leaf    = ctx.leaf
+		self.fixedlen = ctx.fixedlen
+		self._instr  = instr
+		self._flow   = None
+		self.cache   = cache
+		self.plans   = plans
+		self.compiled = compiled
+	
+	@property
+	def mnem(self):
+		"""The instruction's mnemonic, which does not require :attr:`instr`.
+		
+		:rtype: :class:`~.MnemElt`
+		"""
+		return self.leaf[0]
+	
+	@property
+	def instr(self):
+		"""The :class:`~.Instruction`, decoded from :attr:`bytes` upon first 
+		access.  It is taken from :attr:`cache` (and rebased, if it has a branch 
+		target) if the same bytes have been decoded before; otherwise, it is 
+		built by :attr:`compiled` if there is one, or from a plan in 
+		:attr:`plans` if an instruction with the same :meth:`PlanKey` has been
+		decoded before.  Failing those, a decoder reads the operands from a 
+		:class:`~.BufferStreamObj` over the bytes, so that displacements and 
+		immediates are each read by a single :meth:`~.BufferStreamObj.Read`.
+		
+		:rtype: :class:`~.Instruction`
+		"""
+		if self._instr is None:
+			cache,plans = self.cache,self.plans
+			if cache is not None:
+				key = tuple(self.bytes)
+				instr = cache.Lookup(key)
+				if instr is not None:
+					taken = self.Target()
+					if taken is not None: 
+						instr = rebase_instruction(instr,taken,self.ea+self.length)
+					self._instr = instr
+					return instr
+			plan = None
+			if plans is not None and self.compiled is None:
+				plankey = self.PlanKey()
+				plan = plans.Lookup(plankey)
+			if self.compiled is not None:
+				self._instr = self.compiled.Build(self)
+			elif plan is not None:
+				self._instr = plan.Build(self.ea,self.bytes)
+			else:
+				decoder = X86Decoder(BufferStreamObj(bytearray(self.bytes),self.ea))
+				decoder.Load(self)
+				decoder.Stream.SetPos(self.ea+self.stemlen)
+				self._instr = decoder.BuildInstruction(self.leaf)
+				if plans is not None:
+					plan = X86DecodePlan(self._instr,self)
+					if plan.valid: plans.Insert(plankey,plan)
+			if cache is not None: cache.Insert(key,self._instr)
+		return self._instr
+	
+	def PlanKey(self):
+		"""Return the key under which an :class:`~.X86PlanCache` holds the plan 
+		for this instruction:  the prefix state, the stem, and the ModRM and SIB
+		bytes (i.e., everything that precedes the displacement and immediates).
+		
+		:rtype: tuple
+		"""
+		return (self.pfx,self.g1seq,self.segpfx,self.stem,tuple(self.bytes[self.stemlen:self.fixedlen]))
+	
+	@property
+	def flow(self):
+		"""The instruction's successor addresses, computed upon first access from
+		:attr:`mnem` and any branch displacement within :attr:`bytes`.
+		
+		:rtype: :class:`.FlowType`
+		"""
+		if self._flow is None:
+			self._flow = self.CreateFlow()
+		return self._flow
+	
+	def Target(self):
+		"""Return the destination of the instruction's branch displacement, or 
+		``None`` if it does not have one; see :func:`branch_target`.
+		
+		:rtype: integer
+		"""
+		return branch_target(self.ea,self.bytes,self.pfx,self.leaf[1])
+	
+	def CreateFlow(self):
+		"""As :meth:`~.X86DecodedInstruction.CreateFlow`, but using 
+		:meth:`Target` rather than :attr:`instr`."""
+		taken = self.Target()
+		nottaken = None if taken is None else self.ea + self.length
+		return self.CreateFlowFrom(self.mnem,taken,nottaken)
@@ -19,6 +19,35 @@ def little_endian_bytes(imm,n):
 	"""Return a list of *n* 8-bit integers from the bytes of *imm*"""
 	return map(lambda i: imm >> i*8 & 0xFF,xrange(n))
 
+def modrm_length(w,i,addr16):
+	"""Return the number of bytes occupied by the ModRM at index *i* of the list
+	of bytes *w*, along with any SIB byte and displacement that it specifies.  
+	This function never raises:  if the SIB byte lies beyond the end of *w*,
+	the ModRM and SIB alone are counted, which is already more than *w* holds.
+	
+	:param w: bytes beginning at the instruction
+	:type w: integer list
+	:param integer i: the index of the ModRM byte within *w*
+	:param bool addr16: ``True`` for a ModRM/16, ``False`` for a ModRM/32
+	:rtype: integer
+	"""
+	b = w[i]
+	mod,rm = b>>6,b&7
+	if mod == 3: return 1
+	if addr16:
+		if mod == 0: return 3 if rm == 6 else 1
+		return 1+mod
+	
+	n = 1
+	if rm == 4:
+		if i+1 >= len(w): return 2
+		n = 2
+		if mod == 0 and w[i+1] & 7 == 5: return 6
+	elif mod == 0 and rm == 5: return 5
+	if   mod == 1: n = n+1
+	elif mod == 2: n = n+4
+	return n
+
 #: The register values specified by the :attr:`~.RM` field of a 
 #: :class:`~.ModRM16` object.
 modrm_16 = [(Bx,Si),(Bx,Di),(Bp,Si),(Bp,Di),(Si,None),(Di,None),(Bp,None),(Bx,None)]
@@ -0,0 +1,82 @@
+"""This module describes the bytes that each abstract operand type occupies
+within an encoded instruction, without constructing any :class:`~.Operand`
+objects.  It is derived from :data:`.AOTtoAOTDL`, so that the AOTDL remains the
+source of truth.
+
+For every :class:`~.AOTElt` and every combination of the OPSIZE and ADDRSIZE
+prefixes, :data:`operand_layouts` holds a 3-tuple ``(modrm, immsize, kind)``:
+
+* *modrm* is ``True`` if the operand is encoded within the ModRM
+* *immsize* is the number of bytes the operand occupies after the ModRM
+* *kind* is one of the ``OL_`` constants below, describing any further
+  constraint or interpretation of the operand's bytes
+"""
+
+from X86 import *
+from X86InternalOperandDescriptions import *
+from X86DecodeAutomaton import PFX_OPSIZE, PFX_ADDRSIZE
+from Pandemic.Util.Visitor import Visitor
+
+#: No constraint upon the operand.
+OL_PLAIN   = 0
+#: The ModRM must specify a register (:attr:`~.MOD` is ``3``).
+OL_REGONLY = 1
+#: The ModRM must specify memory (:attr:`~.MOD` is not ``3``).
+OL_MEMONLY = 2
+#: The ModRM :attr:`~.GGG` field must name a segment register (``0-5``).
+OL_SEGREG  = 3
+#: The immediate is a branch displacement; it is sign-extended if 1 byte long.
+OL_JCC     = 4
+
+class X86AOTDLLayout(Visitor):
+	"""This :class:`~.Visitor` computes the ``(modrm, immsize, kind)`` layout
+	of an :class:`~.X86AOTDL` element, for fixed operand and address sizes.
+
+	:ivar bool sizepfx: whether the OPSIZE prefix is present
+	:ivar bool addrpfx: whether the ADDRSIZE prefix is present
+	"""
+	def __init__(self,sizepfx,addrpfx):
+		self.sizepfx = sizepfx
+		self.addrpfx = addrpfx
+
+	def visit_Exact(self,e):    return (False,0,OL_PLAIN)
+	def visit_ExactSeg(self,e): return (False,0,OL_PLAIN)
+
+	def visit_GPart(self,g):
+		return (True,0,OL_SEGREG if isinstance(g.archetype,SegReg) else OL_PLAIN)
+
+	def visit_RegOrMem(self,m):
+		if m.reg is None: return (True,0,OL_MEMONLY)
+		if m.mem is None: return (True,0,OL_REGONLY)
+		return (True,0,OL_PLAIN)
+
+	def visit_ImmEnc(self,i):
+		a = i.archetype
+		if isinstance(a,JccTarget): return (False,2 if self.addrpfx else 4,OL_JCC)
+		if isinstance(a,MemExpr):   return (False,2 if self.addrpfx else 4,OL_PLAIN)
+		if isinstance(a,FarTarget): return (False,4 if self.addrpfx else 6,OL_PLAIN)
+		if isinstance(a,Ib):        return (False,1,OL_PLAIN)
+		if isinstance(a,Iw):        return (False,2,OL_PLAIN)
+		return (False,4,OL_PLAIN)
+
+	def visit_SignedImm(self,i):
+		return (False,1,OL_JCC if isinstance(i.archetype,JccTarget) else OL_PLAIN)
+
+	def visit_SizePrefix(self,z): return self.visit(z.yes if self.sizepfx else z.no)
+	def visit_AddrPrefix(self,a): return self.visit(a.yes if self.addrpfx else a.no)
+
+def make_layouts(sizepfx,addrpfx):
+	"""Compute the layouts of every abstract operand type for fixed operand and
+	address sizes.
+
+	:param bool sizepfx:
+	:param bool addrpfx:
+	:rtype: (bool, integer, integer) list
+	"""
+	v = X86AOTDLLayout(sizepfx,addrpfx)
+	return map(lambda d: None if d is None else v.visit(d),AOTtoAOTDL)
+
+#: Operand layouts indexed first by the prefix state bits
+#: ``pfx & (PFX_OPSIZE|PFX_ADDRSIZE)``, then by :meth:`~.EnumElt.IntValue` of
+#: the :class:`~.AOTElt`.
+operand_layouts = map(lambda p: make_layouts(bool(p & PFX_OPSIZE),bool(p & PFX_ADDRSIZE)),xrange(4))
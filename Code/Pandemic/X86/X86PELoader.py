@@ -0,0 +1,304 @@
+"""This module loads PE32 images (executables and DLLs) for decoding.  An
+:class:`X86PEImage` parses the headers and section table of a file, and maps
+each section's raw data into a :class:`~.SegmentedStreamObj` at its virtual
+address, so that an :class:`~.X86Decoder.X86Decoder` built upon
+:attr:`~X86PEImage.Stream` decodes the image at the addresses that it would
+occupy in memory.  The file is memory-mapped, and the regions are
+:class:`buffer` objects over the mapping, so no section data is copied or read
+until it is decoded; loading even a large DLL reads only its headers and its
+export and import directories.
+
+The image's entry point, its exports, and its import address table are
+available as :attr:`~X86PEImage.entry`, :attr:`~X86PEImage.exports`, and
+:attr:`~X86PEImage.imports`.  :meth:`~X86PEImage.StartPoints` lists the
+addresses at which decoding may begin, and :meth:`~X86PEImage.Symbols` names
+the addresses that the image defines or imports.
+
+Bytes beyond a section's raw data (its uninitialized tail, which the system
+loader fills with zeroes) are not mapped, so decoding them fails as though the
+stream had ended.
+"""
+
+import mmap, struct
+from X86ByteStream import SegmentedStreamObj
+
+#: The ``Machine`` field of an image for the i386.
+IMAGE_FILE_MACHINE_I386 = 0x14C
+#: The ``Magic`` field of a PE32 optional header.
+IMAGE_NT_OPTIONAL_HDR32_MAGIC = 0x10B
+#: Section characteristic:  the section contains code.
+IMAGE_SCN_CNT_CODE = 0x00000020
+#: Section characteristic:  the section is executable.
+IMAGE_SCN_MEM_EXECUTE = 0x20000000
+#: The index of the export directory among the data directories.
+IMAGE_DIRECTORY_ENTRY_EXPORT = 0
+#: The index of the import directory among the data directories.
+IMAGE_DIRECTORY_ENTRY_IMPORT = 1
+
+#: The longest name read from the image.
+max_name_length = 512
+
+class PEFormatError(Exception):
+	"""This exception is raised when a file is not a well-formed PE32 image."""
+	def __init__(self,str):
+		self.str = str
+	def __str__(self):
+		return self.str
+
+def align_up(x,alignment):
+	"""Return *x* rounded up to a multiple of *alignment*, or *x* itself if
+	*alignment* is ``0``.
+
+	:param integer x:
+	:param integer alignment:
+	:rtype: integer
+	"""
+	if alignment <= 0: return x
+	return (x + alignment - 1) // alignment * alignment
+
+class X86PESection(object):
+	"""One entry of an image's section table.
+
+	:ivar string name: the section's name
+	:ivar integer ea: the section's virtual address
+	:ivar integer vsize: the section's size in memory
+	:ivar integer rawoffset: the offset of the section's data within the file
+	:ivar integer rawsize: the size of the section's data within the file
+	:ivar integer characteristics: the section's ``IMAGE_SCN_`` flags
+	"""
+	def __init__(self,name,ea,vsize,rawoffset,rawsize,characteristics):
+		self.name = name
+		self.ea = ea
+		self.vsize = vsize
+		self.rawoffset = rawoffset
+		self.rawsize = rawsize
+		self.characteristics = characteristics
+
+	def IsCode(self):
+		"""Return ``True`` if the section holds code or is executable.
+
+		:rtype: bool
+		"""
+		return self.characteristics & (IMAGE_SCN_CNT_CODE|IMAGE_SCN_MEM_EXECUTE) != 0
+
+	def __repr__(self):
+		return "X86PESection(%r,0x%x,0x%x)" % (self.name,self.ea,self.vsize)
+
+class X86PEImage(object):
+	"""The PE32 image in the file *path*, mapped for decoding.
+
+	:ivar string path: the file
+	:ivar `.SegmentedStreamObj` Stream: the image's bytes at their virtual
+		addresses
+	:ivar integer base: the image's preferred base address
+	:ivar integer entry: the virtual address of the entry point, or ``None`` if
+		there is none (as in many DLLs)
+	:ivar integer size: the size of the image in memory
+	:ivar sections: the section table
+	:vartype sections: :class:`X86PESection` list
+	:ivar exports: ``(ordinal, name, ea)`` for each exported function, where
+		*name* is ``None`` for functions exported by ordinal only; forwarded
+		exports are omitted
+	:ivar imports: ``(ea, dll, name)`` for each entry of the import address
+		table, where *ea* is the address of the entry and *name* is an integer
+		for functions imported by ordinal
+	:raises: :exc:`PEFormatError` if the file is not a PE32 image.
+	"""
+	def __init__(self,path):
+		self.path = path
+		with open(path,"rb") as f:
+			try:
+				self.data = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+			except (ValueError,EnvironmentError):
+				self.data = f.read()
+		self.Stream = SegmentedStreamObj()
+		self.ParseHeaders()
+		self.MapSections()
+		self.exports = self.ParseExports()
+		self.imports = self.ParseImports()
+
+	def Close(self):
+		"""Unmap the file.  Neither the image nor its :attr:`Stream` may be read
+		afterwards."""
+		if isinstance(self.data,mmap.mmap): self.data.close()
+
+	def Unpack(self,fmt,offset):
+		"""Unpack the structure *fmt* at *offset* within the file.
+
+		:param string fmt: a :mod:`struct` format
+		:param integer offset:
+		:rtype: tuple
+		:raises: :exc:`PEFormatError` if the file ends first.
+		"""
+		if offset < 0 or offset + struct.calcsize(fmt) > len(self.data):
+			raise PEFormatError("%s: truncated header at offset 0x%x" % (self.path,offset))
+		return struct.unpack_from(fmt,self.data,offset)
+
+	def ParseHeaders(self):
+		"""Read the DOS, COFF, and optional headers, and the section table."""
+		if self.Unpack("<2s",0)[0] != "MZ":
+			raise PEFormatError("%s: no MZ signature" % self.path)
+		pe = self.Unpack("<L",0x3C)[0]
+		if self.Unpack("<4s",pe)[0] != "PE\0\0":
+			raise PEFormatError("%s: no PE signature" % self.path)
+		machine,nsections,_,_,_,optsize,_ = self.Unpack("<HHLLLHH",pe+4)
+		if machine != IMAGE_FILE_MACHINE_I386:
+			raise PEFormatError("%s: machine 0x%x is not i386" % (self.path,machine))
+		opt = pe + 24
+		if optsize < 96 or self.Unpack("<H",opt)[0] != IMAGE_NT_OPTIONAL_HDR32_MAGIC:
+			raise PEFormatError("%s: not a PE32 optional header" % self.path)
+
+		entry,  = self.Unpack("<L",opt+16)
+		self.base,self.salign,self.falign = self.Unpack("<LLL",opt+28)
+		self.size,self.hdrsize = self.Unpack("<LL",opt+56)
+		self.entry = self.base + entry if entry else None
+
+		# The data directories, as (RVA, size) pairs.
+		ndirs = min(self.Unpack("<L",opt+92)[0],(optsize-96) // 8)
+		self.directories = map(lambda i: self.Unpack("<LL",opt+96+8*i),xrange(ndirs))
+
+		self.sections = []
+		for i in xrange(nsections):
+			name,vsize,rva,rawsize,rawoffset = self.Unpack("<8sLLLL",opt+optsize+40*i)
+			flags, = self.Unpack("<L",opt+optsize+40*i+36)
+			self.sections.append(X86PESection(name.rstrip("\0"),self.base+rva,vsize,rawoffset,rawsize,flags))
+		self.sections.sort(key=lambda s: s.ea)
+
+	def MapSections(self):
+		"""Add a region to :attr:`Stream` for the headers and for each section's
+		raw data, clipped to the section's aligned size, to the start of the
+		following section, and to the end of the file."""
+		n = len(self.data)
+		regions = [(self.base,0,self.hdrsize)]
+		for s in self.sections:
+			size = s.rawsize
+			if s.vsize: size = min(size,align_up(s.vsize,self.salign))
+			regions.append((s.ea,s.rawoffset,size))
+		for i,(ea,offset,size) in enumerate(regions):
+			if i+1 < len(regions): size = min(size,regions[i+1][0]-ea)
+			size = min(size,n-offset)
+			if size > 0:
+				self.Stream.AddRegion(ea,buffer(self.data,offset,size))
+
+	def Dword(self,ea):
+		"""Return the dword at the virtual address *ea*.
+
+		:param integer ea:
+		:rtype: integer
+		:raises: :exc:`PEFormatError` if the dword is not mapped.
+		"""
+		w = self.Stream.WindowAt(ea,4)
+		if len(w) < 4:
+			raise PEFormatError("%s: address 0x%x is not mapped" % (self.path,ea))
+		return w[0] | w[1] << 8 | w[2] << 16 | w[3] << 24
+
+	def String(self,ea):
+		"""Return the NUL-terminated string at the virtual address *ea*.
+
+		:param integer ea:
+		:rtype: string
+		"""
+		w = self.Stream.WindowAt(ea,max_name_length)
+		if 0 in w: w = w[:w.index(0)]
+		return str(bytearray(w))
+
+	def Directory(self,i):
+		"""Return the virtual address and size of data directory *i*, or
+		``None`` if the image does not have it.
+
+		:param integer i: an ``IMAGE_DIRECTORY_ENTRY_`` index
+		:rtype: (integer, integer)
+		"""
+		if i >= len(self.directories): return None
+		rva,size = self.directories[i]
+		if rva == 0: return None
+		return (self.base+rva,size)
+
+	def ParseExports(self):
+		"""Read the export directory.
+
+		:rtype: (integer, string, integer) list
+		:returns: See :attr:`exports`.
+		"""
+		d = self.Directory(IMAGE_DIRECTORY_ENTRY_EXPORT)
+		if d is None: return []
+		ea,size = d
+		ordbase,nfuncs,nnames,funcs,names,ordinals = map(lambda i: self.Dword(ea+16+4*i),xrange(6))
+		byindex = {}
+		for i in xrange(nnames):
+			name = self.String(self.base+self.Dword(self.base+names+4*i))
+			w = self.Stream.WindowAt(self.base+ordinals+2*i,2)
+			if len(w) == 2: byindex[w[0] | w[1] << 8] = name
+		exports = []
+		for i in xrange(nfuncs):
+			rva = self.Dword(self.base+funcs+4*i)
+			# Forwarders point to strings within the export directory.
+			if rva == 0 or ea <= self.base+rva < ea+size: continue
+			exports.append((ordbase+i,byindex.get(i),self.base+rva))
+		return exports
+
+	def ParseImports(self):
+		"""Read the import directory.
+
+		:rtype: (integer, string, object) list
+		:returns: See :attr:`imports`.
+		"""
+		d = self.Directory(IMAGE_DIRECTORY_ENTRY_IMPORT)
+		if d is None: return []
+		imports,desc = [],d[0]
+		while True:
+			lookup,_,_,name,iat = map(lambda i: self.Dword(desc+4*i),xrange(5))
+			if lookup == 0 and name == 0 and iat == 0: break
+			dll = self.String(self.base+name)
+			lookup = self.base + (lookup if lookup else iat)
+			i = 0
+			while True:
+				x = self.Dword(lookup+4*i)
+				if x == 0: break
+				if x & 0x80000000: func = x & 0xFFFF
+				else:              func = self.String(self.base+x+2)
+				imports.append((self.base+iat+4*i,dll,func))
+				i = i + 1
+			desc = desc + 20
+		return imports
+
+	def Section(self,ea):
+		"""Return the section containing the virtual address *ea*, or ``None``.
+
+		:param integer ea:
+		:rtype: :class:`X86PESection`
+		"""
+		for s in self.sections:
+			if s.ea <= ea < s.ea + max(s.vsize,s.rawsize): return s
+		return None
+
+	def StartPoints(self):
+		"""Return the addresses at which decoding may begin:  the entry point,
+		and the exports that lie within code sections.
+
+		:rtype: integer list
+		"""
+		eas = map(lambda e: e[2],self.exports)
+		if self.entry is not None: eas.append(self.entry)
+		starts = set()
+		for ea in eas:
+			s = self.Section(ea)
+			if s is not None and s.IsCode(): starts.add(ea)
+		return sorted(starts)
+
+	def Symbols(self):
+		"""Return a dictionary naming the addresses that the image defines or
+		imports:  the entry point (``"start"``), each export (by name, or as
+		``"ordinal_<n>"``), and each entry of the import address table (as
+		``"<dll>!<name>"``, or ``"<dll>!ordinal_<n>"``).
+
+		:rtype: dict
+		"""
+		symbols = {}
+		for ea,dll,func in self.imports:
+			if not isinstance(func,str): func = "ordinal_%d" % func
+			symbols[ea] = "%s!%s" % (dll,func)
+		for ordinal,name,ea in self.exports:
+			symbols[ea] = name if name is not None else "ordinal_%d" % ordinal
+		if self.entry is not None: symbols.setdefault(self.entry,"start")
+		return symbols
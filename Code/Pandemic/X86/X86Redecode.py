@@ -0,0 +1,162 @@
+"""This module re-disassembles a range of code after some of its bytes have
+been patched, without sweeping the entire range again.  Given the results of
+an earlier linear sweep (as produced by :meth:`~.X86Decoder.DecodeRange`) and
+the patched address ranges, :func:`redecode_range` sweeps again only from a
+little before each patch, and stops as soon as the new instruction boundaries
+line up with the old ones beyond it.  From that point onwards, the old and new
+sweeps read the same bytes, and so must agree.  The result is an
+:class:`X86RangeDiff`, listing the instructions removed and added around each
+patch.
+
+Decoding a valid instruction examines only its own bytes, but deciding that
+the bytes at some address are undefined may examine up to 16 of them, so the
+new sweep begins at least 15 bytes before each patch.
+"""
+
+from X86 import *
+from X86Decoder import INVALID_SKIP
+
+def first_ending_after(old,ea):
+	"""Return the index of the first element of *old* that ends after *ea*, or
+	``len(old)`` if there is none.  The elements must be sorted by address and
+	must not overlap.
+
+	:param old: decoded instructions (or :class:`~.X86DecodedData` objects)
+	:type old: :class:`~.X86DecodedInstruction` list
+	:param integer ea:
+	:rtype: integer
+	"""
+	lo,hi = 0,len(old)
+	while lo < hi:
+		mid = (lo+hi) >> 1
+		d = old[mid]
+		if d.ea + d.length <= ea: lo = mid+1
+		else:                     hi = mid
+	return lo
+
+def same_element(a,b):
+	"""Return ``True`` if the sweep elements *a* and *b* occupy the same bytes,
+	and are both instructions or both :class:`~.X86DecodedData` objects.
+
+	:param `.X86DecodedInstruction` a:
+	:param `.X86DecodedInstruction` b:
+	:rtype: bool
+	"""
+	return a.ea == b.ea and a.length == b.length and \
+		isinstance(a,X86DecodedData) == isinstance(b,X86DecodedData)
+
+def merge_ranges(ranges):
+	"""Sort the address ranges *ranges* and merge those that overlap or touch.
+
+	:param ranges: ``(start, end)`` pairs, with *end* exclusive
+	:type ranges: (integer, integer) list
+	:rtype: (integer, integer) list
+	"""
+	merged = []
+	for s,e in sorted(filter(lambda (s,e): s < e,ranges)):
+		if merged and s <= merged[-1][1]:
+			merged[-1] = (merged[-1][0],max(merged[-1][1],e))
+		else:
+			merged.append((s,e))
+	return merged
+
+class X86RangeDiff(object):
+	"""The differences between two linear sweeps of the same range.
+
+	:ivar hunks: ``(i, j, added)`` triples, in order, each meaning that the old
+		elements ``old[i:j]`` were replaced by the list *added*
+	"""
+	def __init__(self):
+		self.hunks = []
+
+	def Removed(self,old):
+		"""Return the elements of *old* that were removed.
+
+		:param old: the sweep that was passed to :func:`redecode_range`
+		:type old: :class:`~.X86DecodedInstruction` list
+		:rtype: :class:`~.X86DecodedInstruction` list
+		"""
+		removed = []
+		for i,j,added in self.hunks: removed.extend(old[i:j])
+		return removed
+
+	def Added(self):
+		"""Return the elements that were added.
+
+		:rtype: :class:`~.X86DecodedInstruction` list
+		"""
+		added = []
+		for i,j,a in self.hunks: added.extend(a)
+		return added
+
+	def Apply(self,old):
+		"""Return the new sweep, i.e. *old* with every hunk applied.
+
+		:param old: the sweep that was passed to :func:`redecode_range`
+		:type old: :class:`~.X86DecodedInstruction` list
+		:rtype: :class:`~.X86DecodedInstruction` list
+		"""
+		new,k = [],0
+		for i,j,added in self.hunks:
+			new.extend(old[k:i])
+			new.extend(added)
+			k = j
+		new.extend(old[k:])
+		return new
+
+def redecode_range(decoder,old,start,end,patches,invalid=INVALID_SKIP):
+	"""Given *old*, the result of sweeping from *start* to *end* with
+	:meth:`~.X86Decoder.DecodeRange` and *invalid*, re-decode the parts of the
+	range affected by the patched address ranges *patches*, whose new bytes
+	*decoder*'s stream must already hold.  (If *decoder* has an
+	:class:`~.X86AddressCache`, the patches must have been written through a
+	:class:`~.WritableStreamObj`, so that the stale entries were discarded.)
+
+	Around each patch, the new sweep stops at the first instruction that
+	begins at or after the end of the patch, at the address of some element of
+	*old*, with no patched byte among the 16 bytes that follow.
+
+	:param `.X86Decoder.X86Decoder` decoder:
+	:param old: the old sweep
+	:type old: :class:`~.X86DecodedInstruction` list
+	:param integer start: the address at which the old sweep began
+	:param integer end: the address at which the old sweep stopped (exclusive)
+	:param patches: ``(start, end)`` pairs, with *end* exclusive
+	:type patches: (integer, integer) list
+	:param integer invalid: as in :meth:`~.X86Decoder.DecodeRange`
+	:rtype: :class:`X86RangeDiff`
+	"""
+	patches = merge_ranges(patches)
+	def clean(ea):
+		return all(map(lambda (s,e): e <= ea or s >= ea+16,patches))
+
+	diff,n,k,synced = X86RangeDiff(),len(old),0,start
+	for ps,pe in patches:
+		if pe <= synced: continue
+		if k == n and diff.hunks: break
+
+		# Restart from the end of an old element, at least 15 bytes before the
+		# patch, and not within the previous hunk.
+		i = max(first_ending_after(old,ps-15),k)
+		if   i > k:  r = old[i-1].ea + old[i-1].length
+		elif k == 0: r = start
+		else:        r = old[k].ea
+		r = max(r,start)
+
+		added,j = [],i
+		for d in decoder.DecodeRange(r,end,invalid):
+			while j < n and old[j].ea < d.ea: j = j+1
+			if d.ea >= pe and j < n and old[j].ea == d.ea and clean(d.ea): break
+			added.append(d)
+		else:
+			j = n
+
+		# The elements that end before the patch were decoded from the same
+		# bytes, so the hunk need not include them.
+		m = 0
+		while m < len(added) and i < j and old[i].ea+old[i].length <= ps and same_element(old[i],added[m]):
+			i,m = i+1,m+1
+		diff.hunks.append((i,j,added[m:]))
+		k = j
+		synced = old[j].ea if j < n else end
+	return diff
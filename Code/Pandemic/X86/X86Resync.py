@@ -0,0 +1,144 @@
+"""This module provides :class:`X86Resync`, which lets a linear sweep recover
+quickly after it runs into data.  Rather than skipping one byte at a time past
+an undefined instruction, and decoding whatever follows as though it were
+code, :meth:`~.X86Decoder.X86Decoder.DecodeRange` asks its :class:`X86Resync`
+where to continue.  :meth:`X86Resync.Next` decodes a short chain of
+instructions from each of the following offsets, scores each chain, and
+returns the offset whose chain scored best.
+
+A chain's score rewards each valid instruction, penalizes mnemonics that seldom
+occur in compiled code (privileged, I/O, and BCD instructions, and the like),
+rewards direct branches that land on the chain's own instruction boundaries,
+and penalizes those that land between them.  A chain that runs into an
+undefined instruction is penalized heavily.
+
+Chains that begin at different offsets often converge upon the same
+instruction boundaries; from then onwards they are identical, so each address
+is decoded only once per resynchronization.  The number of candidates whose
+chains converge with the chosen one is a measure of confidence in the choice,
+and is recorded along with the other statistics in the :class:`X86Resync`.
+"""
+
+from X86 import *
+from X86Decoder import scan_window, branch_target, DECODE_OK
+
+#: The :meth:`~.EnumElt.IntValue` of mnemonics that rarely appear in compiled
+#: user-mode code, and so suggest that a chain is decoding data.
+implausible_mnemonics = frozenset(map(lambda m: m.IntValue(),[
+	In,Out,Insb,Insw,Insd,Outsb,Outsw,Outsd,Hlt,Cli,Sti,Into,Icebp,Arpl,Bound,
+	Aaa,Aas,Daa,Das,Aam,Aad,Salc,Lds,Les,Xlat,Sahf,Lahf,Cmc,Wait,Iretd,Iretw,
+	Retf,Clts,Invd,Wbinvd,Rdmsr,Wrmsr,Rsm,Lldt,Ltr]))
+
+#: The :meth:`~.EnumElt.IntValue` of mnemonics after which a chain ends,
+#: because control does not pass to the next instruction.
+chain_enders = frozenset(map(lambda m: m.IntValue(),[Jmp,JmpF,Ret,Retf,Iretd,Iretw]))
+
+class X86Resync(object):
+	"""Chooses where a linear sweep continues after an undefined instruction.
+	The candidates are the *window* offsets following the undefined
+	instruction; from each, a chain of at most *depth* instructions is
+	decoded and scored.
+
+	:ivar integer window: the number of candidate offsets
+	:ivar integer depth: the maximum length of each chain
+	:ivar integer resyncs: the number of calls to :meth:`Next`
+	:ivar integer skipped: the total number of bytes skipped
+	:ivar integer decodes: the total number of addresses decoded
+	:ivar integer candidates: the total number of candidates scored
+	:ivar integer converged: the total number of candidates whose chains
+		converged with the chosen one
+	:ivar events: ``(ea, next, score, converged)`` for each call to
+		:meth:`Next`
+	"""
+	def __init__(self,window=16,depth=8):
+		self.window = window
+		self.depth = depth
+		self.Clear()
+
+	def Clear(self):
+		"""Reset the statistics."""
+		self.resyncs = 0
+		self.skipped = 0
+		self.decodes = 0
+		self.candidates = 0
+		self.converged = 0
+		self.events = []
+
+	def Decode(self,stream,ea,memo):
+		"""Return ``(length, mnem, target)`` for the instruction at *ea*, or
+		``None`` if it is undefined, decoding it only if it is not in *memo*.
+
+		:param `.StreamObj` stream:
+		:param integer ea:
+		:param dict memo:
+		:rtype: (integer, integer, integer)
+		"""
+		if ea in memo: return memo[ea]
+		self.decodes = self.decodes + 1
+		w = stream.WindowAt(ea,16)
+		status,length,ctx = scan_window(w)
+		r = None
+		if status == DECODE_OK:
+			mnem,oplist,sse = ctx.leaf
+			r = (length,mnem.IntValue(),branch_target(ea,w[:length],ctx.pfx,oplist))
+		memo[ea] = r
+		return r
+
+	def Chain(self,stream,ea,end,memo):
+		"""Decode a chain of instructions from *ea*, stopping before *end*, and
+		score it.
+
+		:param `.StreamObj` stream:
+		:param integer ea:
+		:param integer end:
+		:param dict memo: the instructions decoded so far
+		:rtype: (integer, integer list)
+		:returns: The score, and the addresses of the chain's instructions.
+		"""
+		score,boundaries,targets = 0,[],[]
+		while len(boundaries) < self.depth and ea < end:
+			r = self.Decode(stream,ea,memo)
+			if r is None:
+				score = score - 2*self.depth
+				break
+			length,mnem,target = r
+			boundaries.append(ea)
+			score = score + (-2 if mnem in implausible_mnemonics else 1)
+			if target is not None: targets.append(target)
+			ea = ea + length
+			if mnem in chain_enders: break
+		if boundaries:
+			lo,starts = boundaries[0],frozenset(boundaries)
+			for t in targets:
+				if   t in starts:      score = score + 2
+				elif lo <= t < ea:     score = score - 1
+		return (score,boundaries)
+
+	def Next(self,decoder,ea,end):
+		"""Choose the address at which a sweep that found an undefined
+		instruction at *ea* should continue:  the candidate whose chain scores
+		best, or, among equals, the nearest.
+
+		:param `.X86Decoder.X86Decoder` decoder: the sweeping decoder, whose
+			stream is read through :meth:`~.StreamObj.WindowAt`
+		:param integer ea: the address of the undefined instruction
+		:param integer end: the end of the sweep (exclusive)
+		:rtype: integer
+		"""
+		stream,memo,chains = decoder.Stream,{},[]
+		for c in xrange(ea+1,min(ea+1+self.window,end)):
+			score,boundaries = self.Chain(stream,c,end,memo)
+			chains.append((score,-c,boundaries))
+		if not chains:
+			best,score,converged = end,0,0
+		else:
+			score,c,boundaries = max(chains)
+			best,starts = -c,frozenset(boundaries)
+			converged = sum(map(lambda (s,o,b): -o != best and any(map(lambda a: a in starts,b)),chains))
+
+		self.resyncs = self.resyncs + 1
+		self.skipped = self.skipped + best - ea
+		self.candidates = self.candidates + len(chains)
+		self.converged = self.converged + converged
+		self.events.append((ea,best,score,converged))
+		return best
@@ -0,0 +1,150 @@
+"""This module provides :class:`X86Superset`, which performs superset
+disassembly:  it decodes an instruction at every offset within a range of
+addresses, rather than along a single linear path, so that every possible
+instruction boundary can be examined.  This is useful against obfuscated code,
+and for recovering instruction boundaries in the first place.
+
+Each offset is decoded exactly once, with :meth:`~.X86Decoder.DecodeStatus`,
+and the results are stored in compact :mod:`array` objects indexed by the
+offset from the beginning of the range, rather than as
+:class:`~.X86DecodedInstruction` objects.  Offsets that do not begin a valid
+instruction have length ``0``.  The fall-through successor of each instruction
+is also an offset into the same arrays, so the instruction sequences beginning
+at different offsets form a graph that converges wherever two sequences reach
+the same offset; :meth:`X86Superset.ChainEnd` memoizes its walks along that
+graph, so that converging sequences are walked only once.
+"""
+
+from array import array
+from X86 import *
+from X86Decoder import DECODE_OK
+
+#: Offset value used in :attr:`X86Superset.next` and
+#: :attr:`X86Superset.target` to indicate no offset within the range.
+SUPERSET_NONE = -1
+
+#: The :meth:`~.EnumElt.IntValue` of the mnemonics whose instructions never
+#: pass control to the following instruction.
+no_fallthrough = frozenset(map(lambda m: m.IntValue(),[Jmp,JmpF,Ret,Retf,Iretd,Iretw]))
+
+class X86Superset(object):
+	"""The superset disassembly of the addresses from *start* to *end*
+	(exclusive), decoded by *decoder*.
+
+	:ivar integer start: the address of offset ``0``
+	:ivar integer size: the number of offsets
+	:ivar array length: the length of the instruction at each offset, or ``0``
+	:ivar array mnem: the :meth:`~.EnumElt.IntValue` of the mnemonic at each
+		offset (meaningless where :attr:`length` is ``0``)
+	:ivar array next: the offset of the fall-through successor, or
+		:data:`SUPERSET_NONE` if it is invalid, outside of the range, or the
+		instruction does not fall through
+	:ivar array target: the offset of the direct branch target, or
+		:data:`SUPERSET_NONE` if there is none within the range
+	"""
+	def __init__(self,decoder,start,end):
+		self.start = start
+		self.size = n = max(end-start,0)
+		self.length = array('B',[0])*n
+		self.mnem   = array('H',[0])*n
+		self.next   = array('l',[SUPERSET_NONE])*n
+		self.target = array('l',[SUPERSET_NONE])*n
+		self._chainend = None
+		self._preds = None
+		for i in xrange(n):
+			status,length,d = decoder.DecodeStatus(start+i)
+			if status != DECODE_OK: continue
+			self.length[i] = length
+			m = d.mnem.IntValue()
+			self.mnem[i] = m
+			if m not in no_fallthrough and i+length < n:
+				self.next[i] = i+length
+			t = d.Target()
+			if t is not None and start <= t < end:
+				self.target[i] = t-start
+
+		# An instruction whose successor is invalid has no valid fall-through.
+		for i in xrange(n):
+			j = self.next[i]
+			if j != SUPERSET_NONE and self.length[j] == 0:
+				self.next[i] = SUPERSET_NONE
+
+	def IsValid(self,i):
+		"""Return ``True`` if offset *i* begins a valid instruction.
+
+		:param integer i:
+		:rtype: bool
+		"""
+		return self.length[i] != 0
+
+	def Mnem(self,i):
+		"""Return the mnemonic of the instruction at offset *i*, or ``None``.
+
+		:param integer i:
+		:rtype: :class:`~.MnemElt`
+		"""
+		return MnemElt(self.mnem[i]) if self.length[i] else None
+
+	def Chain(self,i):
+		"""A generator yielding the offsets of the instructions reached by
+		falling through from offset *i*, beginning with *i* itself.
+
+		:param integer i:
+		:rtype: integer generator
+		"""
+		if self.length[i] == 0: return
+		while i != SUPERSET_NONE:
+			yield i
+			i = self.next[i]
+
+	def ChainEnd(self,i):
+		"""Return the offset of the last instruction reached by falling through
+		from offset *i*, or :data:`SUPERSET_NONE` if *i* is invalid.  The answers
+		are memoized for every offset along each walk, so a walk stops as soon as
+		it reaches an offset that an earlier walk has passed through.
+
+		:param integer i:
+		:rtype: integer
+		"""
+		if self.length[i] == 0: return SUPERSET_NONE
+		if self._chainend is None:
+			self._chainend = array('l',[SUPERSET_NONE])*self.size
+		chainend,nxt,path = self._chainend,self.next,[]
+		while chainend[i] == SUPERSET_NONE:
+			path.append(i)
+			j = nxt[i]
+			if j == SUPERSET_NONE:
+				chainend[i] = i
+				break
+			i = j
+		end = chainend[i]
+		for j in path: chainend[j] = end
+		return end
+
+	def Overlaps(self,i):
+		"""Return the offsets of the valid instructions whose bytes overlap those
+		of the instruction at offset *i*, not including *i* itself.
+
+		:param integer i:
+		:rtype: integer list
+		"""
+		length = self.length
+		if length[i] == 0: return []
+		lo,hi = max(i-15,0),min(i+length[i],self.size)
+		return filter(lambda j: j != i and length[j] and j+length[j] > i,xrange(lo,hi))
+
+	def Predecessors(self,i):
+		"""Return the offsets of the instructions that fall through, or branch
+		directly, to offset *i*.  The reverse edges are computed once, upon the
+		first call.
+
+		:param integer i:
+		:rtype: integer list
+		"""
+		if self._preds is None:
+			preds = map(lambda j: [],xrange(self.size))
+			for j in xrange(self.size):
+				if self.next[j] != SUPERSET_NONE:   preds[self.next[j]].append(j)
+				if self.target[j] != SUPERSET_NONE: preds[self.target[j]].append(j)
+			self._preds = preds
+		return self._preds[i]
@@ -0,0 +1,148 @@
+"""This module computes the length of the instruction beginning at every offset
+of a buffer at once, using NumPy array operations rather than decoding one
+offset at a time.  It is intended as a pre-pass for superset disassembly and
+instruction boundary analyses.  NumPy is optional:  the rest of the package
+does not depend upon it, and :func:`vector_lengths` raises
+:exc:`ImportError` if it is not installed.
+
+The lookup arrays are derived from :data:`~.X86DecodeAutomaton.decode_automaton`
+and :data:`~.X86OperandLayout.operand_layouts`, and hence from
+:data:`~.X86DecodeTable.decoding_table`, the first time that they are needed.
+The rules are the same as those of :func:`~.X86Decoder.scan_window`.
+"""
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from X86DecodeAutomaton import *
+from X86OperandLayout import *
+from X86ModRM import modrm_length
+
+#: Prefix bytes, as classified by :data:`~.X86DecodeAutomaton.prefix_classes`,
+#: mapped to the prefix state bits that they set and clear.
+prefix_effects = dict((b,c[:2]) for b,c in enumerate(prefix_classes) if c is not None)
+
+class X86VectorTables(object):
+	"""The NumPy lookup arrays used by :func:`vector_lengths`.
+
+	:ivar isprefix: for each byte, whether it is a prefix
+	:ivar setbits: for each byte, the prefix state bits it sets
+	:ivar keepbits: for each byte, the complement of the prefix state bits it
+		clears
+	:ivar base: for each stem, the automaton's *base*
+	:ivar pmask: for each stem, the automaton's *pmask*
+	:ivar mmask: for each stem, the automaton's *mmask*
+	:ivar stride: for each stem, the automaton's *stride*
+	:ivar valid: for each leaf, whether it defines an instruction
+	:ivar modrm: for each leaf and ``pfx & 3``, whether an operand is encoded
+		within the ModRM
+	:ivar imm: for each leaf and ``pfx & 3``, the total size of the immediates
+	:ivar regonly: for each leaf and ``pfx & 3``, whether the ModRM must
+		specify a register
+	:ivar memonly: for each leaf and ``pfx & 3``, whether the ModRM must
+		specify memory
+	:ivar segreg: for each leaf and ``pfx & 3``, whether the ModRM must name a
+		segment register
+	:ivar mlen16: for each ModRM/16 byte, the length of the ModRM and
+		displacement
+	:ivar mlen32: for each ModRM/32 byte, the length of the ModRM, SIB, and
+		displacement, assuming that a SIB does not specify ``[idx*ss+dword]``
+	"""
+	def __init__(self,automaton):
+		np = numpy
+		self.isprefix = np.zeros(256,np.bool_)
+		self.setbits  = np.zeros(256,np.int32)
+		self.keepbits = np.zeros(256,np.int32)-1
+		for b,(s,c) in prefix_effects.items():
+			self.isprefix[b],self.setbits[b],self.keepbits[b] = True,s,~c
+
+		stems = automaton.stems
+		self.base,self.pmask,self.mmask,self.stride = map(lambda k: np.array(map(lambda s: s[k],stems),np.int32),xrange(4))
+
+		n = len(automaton.leaves)
+		self.valid = np.zeros(n,np.bool_)
+		self.modrm,self.regonly,self.memonly,self.segreg = map(lambda k: np.zeros((n,4),np.bool_),xrange(4))
+		self.imm = np.zeros((n,4),np.int32)
+		for j,leaf in enumerate(automaton.leaves):
+			if leaf is None: continue
+			self.valid[j] = True
+			for q in xrange(4):
+				for o in leaf[1]:
+					modrm,immsize,kind = operand_layouts[q][o.IntValue()]
+					self.modrm[j,q]   |= modrm
+					self.imm[j,q]     += immsize
+					self.regonly[j,q] |= kind == OL_REGONLY
+					self.memonly[j,q] |= kind == OL_MEMONLY
+					self.segreg[j,q]  |= kind == OL_SEGREG
+
+		self.mlen16 = np.array(map(lambda b: modrm_length([b],0,True),xrange(256)),np.int32)
+		self.mlen32 = np.array(map(lambda b: modrm_length([b,0],0,False),xrange(256)),np.int32)
+
+#: The :class:`X86VectorTables`, once built.
+vector_tables = None
+
+def vector_lengths(data):
+	"""Compute the length of the instruction beginning at every offset within
+	*data*, or ``0`` where the bytes at some offset do not decode to an
+	instruction (including where the instruction would extend past the end of
+	*data*).
+
+	:param data: the buffer
+	:type data: string, :class:`bytearray`, integer list, or NumPy ``uint8``
+		array
+	:rtype: NumPy ``uint8`` array
+	:raises: :exc:`ImportError` if NumPy is not installed.
+	"""
+	global vector_tables
+	if numpy is None:
+		raise ImportError("vector_lengths requires NumPy")
+	np = numpy
+	if vector_tables is None:
+		vector_tables = X86VectorTables(decode_automaton)
+	t = vector_tables
+
+	# Pad the buffer, so that every offset can read 16 bytes plus a SIB.
+	if isinstance(data,str): data = bytearray(data)
+	buf = np.asarray(data,np.uint8)
+	n = len(buf)
+	b = np.zeros(n+20,np.int32)
+	b[:n] = buf
+	idx = np.arange(n)
+
+	# Prefixes:  one pass per prefix position, while any run continues.
+	p,pfx,active = np.zeros(n,np.int32),np.zeros(n,np.int32),np.ones(n,np.bool_)
+	for k in xrange(16):
+		c = b[idx+k]
+		active &= t.isprefix[c]
+		if not active.any(): break
+		p += active
+		pfx = np.where(active,(pfx | t.setbits[c]) & t.keepbits[c],pfx)
+
+	# Stems, including the escape bytes.
+	s = idx+p
+	b0,b1,b2 = b[s],b[s+1],b[s+2]
+	esc = b0 == 0x0F
+	three = esc & ((b1 == 0x38) | (b1 == 0x3A))
+	stem = np.where(three,np.where(b1 == 0x38,0x200,0x300) | b2,np.where(esc,0x100 | b1,b0))
+	stemlen = 1 + esc + three
+
+	# Leaves, keyed by the ModRM that follows the stem (where the entry needs it).
+	mb,sib = b[s+stemlen],b[s+stemlen+1]
+	mk = np.where(mb >= 0xC0,MK_MOD3,0) | (mb & 0x3F)
+	mmask = t.mmask[stem]
+	leaf = t.base[stem] + (pfx & t.pmask[stem])*t.stride[stem] + (mk & mmask)
+	q = pfx & (PFX_OPSIZE|PFX_ADDRSIZE)
+
+	# The ModRM's length, including the [idx*ss+dword] special case.
+	sibdisp = (mb & 0xC7 == 0x04) & (sib & 7 == 5)
+	mlen = np.where(pfx & PFX_ADDRSIZE,t.mlen16[mb],t.mlen32[mb] + sibdisp*4)
+	needs = (mmask != 0) | t.modrm[leaf,q]
+	total = p + stemlen + np.where(needs,mlen,0) + t.imm[leaf,q]
+
+	ok = t.valid[leaf] & (p < 16) & (total <= 16) & (idx+total <= n)
+	ok &= ~(t.regonly[leaf,q] & (mb < 0xC0))
+	ok &= ~(t.memonly[leaf,q] & (mb >= 0xC0))
+	ok &= ~(t.segreg[leaf,q] & (mb >> 3 & 7 > 5))
+	return np.where(ok,total,0).astype(np.uint8)
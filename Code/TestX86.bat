@@ -3,6 +3,24 @@
 \Python27\python.exe -m unittest Tests.X86.TestX86TypeChecker
 \Python27\python.exe -m unittest Tests.X86.TestX86Encoder
 \Python27\python.exe -m unittest Tests.X86.TestX86Decoder
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeAutomaton
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeLight
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeRange
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeStatus
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeLazy
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeCache
+\Python27\python.exe -m unittest Tests.X86.TestX86Superset
+\Python27\python.exe -m unittest Tests.X86.TestX86VectorLength
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeReentrant
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeColumns
+\Python27\python.exe -m unittest Tests.X86.TestX86Redecode
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeCompiler
+\Python27\python.exe -m unittest Tests.X86.TestX86Resync
+\Python27\python.exe -m unittest Tests.X86.TestX86DecodeMany
+\Python27\python.exe -m unittest Tests.X86.TestX86BufferStream
+\Python27\python.exe -m unittest Tests.X86.TestX86SegmentedStream
+\Python27\python.exe -m unittest Tests.X86.TestX86BlockCachedStream
+\Python27\python.exe -m unittest Tests.X86.TestX86PELoader
 
 \Python27\python.exe -m unittest Tests.X86.TestX86Random
 \Python27\python.exe -m unittest Tests.X86.TestX86TypeCheckerRandomly
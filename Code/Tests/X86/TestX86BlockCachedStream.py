@@ -0,0 +1,67 @@
+import random
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import RebasedStreamObj, BlockCachedStreamObj
+from Pandemic.X86.X86Decoder import *
+from ..VerboseTestCase import VerboseTestCase
+
+class FakeSource(object):
+	"""Stands in for a debugger:  *bytes* lie at address *base*, and every 
+	other address is unreadable."""
+	def __init__(self,bytes,base=0):
+		self.bytes,self.base,self.calls = bytes,base,[]
+
+	def read(self,ea,n):
+		self.calls.append((ea,n))
+		if ea < self.base: return []
+		i = ea-self.base
+		return self.bytes[i:i+n]
+
+class TestX86BlockCachedStream(VerboseTestCase):
+	def test00_Blocks(self):
+		src = FakeSource(range(256)*4)
+		s = BlockCachedStreamObj(src.read,blocksize=64,size=2)
+		self.assertEqual(70,s.GetByteAt(70))
+		self.assertEqual(range(60,68),s.WindowAt(60,8))
+		self.assertEqual([(64,64),(0,64)],src.calls)
+		self.assertEqual((1,2),(s.hits,s.misses))
+		# The block at 64 was evicted in favor of the one at 128.
+		s.GetByteAt(130)
+		s.GetByteAt(0)
+		s.GetByteAt(70)
+		self.assertEqual((64,64),src.calls[-1])
+		self.assertEqual(255,s.GetByteAt(1023))
+		self.assertRaises(IndexError,s.GetByteAt,1024)
+		self.assertRaises(IndexError,s.GetByteAt,-1)
+		self.assertEqual([254,255],s.WindowAt(1022,16))
+
+	def test01_ReadAhead(self):
+		src = FakeSource(range(256)*8)
+		s = BlockCachedStreamObj(src.read,blocksize=256,readahead=3)
+		s.WindowAt(0,2048)
+		self.assertEqual([(0,256),(256,1024),(1280,1024)],src.calls)
+		self.assertEqual(6,s.ahead)
+		self.assertEqual(3,s.misses)
+		s.Clear()
+		self.assertEqual((0,0,0,0),(s.hits,s.misses,s.ahead,len(s.blocks)))
+
+	def test02_Invalidate(self):
+		src = FakeSource([0x90]*512)
+		s = BlockCachedStreamObj(src.read,blocksize=128)
+		s.WindowAt(0,512)
+		src.bytes[200] = 0xC3
+		self.assertEqual(0x90,s.GetByteAt(200))
+		s.Invalidate(199,201)
+		self.assertEqual(0xC3,s.GetByteAt(200))
+		self.assertEqual(0x90,s.GetByteAt(127))
+		self.assertEqual(5,len(src.calls))
+
+	def test03_Sweep(self):
+		# One callback per block, not per byte, and the same instructions as a
+		# list-based stream.
+		rng = random.Random(24)
+		l = [rng.randrange(256) for i in xrange(40000)]
+		src = FakeSource(l,0x400000)
+		s = BlockCachedStreamObj(src.read)
+		summary = lambda s,b: map(lambda d: (d.ea,d.bytes),X86Decoder(s).DecodeRange(b,b+len(l)))
+		self.assertEqual(summary(RebasedStreamObj(l,0x400000),0x400000),summary(s,0x400000))
+		self.assertEqual(10,len(src.calls))
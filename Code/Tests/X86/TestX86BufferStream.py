@@ -0,0 +1,99 @@
+import os, random, tempfile
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import StreamObj, RebasedStreamObj, BufferStreamObj, MmapStreamObj
+from Pandemic.X86.X86Decoder import *
+import Pandemic.X86.X86Decoder as X86Decoder_module
+from ..VerboseTestCase import VerboseTestCase
+
+bytes = [0x8B,0x44,0x24,0x04,0x81,0xC0,0x78,0x56,0x34,0x12,0xC3]
+
+def buffers(l):
+	s = str(bytearray(l))
+	return [s,bytearray(l),buffer(s),memoryview(s)]
+
+class TestX86BufferStream(VerboseTestCase):
+	def test00_Reads(self):
+		for b in buffers(bytes):
+			if self.verbose: print "Testing", type(b)
+			s = BufferStreamObj(b)
+			self.assertEqual((0x8B,0x2444,0x78C08104),(s.Byte(),s.Word(),s.Dword()))
+			self.assertEqual(7,s.Pos())
+			self.assertEqual([0x56,0x34,0x12,0xC3],s.Window(16))
+			self.assertEqual([],s.WindowAt(11,16))
+			self.assertEqual(0xC3,s.GetByteAt(10))
+			self.assertRaises(IndexError,s.GetByteAt,11)
+			self.assertRaises(IndexError,s.GetByteAt,-1)
+
+	def test01_Limits(self):
+		# The same exceptions as the list-based class, at the same points.
+		for b in buffers([0x90]*20)+[[0x90]*20]:
+			s = BufferStreamObj(b) if not isinstance(b,list) else StreamObj(b)
+			s.SetPos(0)
+			for i in xrange(3): s.Dword()
+			s.Word()
+			self.assertRaises(InvalidInstruction,s.Dword)
+			s.SetPos(0)
+			for i in xrange(3): s.Dword()
+			s.Word()
+			s.Byte()
+			self.assertRaises(InvalidInstruction,s.Word)
+			s.SetPos(2)
+			for i in xrange(4): s.Dword()
+			self.assertRaises(InvalidInstruction,s.Byte)
+			s.SetPos(17)
+			self.assertRaises(IndexError,s.Dword)
+			s.SetPos(19)
+			self.assertRaises(IndexError,s.Word)
+
+	def test02_Decode(self):
+		# A linear sweep finds the same instructions in either kind of stream.
+		rng = random.Random(21)
+		l = [rng.randrange(256) for i in xrange(20000)]
+		summary = lambda s: map(lambda d: (d.ea,d.bytes),X86Decoder(s).DecodeRange(0,len(l)))
+		expected = summary(StreamObj(l))
+		for b in buffers(l):
+			self.assertEqual(expected,summary(BufferStreamObj(b)))
+
+	def test03_Base(self):
+		s = BufferStreamObj(str(bytearray(bytes)),0x1000)
+		s.SetPos(0x1004)
+		self.assertEqual((0x81,0x345678C0),(s.Byte(),s.Dword()))
+		self.assertEqual([0x8B,0x44],s.WindowAt(0x1000,2))
+		self.assertEqual([],s.WindowAt(0xFFF,2))
+		self.assertRaises(IndexError,s.GetByteAt,0xFFF)
+		s.SetPos(0xFFF)
+		self.assertRaises(IndexError,s.Dword)
+
+	def test04_Mmap(self):
+		rng = random.Random(22)
+		l = [rng.randrange(256) for i in xrange(20000)]
+		fd,path = tempfile.mkstemp()
+		try:
+			os.write(fd,str(bytearray(l)))
+			os.close(fd)
+			s = MmapStreamObj(path,0x401000)
+			try:
+				self.assertEqual(l[:16],s.WindowAt(0x401000,16))
+				self.assertEqual(l[-3:],s.WindowAt(0x401000+len(l)-3,16))
+				summary = lambda s,b: map(lambda d: (d.ea,d.bytes),X86Decoder(s).DecodeRange(b,b+len(l)))
+				self.assertEqual(summary(RebasedStreamObj(l,0x401000),0x401000),summary(s,0x401000))
+			finally:
+				s.Close()
+		finally:
+			os.remove(path)
+
+	def test05_LazyOperands(self):
+		# Lazy instructions read their displacements through Read.
+		reads = []
+		class CountingStreamObj(BufferStreamObj):
+			def Read(self,n,unpack):
+				reads.append(n)
+				return BufferStreamObj.Read(self,n,unpack)
+		old = X86Decoder_module.BufferStreamObj
+		X86Decoder_module.BufferStreamObj = CountingStreamObj
+		try:
+			d = X86Decoder(StreamObj([0xE8,0x10,0x00,0x00,0x00])).Decode(0)
+			self.assertEqual(Instruction([],Call,JccTarget(0x15,0x5)),d.instr)
+		finally:
+			X86Decoder_module.BufferStreamObj = old
+		self.assertEqual([4],reads)
@@ -0,0 +1,93 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86InternalOperand import *
+from Pandemic.X86.X86DecodeAutomaton import *
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeAutomaton(VerboseTestCase):
+	def do_test(self,stem,pfx,mk,mnem,oplist=None):
+		leaf = decode_automaton.Lookup(stem,pfx,mk)
+		if self.verbose:
+			print "Stem %#x, prefix state %#x, ModRM key %#x: %r" % (stem,pfx,mk,leaf)
+		if mnem is None:
+			self.assertIsNone(leaf,"%#x: expected undefined, got %r" % (stem,leaf))
+			return
+		self.assertIsNotNone(leaf,"%#x: expected %s, got undefined" % (stem,mnem))
+		self.assertEqual(mnem,leaf[0],"%#x: expected %s, got %s" % (stem,mnem,leaf[0]))
+		if oplist is not None:
+			self.assertEqual(oplist,leaf[1])
+
+	def test00_Prefixes(self):
+		self.assertEqual((0,0,None,0),scan_prefixes([0x90],0,1))
+		self.assertEqual((PFX_OPSIZE|PFX_ADDRSIZE|PFX_LOCK,3,None,3),scan_prefixes([0x66,0x67,0xF0,0x90],0,4))
+		self.assertEqual((PFX_REP|PFX_REPNE,2<<2|1,CS,4),scan_prefixes([0x90,0x2E,0xF2,0xF3,0x90],1,5))
+		self.assertEqual((PFX_REP|PFX_REPNE|PFX_REPNE_LAST,1<<2|2,FS,3),scan_prefixes([0x64,0xF3,0xF2,0x90],0,4))
+		self.assertEqual(None,scan_prefixes([0x66,0x66,0x90],0,2))
+		self.assertEqual([REP,REPNE,LOCK],group1_of_code[1:])
+
+	def test01_Direct(self):
+		self.do_test(0x00,0,0,Add,[OEb,OGb])
+		self.do_test(0x06,PFX_OPSIZE|PFX_REP,0,Push,[OES])
+		self.assertEqual(0,decode_automaton.stems[0x00][2])
+
+	def test02_Invalid(self):
+		self.do_test(0x10F,0,0,None)
+		self.do_test(0x8F,0,1<<3,None)
+
+	def test03_Group(self):
+		self.assertNotEqual(0,decode_automaton.stems[0x80][2])
+		for ggg,mnem in enumerate([Add,Or,Adc,Sbb,And,Sub,Xor,Cmp]):
+			self.do_test(0x80,0,ggg<<3,mnem,[OEb,OIb])
+			self.do_test(0x80,0,MK_MOD3|ggg<<3|5,mnem,[OEb,OIb])
+
+	def test04_PredOpSize(self):
+		self.do_test(0x60,0,0,Pushad)
+		self.do_test(0x60,PFX_OPSIZE,0,Pushaw)
+
+	def test05_PredAddrSize(self):
+		self.do_test(0xE3,0,0,Jecxz)
+		self.do_test(0xE3,PFX_ADDRSIZE,0,Jcxz)
+
+	def test06_PredMOD_RMGroup(self):
+		self.do_test(0x100,0,0,Sldt,[OMw])
+		self.do_test(0x100,0,MK_MOD3,Sldt,[ORv])
+		self.do_test(0x101,0,MK_MOD3|1,Vmcall)
+		self.do_test(0x101,0,1<<3,Sidt)
+		self.do_test(0xD9,0,MK_MOD3|5<<3|6,Fldz)
+		self.do_test(0xD9,0,MK_MOD3|5<<3|7,None)
+
+	def test07_SSE(self):
+		self.do_test(0x110,0,0,Movups)
+		self.do_test(0x110,PFX_REP,0,Movss)
+		self.do_test(0x110,PFX_OPSIZE,0,Movupd)
+		self.do_test(0x110,PFX_REPNE,0,Movsd)
+		self.do_test(0x110,PFX_OPSIZE|PFX_REP,0,Movss)
+		self.do_test(0x110,PFX_REP|PFX_REPNE,0,Movss)
+		self.do_test(0x110,PFX_REP|PFX_REPNE|PFX_REPNE_LAST,0,Movsd)
+		self.do_test(0x90,PFX_REP,0,Pause)
+		self.do_test(0x152,PFX_OPSIZE,0,Rsqrtps)
+		self.assertTrue(decode_automaton.Lookup(0x110,0,0)[2])
+		self.assertFalse(decode_automaton.Lookup(0x00,0,0)[2])
+
+	def test08_SSE_PredMOD(self):
+		self.do_test(0x112,0,0,Movlps)
+		self.do_test(0x112,0,MK_MOD3,Movhlps)
+		self.do_test(0x171,0,0,None)
+		self.do_test(0x171,0,MK_MOD3|2<<3,Psrlw,[ONq,OIb])
+		self.do_test(0x171,PFX_OPSIZE,MK_MOD3|2<<3,Psrlw,[OUdq,OIb])
+
+	def test09_SSETable(self):
+		from Pandemic.X86.X86ByteStream import StreamObj
+		from Pandemic.X86.X86Decoder import X86Decoder
+		entry = decoding_table[0x110]
+		self.assertEqual(SSE_PFX_MASK+1,len(entry.table))
+		self.assertIs(entry.rep,entry.table[PFX_OPSIZE|PFX_REP])
+		self.assertIs(entry.repne,entry.table[PFX_REP|PFX_REPNE|PFX_REPNE_LAST])
+		self.assertIs(entry.size,SSE66(entry.size).table[PFX_REP|PFX_OPSIZE])
+		self.assertIs(Invalid,SSE66(entry.size).table[PFX_REP])
+		decoder = X86Decoder(StreamObj([]))
+		decoder.pfx,decoder.group1pfx = PFX_REP|PFX_REPNE|PFX_REPNE_LAST,[LOCK,REP,REPNE]
+		self.assertEqual(Movsd,entry.decode(decoder)[0])
+		self.assertEqual([],decoder.group1pfx)
+		decoder.pfx = PFX_OPSIZE
+		self.assertEqual(Movupd,entry.decode(decoder)[0])
@@ -0,0 +1,121 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj, WritableStreamObj
+from Pandemic.X86.X86Decoder import X86Decoder, X86LazyDecodedInstruction, scan_window
+from Pandemic.X86.X86DecodeCache import *
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeCache(VerboseTestCase):
+	def test00_LRU(self):
+		cache = X86DecodeCache(2)
+		a,b,c = Instruction([],Nop),Instruction([],Clc),Instruction([],Stc)
+		cache.Insert((1,),a)
+		cache.Insert((2,),b)
+		self.assertIs(a,cache.Lookup((1,)))
+		cache.Insert((3,),c)
+		self.assertEqual(2,len(cache))
+		self.assertIsNone(cache.Lookup((2,)))
+		self.assertIs(c,cache.Lookup((3,)))
+		self.assertEqual((2,1),(cache.hits,cache.misses))
+		cache.size = 1
+		cache.Insert((4,),a)
+		self.assertEqual(1,len(cache))
+		cache.Clear()
+		self.assertEqual((0,0,0),(len(cache),cache.hits,cache.misses))
+
+	def test01_Shared(self):
+		cache = X86DecodeCache()
+		decoder = X86Decoder(StreamObj([0xF3,0x90,0xF3,0x90]),cache)
+		i0 = decoder.Decode(0).instr
+		i1 = decoder.Decode(2).instr
+		self.assertEqual(Instruction([],Pause),i0)
+		self.assertIs(i0,i1)
+		self.assertEqual((1,1),(cache.hits,cache.misses))
+
+	def test02_Rebased(self):
+		cache = X86DecodeCache()
+		decoder = X86Decoder(StreamObj([0xEB,0x02,0x90,0x90,0xEB,0x02]),cache)
+		i0 = decoder.Decode(0).instr
+		i1 = decoder.Decode(4).instr
+		self.assertEqual(Instruction([],Jmp,JccTarget(4,2)),i0)
+		self.assertEqual(Instruction([],Jmp,JccTarget(8,6)),i1)
+		self.assertEqual((1,1),(cache.hits,cache.misses))
+
+	def test03_Untouched(self):
+		cache = X86DecodeCache()
+		decoder = X86Decoder(StreamObj([0xF3,0x90]),cache)
+		decoder.Decode(0).mnem
+		self.assertEqual((0,0),(cache.hits,cache.misses))
+
+	def test04_Address(self):
+		# push ebp / mov ebp,esp / jmp $+4 / nop / nop / ret
+		stream = WritableStreamObj([0x55,0x8B,0xEC,0xEB,0x02,0x90,0x90,0xC3])
+		eacache = X86AddressCache(stream)
+		decoder = X86Decoder(stream,eacache=eacache)
+		first = list(decoder.DecodeRange(0,8))
+		self.assertEqual((0,6),(eacache.hits,eacache.misses))
+		second = list(decoder.DecodeRange(0,8))
+		self.assertEqual((6,6),(eacache.hits,eacache.misses))
+		self.assertEqual(map(id,first),map(id,second))
+
+	def test05_Invalidate(self):
+		stream = WritableStreamObj([0x55,0x8B,0xEC,0xEB,0x02,0x90,0x90,0xC3])
+		eacache = X86AddressCache(stream)
+		decoder = X86Decoder(stream,eacache=eacache)
+		list(decoder.DecodeRange(0,8))
+		
+		# Overwrite the jmp's displacement:  only the jmp is invalidated.
+		stream.Write(4,[0x00])
+		self.assertEqual([0,1,5,6,7],sorted(eacache.entries.keys()))
+		d = decoder.Decode(3)
+		self.assertEqual(5,d.Target())
+		
+		# Overwrite everything.
+		stream.Write(0,[0x90]*8)
+		self.assertEqual(0,len(eacache))
+		self.assertEqual(Nop,decoder.Decode(1).mnem)
+
+	def do_test_plan(self,template,bytes,instr,other):
+		status,length,ctx = scan_window(bytes)
+		d = X86LazyDecodedInstruction(0x1000,bytes,ctx)
+		plan = X86DecodePlan(template,d)
+		if self.verbose:
+			print "%s: %r" % (template,plan.steps)
+		self.assertTrue(plan.valid)
+		status,length,ctx = scan_window(other)
+		e = X86LazyDecodedInstruction(0x2000,other,ctx)
+		self.assertEqual(d.PlanKey(),e.PlanKey())
+		self.assertEqual(instr,plan.Build(e.ea,e.bytes))
+
+	def test06_PlanSteps(self):
+		self.do_test_plan(Instruction([],Mov,Gd(Eax),Mem32(SS,Md,Esp,None,0,8)),[0x8B,0x44,0x24,0x08],
+			Instruction([],Mov,Gd(Eax),Mem32(SS,Md,Esp,None,0,0xFFFFFFF8)),[0x8B,0x44,0x24,0xF8])
+		self.do_test_plan(Instruction([],Mov,Gw(Ax),Mem16(SS,Mw,Bp,None,2)),[0x67,0x66,0x8B,0x46,0x02],
+			Instruction([],Mov,Gw(Ax),Mem16(SS,Mw,Bp,None,0xFFFE)),[0x66,0x67,0x67,0x8B,0x46,0xFE])
+		self.do_test_plan(Instruction([],Add,Gd(Eax),Id(1)),[0x83,0xC0,0x01],
+			Instruction([],Add,Gd(Eax),Id(0xFFFFFFFF)),[0x83,0xC0,0xFF])
+		self.do_test_plan(Instruction([],Mov,Gd(Eax),Mem32(DS,Md,None,None,0,0x12345678)),[0xA1,0x78,0x56,0x34,0x12],
+			Instruction([],Mov,Gd(Eax),Mem32(DS,Md,None,None,0,0x400000)),[0xA1,0x00,0x00,0x40,0x00])
+		self.do_test_plan(Instruction([],CallF,AP32(0xABCD,0x12345678)),[0x9A,0x78,0x56,0x34,0x12,0xCD,0xAB],
+			Instruction([],CallF,AP32(0x1B,0x401000)),[0x9A,0x00,0x10,0x40,0x00,0x1B,0x00])
+
+	def test07_PlanCache(self):
+		plans = X86PlanCache()
+		decoder = X86Decoder(StreamObj([0x74,0x10,0x2E,0x74,0xF0,0x74,0x00,0x2E,0x2E,0x74,0x02]),plans=plans)
+		d = map(decoder.Decode,[0,2,5,7])
+		self.assertEqual(Instruction([],Jz,JccTarget(0x12,0x2)),d[0].instr)
+		self.assertEqual(Instruction([],Jz,JccTarget(0xFFFFFFF5,0x5)),d[1].instr)
+		self.assertEqual(2,len(plans))
+		self.assertEqual(Instruction([],Jz,JccTarget(0x7,0x7)),d[2].instr)
+		self.assertEqual(Instruction([],Jz,JccTarget(0xD,0xB)),d[3].instr)
+		self.assertEqual((2,2),(plans.hits,plans.misses))
+
+	def test08_PlanPrefixes(self):
+		# rep jz, thrice:  each built instruction has its own prefix list.
+		plans = X86PlanCache()
+		decoder = X86Decoder(StreamObj([0xF3,0x74,0x10]*3),plans=plans)
+		d = map(lambda ea: decoder.Decode(ea).instr,[0,3,6])
+		self.assertEqual((2,1),(plans.hits,plans.misses))
+		self.assertIsNot(d[1].prefixes,d[2].prefixes)
+		d[1].prefixes.append(LOCK)
+		self.assertEqual([REP],d[2].prefixes)
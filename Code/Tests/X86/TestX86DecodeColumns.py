@@ -0,0 +1,71 @@
+import shutil, tempfile, unittest
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86InternalOperand import *
+from Pandemic.X86.X86ByteStream import StreamObj, RebasedStreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86DecodeColumns import *
+from ..VerboseTestCase import VerboseTestCase
+
+# push ebp; mov ebp, esp; jz $+0x12; pause; call $+5; ret; (bad mov sreg)
+code = [0x55,0x8B,0xEC,0x74,0x10,0xF3,0x90,0xE8,0x00,0x00,0x00,0x00,0xC3,0x8C,0xF8]
+
+class TestX86DecodeColumns(VerboseTestCase):
+	def columns(self,invalid=INVALID_SKIP,base=0x1000):
+		c = X86DecodeColumns(X86Decoder(RebasedStreamObj(code,base)),base,base+len(code),invalid)
+		if self.verbose:
+			for d in c: print "%#x: %s" % (d.ea,d.mnem)
+		return c
+
+	def do_test(self,c,mnems):
+		self.assertEqual(mnems,map(c.Mnem,xrange(len(c))))
+		for i in xrange(len(c)):
+			d = X86Decoder(RebasedStreamObj(code,0x1000)).Decode(int(c.ea[i]))
+			self.assertEqual((d.ea,d.length,d.mnem,d.Target()),(c.ea[i],c.length[i],c.Mnem(i),c.Target(i)))
+			self.assertEqual(flow_kinds[type(d.flow)],c.flow[i])
+
+	def test00_Columns(self):
+		c = self.columns()
+		self.do_test(c,[Push,Mov,Jz,Pause,Call,Ret,Clc])
+		self.assertEqual([0x1000,0x1001,0x1003,0x1005,0x1007,0x100C,0x100E],list(c.ea))
+		self.assertEqual(code[:13]+code[14:],list(c.data))
+		self.assertEqual([FLOW_ORDINARY,FLOW_ORDINARY,FLOW_JMP_CONDITIONAL,FLOW_ORDINARY,FLOW_CALL_DIRECT,FLOW_RETURN,FLOW_ORDINARY],list(c.flow))
+		self.assertEqual(0x1015,c.Target(2))
+		self.assertIsNone(c.Target(1))
+		self.assertEqual([OGv,OEv],c.Operands(1))
+		self.assertEqual([],c.Operands(5))
+		self.assertEqual(6,len(self.columns(INVALID_STOP)))
+
+	def test01_Views(self):
+		c = self.columns()
+		d = c[2]
+		self.assertIsInstance(d,X86LazyDecodedInstruction)
+		self.assertEqual(Instruction([],Jz,JccTarget(0x1015,0x1005)),d.instr)
+		self.assertEqual(Instruction([],Pause),c[3].instr)
+		self.assertEqual(Instruction([],Ret),c[-2].instr)
+		self.assertEqual([Push,Mov,Jz,Pause,Call,Ret,Clc],map(lambda d: d.mnem,c))
+
+	def test02_SliceAndFilter(self):
+		c = self.columns()
+		s = c[2:5]
+		self.do_test(s,[Jz,Pause,Call])
+		self.assertIs(c.data,s.data)
+		self.assertEqual(Instruction([],Call,JccTarget(0x100C,0x100C)),s[2].instr)
+		f = c.Filter([Call,Jz,Ret])
+		self.do_test(f,[Jz,Call,Ret])
+		self.assertEqual(0,len(c.Filter([Nop])))
+		self.do_test(c.Select([6,0]),[Clc,Push])
+
+	@unittest.skipIf(numpy is None,"NumPy is not installed")
+	def test03_SaveLoad(self):
+		path = tempfile.mkdtemp()
+		try:
+			c = self.columns()
+			c.Save(path)
+			for mmap in [True,False]:
+				l = load_columns(path,mmap)
+				self.do_test(l,[Push,Mov,Jz,Pause,Call,Ret,Clc])
+				self.assertEqual(Instruction([],Jz,JccTarget(0x1015,0x1005)),l[2].instr)
+				self.do_test(l[4:].Filter([Ret,Clc]),[Ret,Clc])
+		finally:
+			shutil.rmtree(path)
@@ -0,0 +1,97 @@
+import os, random, shutil, tempfile
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj, RebasedStreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86DecodeCompiler import *
+from Pandemic.Util.ExerciseError import ExerciseError
+from ..VerboseTestCase import VerboseTestCase
+
+compiled = load_compiled()
+
+class TestX86DecodeCompiler(VerboseTestCase):
+	def do_test(self,instr,bytes,ea=0x1000):
+		d = X86Decoder(RebasedStreamObj(bytes,ea),compiled=compiled).Decode(ea)
+		if self.verbose:
+			print "%s: %s" % (bytes,d.instr)
+		self.assertEqual(instr,d.instr,"%s: expected %r, got %r" % (bytes,instr,d.instr))
+
+	def test00_Operands(self):
+		self.do_test(Instruction([],Nop),[0x90])
+		self.do_test(Instruction([],Pushaw),[0x66,0x60])
+		self.do_test(Instruction([],In,Gb(Al),Gw(Dx)),[0xEC])
+		self.do_test(Instruction([],Inc,Gb(Al)),[0xFE,0xC0])
+		self.do_test(Instruction([],Xor,Gb(Bl),Gb(Al)),[0x30,0xC3])
+		self.do_test(Instruction([],Sldt,Gd(Eax)),[0x0F,0x00,0xC0])
+		self.do_test(Instruction([],Vmcall),[0x0F,0x01,0xC1])
+		self.do_test(Instruction([],Xor,Gw(Bx),Gw(Ax)),[0x66,0x31,0xC3])
+		self.do_test(Instruction([LOCK],Add,Mem32(DS,Md,Eax,None,0,0),Gd(Ebx)),[0xF0,0x01,0x18])
+
+	def test01_Memory(self):
+		self.do_test(Instruction([],Xor,Mem32(DS,Mb,Eax,None,0,0),Gb(Al)),[0x30,0x00])
+		self.do_test(Instruction([],Xor,Mem16(DS,Mb,Bx,Si,0),Gb(Al)),[0x67,0x30,0x00])
+		self.do_test(Instruction([],Mov,Gd(Eax),Mem32(SS,Md,Ebp,None,0,8)),[0x8B,0x45,0x08])
+		self.do_test(Instruction([],Mov,Gd(Eax),Mem32(DS,Md,Eax,Ecx,2,0)),[0x8B,0x04,0x88])
+		self.do_test(Instruction([],Mov,Gd(Eax),Mem32(DS,Md,None,Ecx,2,0x10)),[0x8B,0x04,0x8D,0x10,0,0,0])
+		self.do_test(Instruction([],Mov,Gd(Eax),Mem32(FS,Md,None,None,0,0x12345678)),[0x64,0x8B,0x05,0x78,0x56,0x34,0x12])
+		self.do_test(Instruction([],Mov,Gd(Eax),Mem32(DS,Md,None,None,0,0x12345678)),[0xA1,0x78,0x56,0x34,0x12])
+		self.do_test(Instruction([],Mov,Gw(Ax),Mem16(SS,Mw,Bp,Si,0xFFFE)),[0x66,0x67,0x8B,0x42,0xFE])
+		self.do_test(Instruction([],Movss,XMMReg(XMM1),Mem32(SS,Md,Esp,None,0,4)),[0xF3,0x0F,0x10,0x4C,0x24,0x04])
+		self.do_test(Instruction([],Stosb,Mem16(ES,Mb,Di,None,None)),[0x67,0xAA])
+		self.do_test(Instruction([],Movsb,Mem32(ES,Mb,Esi,None,0,None),Mem32(ES,Mb,Edi,None,0,None)),[0x26,0xA4])
+
+	def test02_Immediates(self):
+		self.do_test(Instruction([],Int,Ib(2)),[0xCD,0x02])
+		self.do_test(Instruction([],Ret,Iw(4)),[0xC2,0x04,0x00])
+		self.do_test(Instruction([],Enter,Iw(8),Ib(1)),[0xC8,0x08,0x00,0x01])
+		self.do_test(Instruction([],Add,Gd(Eax),Id(0xFFFFFFFF)),[0x83,0xC0,0xFF])
+		self.do_test(Instruction([],Jmp,JccTarget(0x1000,0x1002)),[0xEB,0xFE])
+		self.do_test(Instruction([],Jmp,JccTarget(0x9004,0x1004)),[0x67,0xE9,0x00,0x80])
+		self.do_test(Instruction([],JmpF,AP32(8,0x12345678)),[0xEA,0x78,0x56,0x34,0x12,0x08,0x00])
+		self.do_test(Instruction([],JmpF,AP16(8,0x5678)),[0x67,0xEA,0x78,0x56,0x08,0x00])
+
+	def test03_Interpreter(self):
+		# Wherever the decoder's own methods can build the instruction, the
+		# generated functions must build the same one.
+		r = random.Random(3)
+		for n in xrange(20000):
+			bytes = map(lambda i: r.choice([0x66,0x67,0xF3,0xF2,0x2E,0x0F,r.randrange(256)]),xrange(3))
+			bytes = bytes + map(lambda i: r.randrange(256),xrange(13))
+			status,length,d = X86Decoder(StreamObj(bytes)).DecodeStatus(0)
+			if status != DECODE_OK: continue
+			try:
+				instr = d.instr
+			except ExerciseError:
+				continue
+			self.assertEqual(repr(instr),repr(compiled.Build(d)))
+
+	def test04_Regenerate(self):
+		path = tempfile.mkdtemp()
+		try:
+			c = load_compiled("xdectest",path)
+			fn = os.path.join(path,"xdectest.py")
+			source = open(fn).read()
+			self.assertIn("_signature = %r" % table_signature(),source)
+			self.assertEqual(generate_source("xdectest"),source)
+
+			# A stale module is regenerated.
+			open(fn,"w").write(source.replace(table_signature(),"stale"))
+			c = load_compiled("xdectest",path)
+			self.assertEqual(source,open(fn).read())
+			names = lambda c: map(lambda t: map(lambda fn: fn and fn.__name__,t),c.table)
+			self.assertEqual(names(compiled),names(c))
+		finally:
+			shutil.rmtree(path)
+
+	def test05_CacheDirectory(self):
+		path = tempfile.mkdtemp()
+		old = os.environ.get("PANDEMIC_CACHE_DIR")
+		try:
+			os.environ["PANDEMIC_CACHE_DIR"] = os.path.join(path,"sub")
+			self.assertEqual(os.path.join(path,"sub"),cache_directory())
+			c = load_compiled("xdectest")
+			self.assertTrue(os.path.isfile(os.path.join(path,"sub","xdectest.py")))
+		finally:
+			if old is None: del os.environ["PANDEMIC_CACHE_DIR"]
+			else: os.environ["PANDEMIC_CACHE_DIR"] = old
+			shutil.rmtree(path)
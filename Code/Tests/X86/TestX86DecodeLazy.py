@@ -0,0 +1,49 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj, RebasedStreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.Util.ASMFlow import *
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeLazy(VerboseTestCase):
+	def decode(self,bytes,ea=0):
+		d = X86Decoder(RebasedStreamObj(bytes,ea)).Decode(ea)
+		if self.verbose:
+			print "%#x: %s" % (d.ea,d.instr)
+		return d
+
+	def test00_State(self):
+		d = X86Decoder(StreamObj([0x90,0xF3,0x2E,0x74,0x10])).Decode(1)
+		self.assertIsInstance(d,X86LazyDecodedInstruction)
+		self.assertEqual([0xF3,0x2E,0x74,0x10],d.bytes)
+		self.assertEqual((1,4,0x74,3),(d.ea,d.length,d.stem,d.stemlen))
+		self.assertEqual((PFX_REP,CS),(d.pfx,d.segpfx))
+		self.assertIsNone(d._instr)
+
+	def test01_MnemAndFlow(self):
+		d = self.decode([0x0F,0x85,0x00,0x01,0x00,0x00],0x1000)
+		self.assertEqual(Jnz,d.mnem)
+		self.assertIsInstance(d.flow,FlowJmpConditional)
+		self.assertEqual(0x1106,d.Target())
+		self.assertIsNone(d._instr)
+		self.assertIsInstance(self.decode([0xC3]).flow,FlowReturn)
+		self.assertIsInstance(self.decode([0xEB,0xFE],0x10).flow,FlowJmpUnconditional)
+		self.assertIsNone(self.decode([0xC8,0x10,0x00,0x01]).Target())
+
+	def test02_Instr(self):
+		d = self.decode([0xF3,0xE8,0xFB,0xFF,0xFF,0xFF],0x400000)
+		self.assertIsNone(d._instr)
+		instr = d.instr
+		self.assertEqual(Instruction([REP],Call,JccTarget(0x400001,0x400006)),instr)
+		self.assertIs(instr,d.instr)
+		self.assertEqual(0x400001,d.Target())
+
+	def test03_Prebuilt(self):
+		d = self.decode([0x50])
+		self.assertIsNotNone(d._instr)
+		self.assertEqual(Instruction([],Push,Gd(Eax)),d.instr)
+
+	def test04_AddrPrefixTarget(self):
+		d = self.decode([0x67,0xE9,0xF0,0xFF],0x10)
+		self.assertEqual(0x0004,d.Target())
+		self.assertEqual(0x0004,d.instr.GetOp(0)._taken.value)
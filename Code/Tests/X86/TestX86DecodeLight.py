@@ -0,0 +1,87 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj
+from Pandemic.X86.X86Decoder import X86Decoder
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeLight(VerboseTestCase):
+	def do_test(self,bytes,mnem,target=None,ea=0):
+		if self.verbose:
+			print "Testing bytes", bytes, "expecting", mnem
+		decoder = X86Decoder(StreamObj([0]*ea+bytes))
+		length,m,t = decoder.DecodeLight(ea)
+		self.assertEqual(len(bytes),length,"%s: expected length %d, got %d" % (bytes,len(bytes),length))
+		self.assertEqual(mnem,m,"%s: expected %s, got %s" % (bytes,mnem,m))
+		self.assertEqual(target,t)
+
+	def do_test_invalid(self,bytes):
+		decoder = X86Decoder(StreamObj(bytes))
+		self.assertRaises(InvalidInstruction,decoder.DecodeLight,0)
+
+	def test00_NoOperands(self):
+		self.do_test([0x90],Nop)
+		self.do_test([0xF3,0x90],Pause)
+		self.do_test([0x66,0x60],Pushaw)
+		self.do_test([0x0F,0x01,0xC1],Vmcall)
+
+	def test01_ModRM32(self):
+		self.do_test([0x8B,0xC1],Mov)
+		self.do_test([0x8B,0x45,0xFC],Mov)
+		self.do_test([0x8B,0x04,0x24],Mov)
+		self.do_test([0x8B,0x44,0x24,0x04],Mov)
+		self.do_test([0x8B,0x04,0x85,0x00,0x10,0x40,0x00],Mov)
+		self.do_test([0x8B,0x05,0x00,0x10,0x40,0x00],Mov)
+		self.do_test([0xFF,0x94,0x24,0x00,0x01,0x00,0x00],Call)
+
+	def test02_ModRM16(self):
+		self.do_test([0x67,0x8B,0x00],Mov)
+		self.do_test([0x67,0x8B,0x46,0xFC],Mov)
+		self.do_test([0x67,0x8B,0x06,0x34,0x12],Mov)
+		self.do_test([0x67,0x8B,0x80,0x34,0x12],Mov)
+
+	def test03_Immediates(self):
+		self.do_test([0x81,0xC0,0x78,0x56,0x34,0x12],Add)
+		self.do_test([0x66,0x81,0xC0,0x34,0x12],Add)
+		self.do_test([0x83,0xC0,0x01],Add)
+		self.do_test([0xC8,0x10,0x00,0x01],Enter)
+		self.do_test([0xA1,0x78,0x56,0x34,0x12],Mov)
+		self.do_test([0x67,0xA1,0x34,0x12],Mov)
+		self.do_test([0x9A,0x00,0x00,0x00,0x00,0x34,0x12],CallF)
+		self.do_test([0x67,0x9A,0x00,0x00,0x34,0x12],CallF)
+		self.do_test([0x66,0x0F,0x71,0xD0,0x04],Psrlw)
+
+	def test04_BranchTargets(self):
+		self.do_test([0xEB,0xFE],Jmp,0x10,0x10)
+		self.do_test([0x74,0x10],Jz,0x22,0x10)
+		self.do_test([0xE8,0x00,0x01,0x00,0x00],Call,0x115,0x10)
+		self.do_test([0xE9,0xF0,0xFF,0xFF,0xFF],Jmp,0x5,0x10)
+		self.do_test([0x67,0xE3,0x00],Jcxz,0x13,0x10)
+		self.do_test([0x67,0xE9,0xF0,0xFF],Jmp,0x0004,0x10)
+
+	def test05_MatchesDecode(self):
+		for bytes in [[0x90],[0xC3],[0xEB,0x05],[0x0F,0x85,0x00,0x01,0x00,0x00],[0xE2,0xFE]]:
+			decoder = X86Decoder(StreamObj([0]*0x10+bytes))
+			full = decoder.Decode(0x10)
+			length,mnem,target = decoder.DecodeLight(0x10)
+			self.assertEqual((full.length,full.instr.mnem),(length,mnem))
+			if target is not None:
+				self.assertEqual(full.instr.GetOp(0)._taken.value,target)
+
+	def test06_Invalid(self):
+		self.do_test_invalid([0x8C,0xF8])
+		self.do_test_invalid([0xC5,0xC0])
+		self.do_test_invalid([0x0F,0x0F])
+		self.do_test_invalid([0x66]*16+[0x90])
+
+	def test07_Prefixes(self):
+		decoder = X86Decoder(StreamObj([0xF0,0xF3,0x2E,0xF2,0x66,0xC3]))
+		d = decoder.Decode(0)
+		self.assertEqual(6,d.length)
+		self.assertEqual([LOCK,REP,REPNE],d.instr.prefixes)
+		self.assertEqual(CS,decoder.segpfx)
+		self.assertTrue(decoder.sizepfx)
+		self.assertFalse(decoder.addrpfx)
+		self.assertEqual(Instruction([],Pause),X86Decoder(StreamObj([0xF3,0x90])).Decode(0).instr)
+		self.assertEqual(Instruction([],Nop),X86Decoder(StreamObj([0xF0,0x90])).Decode(0).instr)
+		self.do_test([0x66]*15+[0x90],Nop)
+		self.do_test_invalid([0x66]*15+[0x0F,0x0B])
@@ -0,0 +1,53 @@
+import random
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import StreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86DecodeCache import X86DecodeCache
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeMany(VerboseTestCase):
+	snippets = [[0x90],[0x55,0x8B,0xEC],"\xE8\x00\x00\x00\x00",bytearray([0xC3]),[0xFE,0xF8],[0x8B,0x04],[0x66]*17+[0x90]]
+	statuses = [DECODE_OK,DECODE_OK,DECODE_OK,DECODE_OK,DECODE_UNDEFINED,DECODE_END_OF_STREAM,DECODE_TOO_LONG]
+
+	def test00_Snippets(self):
+		results = list(decode_many(self.snippets,lazy=True))
+		self.assertEqual(len(self.snippets),len(results))
+		self.assertEqual(self.statuses,map(lambda r: r[0],results))
+		self.assertEqual([Nop,Push,Call,Ret],map(lambda r: r[2].mnem,results[:4]))
+		self.assertEqual([1,1,5,1],map(lambda r: r[1],results[:4]))
+		self.assertEqual([None]*3,map(lambda r: r[2],results[4:]))
+		self.assertEqual(5,results[2][2].Target())
+		self.assertEqual([0x90],results[0][2].bytes)
+
+	def test01_Address(self):
+		status,length,d = list(decode_many([[0xEB,0xFE]],0x401000,lazy=True))[0]
+		self.assertEqual((0x401000,0x401000),(d.ea,d.Target()))
+
+	def test02_Decoder(self):
+		# The caches of the given decoder are used.
+		cache = X86DecodeCache()
+		decoder = X86Decoder(StreamObj([]),cache=cache)
+		for status,length,d in decode_many([[0x74,0x02]]*3,0,decoder,True): d.instr
+		self.assertEqual((2,1),(cache.hits,cache.misses))
+
+	def test03_Random(self):
+		# Agree with a decoder built for each snippet.
+		rng = random.Random(20)
+		snippets = [[rng.randrange(256) for j in xrange(rng.randint(1,15))] for i in xrange(5000)]
+		for w,(status,length,d),r in zip(snippets,decode_many(snippets,lazy=True),decode_many(snippets)):
+			s,l,e = X86Decoder(StreamObj(w)).DecodeAt(0)
+			self.assertEqual((s,l),(status,length))
+			self.assertEqual((s,l,None if e is None else e.mnem),r)
+			if d is not None:
+				self.assertEqual((e.bytes,e.mnem,e.Target()),(d.bytes,d.mnem,d.Target()))
+
+	def test04_Compact(self):
+		results = list(decode_many(self.snippets))
+		self.assertEqual(zip(self.statuses,[1,1,5,1,2,2,16],[Nop,Push,Call,Ret,None,None,None]),results)
+
+	def test05_Buffers(self):
+		# Slices of these yield characters rather than integers.
+		data = "\x55\x8B\xEC\xE8\x00\x00\x00\x00\xC3"
+		snippets = [memoryview(data)[1:],buffer(data,3),memoryview(bytearray(data))[8:]]
+		self.assertEqual([(DECODE_OK,2,Mov),(DECODE_OK,5,Call),(DECODE_OK,1,Ret)],list(decode_many(snippets)))
+		self.assertEqual([[0x8B,0xEC],[0xE8,0,0,0,0],[0xC3]],map(lambda r: r[2].bytes,decode_many(snippets,lazy=True)))
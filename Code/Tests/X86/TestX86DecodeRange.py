@@ -0,0 +1,65 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj, WritableStreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86DecodeCache import X86AddressCache
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeRange(VerboseTestCase):
+	# nop / (invalid: FE /7) / clc / nop / jmp $
+	bytes = [0x90,0xFE,0xF8,0x90,0xEB,0xFE]
+
+	def do_test(self,invalid,expected,start=0,end=None):
+		end = len(self.bytes) if end is None else end
+		decoder = X86Decoder(StreamObj(self.bytes))
+		results = list(decoder.DecodeRange(start,end,invalid))
+		if self.verbose:
+			for r in results: print "%#x: %s" % (r.ea,r.instr)
+		got = map(lambda r: (r.ea,r.length,None if r.instr is None else r.instr.mnem),results)
+		self.assertEqual(expected,got)
+		return results
+
+	def test00_Skip(self):
+		self.do_test(INVALID_SKIP,[(0,1,Nop),(2,1,Clc),(3,1,Nop),(4,2,Jmp)])
+
+	def test01_Data(self):
+		results = self.do_test(INVALID_DATA,[(0,1,Nop),(1,1,None),(2,1,Clc),(3,1,Nop),(4,2,Jmp)])
+		self.assertIsInstance(results[1],X86DecodedData)
+		self.assertEqual(0xFE,results[1].byte)
+
+	def test02_Stop(self):
+		self.do_test(INVALID_STOP,[(0,1,Nop)])
+
+	def test03_Bounds(self):
+		self.do_test(INVALID_SKIP,[(2,1,Clc),(3,1,Nop)],2,4)
+		self.do_test(INVALID_SKIP,[(3,1,Nop),(4,2,Jmp)],3,5)
+
+	def test04_EndOfStream(self):
+		decoder = X86Decoder(StreamObj([0x90,0xE8,0x00]))
+		self.assertEqual([0],map(lambda r: r.ea,decoder.DecodeRange(0,3)))
+
+	def test05_Interleaved(self):
+		decoder = X86Decoder(StreamObj(self.bytes))
+		eas = []
+		for r in decoder.DecodeRange(0,len(self.bytes)):
+			eas.append(r.ea)
+			decoder.Decode(4)
+		self.assertEqual([0,2,3,4],eas)
+
+	def test06_Chunks(self):
+		# Five-byte calls straddle every chunk boundary, and the stream is untouched.
+		n = 3*sweep_chunk // 5 + 1
+		decoder = X86Decoder(StreamObj([0x90,0x90]+[0xE8,0,0,0,0]*n))
+		eas = map(lambda r: r.ea,decoder.DecodeRange(0,2+5*n))
+		self.assertEqual([0,1]+range(2,2+5*n,5),eas)
+		self.assertEqual(0,decoder.Stream.Pos())
+
+	def test07_Written(self):
+		# A write while the sweep is suspended is seen, and is not cached stale.
+		stream = WritableStreamObj([0x90]*8)
+		decoder = X86Decoder(stream,eacache=X86AddressCache(stream))
+		sweep = decoder.DecodeRange(0,8)
+		self.assertEqual(Nop,next(sweep).mnem)
+		stream.Write(4,[0xCC])
+		self.assertEqual([Nop,Nop,Nop,Int3,Nop,Nop,Nop],map(lambda d: d.mnem,sweep))
+		self.assertEqual(Int3,decoder.Decode(4).mnem)
@@ -0,0 +1,100 @@
+import threading
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj, RebasedStreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86DecodeCache import X86DecodeCache
+from ..VerboseTestCase import VerboseTestCase
+
+# push ebp; mov ebp, esp; jz $+0x12; pause; call $+5; ret
+code = [0x55,0x8B,0xEC,0x74,0x10,0xF3,0x90,0xE8,0x00,0x00,0x00,0x00,0xC3]
+boundaries = [(0,1,Push),(1,2,Mov),(3,2,Jz),(5,2,Pause),(7,5,Call),(12,1,Ret)]
+
+class TestX86DecodeReentrant(VerboseTestCase):
+	def do_test(self,decoder,ea,length,mnem):
+		status,l,d = decoder.DecodeAt(ea)
+		if self.verbose:
+			print "%#x: status %d, length %d, %s" % (ea,status,l,mnem)
+		self.assertEqual((DECODE_OK,length,mnem),(status,l,d.mnem))
+		self.assertEqual(ea,d.ea)
+		return d
+
+	def test00_WindowAt(self):
+		stream = StreamObj(code)
+		stream.SetPos(3)
+		self.assertEqual([0xF3,0x90],stream.WindowAt(5,2))
+		self.assertEqual([0xC3],stream.WindowAt(12,16))
+		self.assertEqual([],stream.WindowAt(13,16))
+		self.assertEqual(0xE8,stream.GetByteAt(7))
+		self.assertEqual(3,stream.Pos())
+		self.assertEqual([0x74,0x10],stream.Window(2))
+		rebased = RebasedStreamObj(code,0x1000)
+		self.assertEqual([0x55,0x8B],rebased.WindowAt(0x1000,2))
+		self.assertEqual([],rebased.WindowAt(0xFFF,2))
+		self.assertRaises(IndexError,rebased.GetByteAt,0xFFF)
+
+	def test01_ScanWindow(self):
+		status,length,ctx = scan_window([0x66,0x2E,0xF3,0x0F,0x10,0xC1])
+		self.assertEqual((DECODE_OK,6),(status,length))
+		self.assertEqual((PFX_OPSIZE|PFX_REP,CS,0x110,5),(ctx.pfx,ctx.segpfx,ctx.stem,ctx.stemlen))
+		self.assertEqual(Movss,ctx.leaf[0])
+		self.assertEqual((DECODE_END_OF_STREAM,2,None),scan_window([0x66,0x67]))
+		status,length,ctx = scan_window([0x0F,0x0B])
+		self.assertEqual((DECODE_OK,None),(status,ctx.segpfx))
+		status,length,ctx = scan_window([0x0F,0xFF])
+		self.assertEqual((DECODE_UNDEFINED,0x1FF,None),(status,ctx.stem,ctx.leaf))
+
+	def test02_NoSideEffects(self):
+		decoder = X86Decoder(StreamObj([0x90]+code))
+		decoder.Decode(0)
+		decoder.Stream.SetPos(1)
+		for ea,length,mnem in reversed(boundaries):
+			self.do_test(decoder,ea+1,length,mnem)
+		self.assertEqual(1,decoder.Stream.Pos())
+		self.assertEqual((0,0,None,False,False),(decoder.pfx,decoder.g1seq,decoder.segpfx,decoder.sizepfx,decoder.addrpfx))
+		self.assertEqual((DECODE_END_OF_STREAM,0,None),decoder.DecodeAt(14))
+
+	def test03_Interleaved(self):
+		decoder = X86Decoder(StreamObj(code))
+		d1 = self.do_test(decoder,7,5,Call)
+		d2 = self.do_test(decoder,3,2,Jz)
+		self.assertEqual(Instruction([],Call,JccTarget(0xC,0xC)),d1.instr)
+		self.assertEqual(0x15,d2.Target())
+		self.assertEqual(Instruction([],Jz,JccTarget(0x15,5)),d2.instr)
+		self.assertEqual(Instruction([],Pause),decoder.Decode(5).instr)
+		self.assertEqual(PFX_REP,decoder.pfx)
+		self.assertEqual(7,decoder.Stream.Pos())
+
+	def test04_Threads(self):
+		decoder = X86Decoder(StreamObj(code*64),X86DecodeCache())
+		expected = map(lambda k: (boundaries[k%6][1],boundaries[k%6][2],JccTarget(k/6*13+0x15,k/6*13+5) if k%6 == 2 else None),xrange(6*64))
+		results = [None]*8
+		def sweep(k):
+			ea,out = 0,[]
+			while True:
+				status,length,d = decoder.DecodeAt(ea)
+				if status != DECODE_OK: break
+				op = d.instr.GetOp(0) if d.mnem == Jz else None
+				out.append((length,d.mnem,op))
+				ea = ea + length
+			results[k] = out
+		threads = map(lambda k: threading.Thread(target=sweep,args=(k,)),xrange(8))
+		for t in threads: t.start()
+		for t in threads: t.join()
+		for out in results:
+			self.assertEqual(expected,out)
+		self.assertEqual(0,decoder.Stream.Pos())
+
+	def test05_GetByteInternal(self):
+		# Streams that override only GetByteInternal, as the baseline documented.
+		class CallbackStreamObj(StreamObj):
+			def __init__(self,get_byte):
+				StreamObj.__init__(self,None)
+				self.get_byte = get_byte
+			def GetByteInternal(self):
+				return self.get_byte(self.pos)
+		decoder = X86Decoder(CallbackStreamObj(lambda ea: code[ea-0x1000]))
+		for ea,length,mnem in boundaries: self.do_test(decoder,0x1000+ea,length,mnem)
+		self.assertEqual(Int3,X86Decoder(CallbackStreamObj(lambda ea: 0xCC)).Decode(0).mnem)
+		self.assertEqual(code[:4],decoder.Stream.WindowAt(0x1000,4))
+		self.assertEqual(0,decoder.Stream.Pos())
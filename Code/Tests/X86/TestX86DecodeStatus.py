@@ -0,0 +1,76 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj
+from Pandemic.X86.X86ModRM import modrm_length
+from Pandemic.X86.X86Decoder import *
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86DecodeStatus(VerboseTestCase):
+	def do_test(self,bytes,status,length):
+		if self.verbose:
+			print "Testing bytes", bytes, "expecting status", status
+		decoder = X86Decoder(StreamObj(bytes))
+		s,l,stem,stemlen,leaf = decoder.ScanWindow(decoder.Stream.Window(16))
+		self.assertEqual((status,length),(s,l),"%s: expected %r, got %r" % (bytes,(status,length),(s,l)))
+		self.assertEqual(0,decoder.Stream.Pos())
+
+	def test00_OK(self):
+		self.do_test([0xF3,0xA4],DECODE_OK,2)
+		self.do_test([0xEB,0xFE,0x90],DECODE_OK,2)
+		self.do_test([0x66]*15+[0x90],DECODE_OK,16)
+		self.do_test([0x8B,0x44,0x24,0x04],DECODE_OK,4)
+		self.do_test([0x67,0x8B,0x06,0x34,0x12],DECODE_OK,5)
+		self.do_test([0x0F,0x71,0xD0,0x04],DECODE_OK,4)
+
+	def test01_Undefined(self):
+		self.do_test([0x0F,0x0B,0x90],DECODE_OK,2)
+		self.do_test([0xFE,0xF8],DECODE_UNDEFINED,2)
+		self.do_test([0x0F,0x0F],DECODE_UNDEFINED,2)
+		self.do_test([0xC5,0xC0],DECODE_UNDEFINED,2)
+		self.do_test([0x0F,0x01,0x00],DECODE_OK,3)
+
+	def test02_BadSegReg(self):
+		self.do_test([0x8C,0xF8],DECODE_BAD_SEGREG,2)
+		self.do_test([0x8E,0x38],DECODE_BAD_SEGREG,2)
+
+	def test03_TooLong(self):
+		self.do_test([0x66]*16+[0x90],DECODE_TOO_LONG,16)
+		self.do_test([0x66]*14+[0x81,0xC0,0x34,0x12],DECODE_TOO_LONG,16)
+		self.do_test([0x66]*12+[0x81,0xC0,0x34,0x12],DECODE_OK,16)
+
+	def test04_EndOfStream(self):
+		self.do_test([],DECODE_END_OF_STREAM,0)
+		self.do_test([0x66,0x67],DECODE_END_OF_STREAM,2)
+		self.do_test([0x0F],DECODE_END_OF_STREAM,1)
+		self.do_test([0x8B],DECODE_END_OF_STREAM,1)
+		self.do_test([0x8B,0x04],DECODE_END_OF_STREAM,2)
+		self.do_test([0xE8,0x00,0x00],DECODE_END_OF_STREAM,3)
+
+	def test05_RaisingWrappers(self):
+		decoder = X86Decoder(StreamObj([0xFE,0xF8,0xE8,0x00]))
+		self.assertRaises(InvalidInstruction,decoder.Decode,0)
+		self.assertRaises(IndexError,decoder.Decode,2)
+
+	def test06_ModRMLength(self):
+		self.assertEqual(1,modrm_length([0xC1],0,False))
+		self.assertEqual(2,modrm_length([0x04,0x24],0,False))
+		self.assertEqual(6,modrm_length([0x04,0x25],0,False))
+		self.assertEqual(3,modrm_length([0x44,0x24],0,False))
+		self.assertEqual(5,modrm_length([0x05],0,False))
+		self.assertEqual(2,modrm_length([0x04],0,False))
+		self.assertEqual(3,modrm_length([0x06],0,True))
+		self.assertEqual(3,modrm_length([0x80],0,True))
+		self.assertEqual(1,modrm_length([0x04],0,True))
+
+	def test07_DecodeStatus(self):
+		decoder = X86Decoder(StreamObj([0x50,0xF3,0x90,0xEB,0xFE,0xFE,0xF8,0xE8]))
+		s,l,d = decoder.DecodeStatus(0)
+		self.assertEqual((DECODE_OK,1,Instruction([],Push,Gd(Eax))),(s,l,d.instr))
+		s,l,d = decoder.DecodeStatus(1)
+		self.assertEqual((DECODE_OK,2,Instruction([],Pause)),(s,l,d.instr))
+		self.assertEqual(3,decoder.Stream.Pos())
+		s,l,d = decoder.DecodeStatus(3)
+		self.assertEqual((DECODE_OK,2,3),(s,l,d.instr.GetOp(0)._taken.value))
+		self.assertEqual((DECODE_UNDEFINED,2,None),decoder.DecodeStatus(5))
+		self.assertEqual(5,decoder.Stream.Pos())
+		self.assertEqual((DECODE_END_OF_STREAM,1,None),decoder.DecodeStatus(7))
@@ -1,7 +1,9 @@
 from Pandemic.X86.X86 import *
 from Pandemic.X86.X86MetaData import *
 from Pandemic.X86.X86ByteStream import StreamObj
-from Pandemic.X86.X86Decoder import X86Decoder
+from Pandemic.X86.X86Decoder import X86Decoder, operand_decoders
+from Pandemic.X86.X86DecodeAutomaton import PFX_OPSIZE, PFX_ADDRSIZE
+from Pandemic.X86.X86InternalOperand import *
 from ..VerboseTestCase import VerboseTestCase
 
 class TestX86Decoder(VerboseTestCase):
@@ -96,4 +98,25 @@ class TestX86Decoder(VerboseTestCase):
 	# AddrPrefix and Immediate_MemExpr operand
 	def test16_AddrPrefix_Immediate_MemExpr(self):
 		self.do_test(Instruction([],Mov,Gb(Al),Mem16(DS,Mb,None,None,0x1234)),[0x67,0xA0,0x34,0x12])
-		self.do_test(Instruction([],Mov,Gb(Al),Mem32(DS,Mb,None,None,0,0x12345678)),[0xA0,0x78,0x56,0x34,0x12])
\ No newline at end of file
+		self.do_test(Instruction([],Mov,Gb(Al),Mem32(DS,Mb,None,None,0,0x12345678)),[0xA0,0x78,0x56,0x34,0x12])
+	# Prebuilt instructions for fixed-operand stems are shared between decodings
+	def test17_Prebuilt(self):
+		self.do_test(Instruction([],Push,Gd(Eax)),[0x50])
+		self.do_test(Instruction([],Lodsb,Mem32(DS,Mb,Esi,None,0,None)),[0xAC])
+		self.do_test(Instruction([],Cld),[0xFC])
+		decoder = X86Decoder(StreamObj([0x41,0x41]))
+		d0,d1 = decoder.Decode(0),decoder.Decode(1)
+		self.assertIs(d0.instr,d1.instr)
+		self.assertEqual((0,1),(d0.ea,d1.ea))
+
+	# The operand decoders resolve the size prefixes in advance
+	def test18_OperandDecoders(self):
+		fn,d = operand_decoders[0][OIz.IntValue()]
+		self.assertEqual((X86Decoder.visit_Immediate_Id.im_func,Id),(fn,d.archetype.__class__))
+		fn,d = operand_decoders[PFX_OPSIZE][OIz.IntValue()]
+		self.assertEqual((X86Decoder.visit_Immediate_Iw.im_func,Iw),(fn,d.archetype.__class__))
+		fn,d = operand_decoders[PFX_OPSIZE|PFX_ADDRSIZE][OEv.IntValue()]
+		self.assertEqual((X86Decoder.visit_RegOrMem.im_func,Mw),(fn,d.mem))
+		fn,d = operand_decoders[PFX_ADDRSIZE][OJz.IntValue()]
+		self.assertEqual(X86Decoder.visit_Immediate_JccTarget.im_func,fn)
+		self.do_test(Instruction([],Jmp,JccTarget(0x12345683,5)),[0xE9,0x7E,0x56,0x34,0x12])
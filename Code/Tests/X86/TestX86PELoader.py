@@ -0,0 +1,112 @@
+import os, struct, tempfile
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86PELoader import *
+from ..VerboseTestCase import VerboseTestCase
+
+base = 0x10000000
+
+def build_image(path,textsize=0x200):
+	"""Write a small DLL to *path*.  Its .text section, at RVA 0x1000, holds
+	two functions; its .rdata section, at RVA 0x2000, holds an export 
+	directory naming them (and forwarding a third), and an import directory 
+	for two functions of KERNEL32.dll, one by name and one by ordinal."""
+	# .text:  f1 calls through the IAT; f2, after a NOP of padding, jumps to f1.
+	text = [0x55,0x8B,0xEC,0xFF,0x15] + list(bytearray(struct.pack("<L",base+0x2100))) + [0x5D,0xC3]
+	text = text + [0x90]
+	text = text + [0xEB,0x100-len(text)-2]
+	text = text + [0xCC]*(textsize-len(text))
+
+	# .rdata:  export directory at 0x2000, import directory at 0x2080, IAT at 
+	# 0x2100, lookup table at 0x2110, names from 0x2140.
+	rdata = bytearray(0x200)
+	def put(rva,s): rdata[rva-0x2000:rva-0x2000+len(s)] = s
+	put(0x2000,struct.pack("<LLHHLLLLLLL",0,0,0,0,0x2140,1,3,2,0x2030,0x2040,0x2048))
+	put(0x2030,struct.pack("<LLL",0x1000,0x100C,0x2060))
+	put(0x2040,struct.pack("<LL",0x2160,0x2168))
+	put(0x2048,struct.pack("<HH",0,1))
+	put(0x2080,struct.pack("<LLLLL",0x2110,0,0,0x2170,0x2100))
+	put(0x2100,struct.pack("<LLL",0x2180,0x80000007,0))
+	put(0x2110,struct.pack("<LLL",0x2180,0x80000007,0))
+	put(0x2140,"test.dll\0")
+	put(0x2060,"OTHER.fwd\0")
+	put(0x2160,"One\0")
+	put(0x2168,"Two\0")
+	put(0x2170,"KERNEL32.dll\0")
+	put(0x2180,"\0\0ExitProcess\0")
+
+	opt = struct.pack("<HBBLLLLLLLLLHHHHHHLLLLHHLLLLLL",
+		0x10B,0,0,textsize,0x200,0,0x100C,0x1000,0x2000,base,0x1000,0x200,
+		4,0,0,0,4,0,0,0x3000,0x200,0,2,0,0x100000,0x1000,0x100000,0x1000,0,16)
+	dirs = [(0x2000,0x80),(0x2080,0x28)] + [(0,0)]*14
+	opt = opt + "".join(map(lambda d: struct.pack("<LL",*d),dirs))
+	coff = struct.pack("<HHLLLHH",0x14C,2,0,0,0,len(opt),0x2102)
+	sections = struct.pack("<8sLLLLLLHHL",".text",0x10,0x1000,textsize,0x200,0,0,0,0,0x60000020)
+	sections = sections + struct.pack("<8sLLLLLLHHL",".rdata",0x200,0x2000,0x200,0x200+textsize,0,0,0,0,0x40000040)
+	headers = "MZ" + "\0"*0x3A + struct.pack("<L",0x40) + "PE\0\0" + coff + opt + sections
+	headers = headers + "\0"*(0x200-len(headers))
+	with open(path,"wb") as f:
+		f.write(headers + str(bytearray(text)) + str(rdata))
+
+class TestX86PELoader(VerboseTestCase):
+	def setUp(self):
+		fd,self.path = tempfile.mkstemp(".dll")
+		os.close(fd)
+		build_image(self.path)
+		self.image = X86PEImage(self.path)
+
+	def tearDown(self):
+		self.image.Close()
+		os.remove(self.path)
+
+	def test00_Headers(self):
+		image = self.image
+		self.assertEqual((base,base+0x100C,0x3000),(image.base,image.entry,image.size))
+		self.assertEqual([".text",".rdata"],map(lambda s: s.name,image.sections))
+		self.assertEqual([base+0x1000,base+0x2000],map(lambda s: s.ea,image.sections))
+		self.assertEqual([True,False],map(lambda s: s.IsCode(),image.sections))
+		self.assertEqual(image.sections[0],image.Section(base+0x100F))
+		self.assertEqual(None,image.Section(base+0x3000))
+
+	def test01_Stream(self):
+		# The headers and sections are mapped at their virtual addresses; the
+		# .text section's virtual size is smaller than its raw size, but rounds
+		# up to the section alignment.
+		s = self.image.Stream
+		self.assertEqual([base,base+0x1000,base+0x2000],s.starts)
+		self.assertEqual(map(ord,"MZ"),s.WindowAt(base,2))
+		self.assertEqual([0x55,0x8B,0xEC],s.WindowAt(base+0x1000,3))
+		self.assertEqual([0xCC],s.WindowAt(base+0x11FF,16))
+		self.assertEqual([],s.WindowAt(base+0x1200,16))
+		self.assertEqual([],s.WindowAt(base+0x3000,16))
+		self.assertTrue(isinstance(s.regions[1].bytes,buffer))
+
+	def test02_Directories(self):
+		image = self.image
+		self.assertEqual([(1,"One",base+0x1000),(2,"Two",base+0x100C)],image.exports)
+		self.assertEqual([(base+0x2100,"KERNEL32.dll","ExitProcess"),(base+0x2104,"KERNEL32.dll",7)],image.imports)
+		self.assertEqual([base+0x1000,base+0x100C],image.StartPoints())
+		symbols = image.Symbols()
+		self.assertEqual("One",symbols[base+0x1000])
+		self.assertEqual("Two",symbols[base+0x100C])
+		self.assertEqual("KERNEL32.dll!ExitProcess",symbols[base+0x2100])
+		self.assertEqual("KERNEL32.dll!ordinal_7",symbols[base+0x2104])
+
+	def test03_Decode(self):
+		image = self.image
+		decoder = X86Decoder(image.Stream)
+		l = list(decoder.DecodeRange(image.StartPoints()[0],base+0x100E,INVALID_STOP))
+		self.assertEqual([Push,Mov,Call,Pop,Ret,Nop,Jmp],map(lambda d: d.mnem,l))
+		self.assertEqual(base+0x1000,l[-1].Target())
+		self.assertEqual(DECODE_END_OF_STREAM,decoder.DecodeStatus(base+0x1200)[0])
+
+	def test04_Errors(self):
+		fd,path = tempfile.mkstemp()
+		try:
+			os.write(fd,"MZ" + "\0"*0x3E)
+			os.close(fd)
+			self.assertRaises(PEFormatError,X86PEImage,path)
+			with open(path,"wb") as f: f.write(open(self.path,"rb").read()[:0x100])
+			self.assertRaises(PEFormatError,X86PEImage,path)
+		finally:
+			os.remove(path)
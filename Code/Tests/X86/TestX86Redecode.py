@@ -0,0 +1,64 @@
+import random, unittest
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import WritableStreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86DecodeCache import X86AddressCache
+from Pandemic.X86.X86Redecode import *
+from ..VerboseTestCase import VerboseTestCase
+
+def summary(l):
+	return map(lambda d: (d.ea,d.length,None if isinstance(d,X86DecodedData) else d.mnem),l)
+
+class TestX86Redecode(VerboseTestCase):
+	def do_test(self,bytes,patches,invalid=INVALID_SKIP,start=0,end=None):
+		if end is None: end = len(bytes)
+		stream = WritableStreamObj(list(bytes))
+		decoder = X86Decoder(stream,eacache=X86AddressCache(stream))
+		old = list(decoder.DecodeRange(start,end,invalid))
+		for ea,p in patches: stream.Write(ea,p)
+		diff = redecode_range(decoder,old,start,end,map(lambda (ea,p): (ea,ea+len(p)),patches),invalid)
+		new = diff.Apply(old)
+		fresh = list(X86Decoder(WritableStreamObj(stream.bytes)).DecodeRange(start,end,invalid))
+		if self.verbose:
+			for i,j,added in diff.hunks: print i,j,summary(added)
+		self.assertEqual(summary(fresh),summary(new))
+		return diff,old
+
+	def test00_Ranges(self):
+		self.assertEqual([(1,5),(7,9)],merge_ranges([(7,8),(3,5),(1,3),(8,9),(4,4)]))
+		old = X86Decoder(WritableStreamObj([0x90,0x55,0x8B,0xEC,0xC3])).DecodeRange(0,5)
+		old = list(old)
+		self.assertEqual([0,0,1,2,2,3],map(lambda ea: first_ending_after(old,ea),[-20,0,1,2,3,4]))
+		self.assertEqual(4,first_ending_after(old,5))
+
+	def test01_Lengthen(self):
+		# Forty NOPs, five of which become a call.
+		diff,old = self.do_test([0x90]*40,[(20,[0xE8,0,0,0,0])])
+		self.assertEqual(1,len(diff.hunks))
+		self.assertEqual(summary(old[20:25]),summary(diff.Removed(old)))
+		self.assertEqual([(20,5,Call)],summary(diff.Added()))
+
+	def test02_Resync(self):
+		# A prefix changes the boundaries until the old and new sweeps meet.
+		bytes = [0x90,0x55,0x8B,0xEC,0x74,0x10,0x90,0x90,0xC3]*4
+		self.do_test(bytes,[(3,[0xE8])])
+		self.do_test(bytes,[(0,[0x0F]),(30,[0x66,0x66])])
+		self.do_test(bytes,[(35,[0xE8])],INVALID_DATA,2,33)
+
+	def test03_Invalid(self):
+		# mov reg, sreg with an undefined segment register.
+		bytes = [0x90]*20
+		for invalid in [INVALID_SKIP,INVALID_DATA,INVALID_STOP]:
+			diff,old = self.do_test(bytes,[(8,[0x8C,0xF8])],invalid)
+			self.assertNotEqual([],diff.hunks)
+
+	def test04_Random(self):
+		r = random.Random(17)
+		choices = [0x90,0x55,0xC3,0x0F,0x66,0x8B,0xE8,0x74,0x8C,0xF3]
+		for n in xrange(200):
+			bytes = map(lambda i: r.choice(choices+[r.randrange(256)]),xrange(r.randrange(20,100)))
+			patches = []
+			for k in xrange(r.randrange(1,4)):
+				ea = r.randrange(len(bytes)-5)
+				patches.append((ea,map(lambda i: r.choice(choices),xrange(r.randrange(1,6)))))
+			self.do_test(bytes,patches,r.choice([INVALID_SKIP,INVALID_DATA,INVALID_STOP]))
@@ -0,0 +1,77 @@
+import unittest
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import StreamObj
+from Pandemic.X86.X86Decoder import *
+from Pandemic.X86.X86Resync import *
+from ..VerboseTestCase import VerboseTestCase
+
+# Five bytes of data, beginning with an undefined instruction, and then a 
+# function:  push ebp / mov ebp, esp / jz +2 / nop / nop / pop ebp / ret.
+data = [0x0F,0xFF,0x05,0x11,0x22]
+code = [0x55,0x8B,0xEC,0x74,0x02,0x90,0x90,0x5D,0xC3]
+
+def summary(l):
+	return map(lambda d: (d.ea,d.length,None if isinstance(d,X86DecodedData) else d.mnem),l)
+
+class TestX86Resync(VerboseTestCase):
+	def sweep(self,bytes,invalid=INVALID_SKIP,resync=None):
+		return summary(X86Decoder(StreamObj(bytes)).DecodeRange(0,len(bytes),invalid,resync))
+
+	def test00_Sweep(self):
+		# Skipping one byte decodes 0xFF 0x05 as an inc that swallows the push.
+		bytes = data+code
+		expected = [(5,1,Push),(6,2,Mov),(8,2,Jz),(10,1,Nop),(11,1,Nop),(12,1,Pop),(13,1,Ret)]
+		plain = self.sweep(bytes)
+		self.assertEqual((1,6,Inc),plain[0])
+		self.assertFalse((5,1,Push) in plain)
+		found = self.sweep(bytes,resync=X86Resync())
+		if self.verbose: print found
+		self.assertEqual(expected,filter(lambda e: e[0] >= 5,found))
+		self.assertTrue(all(map(lambda e: e[0] >= 3,found)))
+
+	def test01_Statistics(self):
+		r = X86Resync(window=8,depth=4)
+		list(X86Decoder(StreamObj(data+code)).DecodeRange(0,14,INVALID_SKIP,r))
+		self.assertEqual(1,r.resyncs)
+		self.assertEqual(8,r.candidates)
+		ea,nxt,score,converged = r.events[0]
+		self.assertEqual(0,ea)
+		self.assertEqual(nxt,r.skipped)
+		self.assertEqual(converged,r.converged)
+		self.assertTrue(converged > 0)
+		# Decodes are shared between the chains, so there are fewer than one
+		# per candidate per instruction.
+		self.assertTrue(r.decodes < r.candidates*r.depth)
+		r.Clear()
+		self.assertEqual((0,0,0,[]),(r.resyncs,r.skipped,r.candidates,r.events))
+
+	def test02_Data(self):
+		# Every byte is covered, once, by an instruction or a data element.
+		bytes = data+code+data+code
+		found = self.sweep(bytes,INVALID_DATA,X86Resync())
+		ea = 0
+		for e,l,m in found:
+			self.assertEqual(ea,e)
+			ea = ea + l
+		self.assertEqual(len(bytes),ea)
+		self.assertTrue((19,1,Push) in found)
+
+	def test03_Scoring(self):
+		r,memo = X86Resync(),{}
+		stream = StreamObj(code)
+		score,boundaries = r.Chain(stream,0,len(code),memo)
+		self.assertEqual([0,1,3,5,6,7,8],boundaries)
+		# Seven instructions, and a branch that lands on a boundary.
+		self.assertEqual(9,score)
+		# in al, dx is implausible.
+		self.assertEqual(-2,r.Chain(StreamObj([0xEC]),0,1,{})[0])
+		# An undefined instruction ends the chain.
+		score,boundaries = r.Chain(StreamObj([0x90,0x0F,0xFF]),0,3,{})
+		self.assertEqual(([0],1-2*r.depth),(boundaries,score))
+
+	def test04_End(self):
+		# The only candidate runs off the end of the stream, which ends the sweep.
+		r = X86Resync()
+		self.assertEqual([(0,1,Nop)],self.sweep([0x90,0x0F,0xFF],resync=r))
+		self.assertEqual([(1,2,-2*r.depth,0)],r.events)
+		self.assertEqual(self.sweep(data+code),self.sweep(data+code,resync=None))
@@ -0,0 +1,58 @@
+import random
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import StreamObj, SegmentedStreamObj
+from Pandemic.X86.X86Decoder import *
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86SegmentedStream(VerboseTestCase):
+	def test00_Regions(self):
+		s = SegmentedStreamObj([(0x402000,"\x90\xC3"),(0x401000,[0x55,0x8B,0xEC])])
+		self.assertEqual([0x401000,0x402000],s.starts)
+		self.assertEqual(0x8B,s.GetByteAt(0x401001))
+		self.assertEqual(0xC3,s.GetByteAt(0x402001))
+		for ea in [0,0x400FFF,0x401003,0x402002]:
+			self.assertRaises(IndexError,s.GetByteAt,ea)
+		self.assertEqual([0xEC],s.WindowAt(0x401002,16))
+		self.assertEqual([],s.WindowAt(0x401003,16))
+		self.assertRaises(ValueError,s.AddRegion,0x401002,[0])
+		self.assertRaises(ValueError,s.AddRegion,0x400FFF,[0,0])
+		self.assertRaises(ValueError,s.AddRegion,0x401FFF,[0,0])
+		s.AddRegion(0x401003,[0x90])
+		self.assertEqual([0xEC,0x90],s.WindowAt(0x401002,16))
+
+	def test01_Reads(self):
+		# Words and dwords within a region, across abutting regions, and past 
+		# the end of a region.
+		s = SegmentedStreamObj([(0x1000,[1,2,3]),(0x1003,bytearray([4,5,6])),(0x2000,[7,8])])
+		s.SetPos(0x1000)
+		self.assertEqual((0x0201,0x06050403),(s.Word(),s.Dword()))
+		s.SetPos(0x1002)
+		self.assertEqual(0x06050403,s.Dword())
+		s.SetPos(0x1004)
+		self.assertRaises(IndexError,s.Dword)
+		s.SetPos(0x2000)
+		self.assertEqual((7,8),(s.Byte(),s.Byte()))
+		self.assertRaises(IndexError,s.Byte)
+
+	def test02_Decode(self):
+		# Instructions are decoded at their virtual addresses, and decoding 
+		# fails cleanly between the regions.
+		s = SegmentedStreamObj([(0x401000,[0xE8,0xFB,0x0F,0x00,0x00,0xC3]),(0x402000,[0x90,0xC3])])
+		decoder = X86Decoder(s)
+		d = decoder.Decode(0x401000)
+		self.assertEqual((Call,0x402000),(d.mnem,d.Target()))
+		self.assertEqual([(0x402000,Nop),(0x402001,Ret)],map(lambda d: (d.ea,d.mnem),decoder.DecodeRange(0x402000,0x402002)))
+		self.assertEqual(DECODE_END_OF_STREAM,decoder.DecodeStatus(0x401006)[0])
+		s.AddRegion(0x403000,[0xE8,0x00])
+		self.assertEqual(DECODE_END_OF_STREAM,decoder.DecodeStatus(0x403000)[0])
+		self.assertRaises(IndexError,decoder.Decode,0x300000)
+		self.assertEqual([(0x401000,Call),(0x401005,Ret)],map(lambda d: (d.ea,d.mnem),decoder.DecodeRange(0x401000,0x402002)))
+
+	def test03_Random(self):
+		# Splitting a stream into abutting regions changes nothing.
+		rng = random.Random(23)
+		l = [rng.randrange(256) for i in xrange(10000)]
+		cuts = sorted(rng.sample(xrange(1,len(l)),200))
+		s = SegmentedStreamObj(map(lambda (a,b): (a,l[a:b]),zip([0]+cuts,cuts+[len(l)])))
+		summary = lambda s: map(lambda d: (d.ea,d.bytes),X86Decoder(s).DecodeRange(0,len(l)))
+		self.assertEqual(summary(StreamObj(l)),summary(s))
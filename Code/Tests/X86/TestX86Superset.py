@@ -0,0 +1,51 @@
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86MetaData import *
+from Pandemic.X86.X86ByteStream import StreamObj
+from Pandemic.X86.X86Decoder import X86Decoder
+from Pandemic.X86.X86Superset import *
+from ..VerboseTestCase import VerboseTestCase
+
+class TestX86Superset(VerboseTestCase):
+	# 0: mov eax,0x90909090 / 5: jz 0 (6: stc) / 7: (invalid: FE /7) / 9: ret
+	bytes = [0xB8,0x90,0x90,0x90,0x90,0x74,0xF9,0xFE,0xF8,0xC3]
+
+	def setUp(self):
+		self.s = X86Superset(X86Decoder(StreamObj(self.bytes)),0,len(self.bytes))
+		if self.verbose:
+			for i in xrange(self.s.size): print i,self.s.length[i],self.s.Mnem(i)
+
+	def test00_Arrays(self):
+		s = self.s
+		self.assertEqual([5,1,1,1,1,2,1,0,1,1],list(s.length))
+		self.assertEqual([Mov,Nop,Nop,Nop,Nop,Jz,Stc,None,Clc,Ret],map(s.Mnem,xrange(s.size)))
+		self.assertEqual([5,2,3,4,5,SUPERSET_NONE,SUPERSET_NONE,SUPERSET_NONE,9,SUPERSET_NONE],list(s.next))
+		self.assertEqual(0,s.target[5])
+		self.assertEqual(SUPERSET_NONE,s.target[0])
+
+	def test01_Chains(self):
+		s = self.s
+		self.assertEqual([1,2,3,4,5],list(s.Chain(1)))
+		self.assertEqual([6],list(s.Chain(6)))
+		self.assertEqual([],list(s.Chain(7)))
+		self.assertEqual(5,s.ChainEnd(2))
+		self.assertEqual(5,s.ChainEnd(0))
+		self.assertEqual(9,s.ChainEnd(8))
+		self.assertEqual(SUPERSET_NONE,s.ChainEnd(7))
+		self.assertEqual([5,SUPERSET_NONE,5,5,5,5],list(s._chainend[:6]))
+
+	def test02_Overlaps(self):
+		s = self.s
+		self.assertEqual([1,2,3,4],s.Overlaps(0))
+		self.assertEqual([0],s.Overlaps(3))
+		self.assertEqual([6],s.Overlaps(5))
+		self.assertEqual([],s.Overlaps(7))
+
+	def test03_Predecessors(self):
+		s = self.s
+		self.assertEqual([5],s.Predecessors(0))
+		self.assertEqual([0,4],s.Predecessors(5))
+		self.assertEqual([8],s.Predecessors(9))
+
+	def test04_EndOfStream(self):
+		s = X86Superset(X86Decoder(StreamObj([0x90,0xE8,0x00])),0,4)
+		self.assertEqual([1,0,0,0],list(s.length))
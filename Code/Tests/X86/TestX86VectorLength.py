@@ -0,0 +1,55 @@
+import random
+import unittest
+from Pandemic.X86.X86 import *
+from Pandemic.X86.X86ByteStream import StreamObj
+from Pandemic.X86.X86Decoder import X86Decoder
+from Pandemic.X86.X86VectorLength import numpy, vector_lengths
+from ..VerboseTestCase import VerboseTestCase
+
+@unittest.skipIf(numpy is None,"NumPy is not installed")
+class TestX86VectorLength(VerboseTestCase):
+	def cross_check(self,bytes):
+		lengths = vector_lengths(bytes)
+		decoder = X86Decoder(StreamObj(bytes))
+		self.assertEqual(len(bytes),len(lengths))
+		for i in xrange(len(bytes)):
+			try:
+				length = decoder.Decode(i).length
+			except (InvalidInstruction,IndexError):
+				length = 0
+			if self.verbose and length != lengths[i]:
+				print "%#x: %s" % (i,map(hex,bytes[i:i+16]))
+			self.assertEqual(length,lengths[i],"offset %#x: expected %d, got %d" % (i,length,lengths[i]))
+
+	def test00_Simple(self):
+		self.assertEqual([1,0],list(vector_lengths([0x90,0xE8])))
+		self.assertEqual([7,2],list(vector_lengths([0x8B,0x04,0x85,0x00,0x10,0x40,0x00])[:2]))
+		self.assertEqual([2,1],list(vector_lengths("\xF3\x90")))
+		self.assertEqual(0,len(vector_lengths([])))
+
+	def test01_Prefixes(self):
+		self.assertEqual(16,vector_lengths([0x66]*15+[0x90])[0])
+		self.assertEqual(0,vector_lengths([0x66]*16+[0x90])[0])
+		self.assertEqual(5,vector_lengths([0x66,0x81,0xC0,0x34,0x12])[0])
+		self.assertEqual(4,vector_lengths([0x67,0xA1,0x34,0x12])[0])
+		self.assertEqual(5,vector_lengths([0x66,0x0F,0x71,0xD0,0x04])[0])
+
+	def test02_Invalid(self):
+		self.assertEqual(0,vector_lengths([0x8C,0xF8])[0])
+		self.assertEqual(0,vector_lengths([0xC5,0xC0])[0])
+		self.assertEqual(0,vector_lengths([0x0F,0x0F])[0])
+		self.assertEqual(0,vector_lengths([0xFE,0xF8])[0])
+
+	def test03_CrossCheckRandom(self):
+		r = random.Random(12)
+		bytes = []
+		for i in xrange(2000):
+			bytes += map(lambda j: r.choice([0x0F,0x66,0x67,0xF2,0xF3,0x8B,0xC7]),xrange(r.randint(0,2)))
+			bytes += map(lambda j: r.randint(0,255),xrange(r.randint(1,6)))
+		self.cross_check(bytes)
+
+	def test04_CrossCheckStems(self):
+		bytes = []
+		for stem in xrange(0x100):
+			bytes += [0x0F,stem,0x44,0x24,0x08,0x11,0x22,0x33,0x44,0xC1,0x55,stem,0x84,0x25,0x11]
+		self.cross_check(bytes)